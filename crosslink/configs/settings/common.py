@@ -14,6 +14,8 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
+from celery.schedules import crontab
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -142,5 +144,16 @@ SIMPLE_JWT = {
 
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER", "redis://redis:6379")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_BACKEND", "redis://redis:6379")
+CELERY_BEAT_SCHEDULE = {
+    # Before the merchants open their dashboard in the morning.
+    "warm-dashboards": {"task": "home.tasks.dashboard.warm_dashboards", "schedule": crontab(hour=4, minute=0)},
+    # Months ahead, so that events never land in the default partition.
+    "create-event-partitions": {
+        "task": "home.tasks.partitions.create_event_partitions",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    # Activity rollup deltas buffered in write-behind mode.
+    "flush-activity-rollups": {"task": "home.tasks.activity.flush_activity_rollups", "schedule": crontab()},
+}
 
 ELASTICSEARCH_DSL = {"default": {"hosts": os.environ.get("ELASTICSEARCH_HOST", "http://elasticsearch:9200")}}
@@ -10,6 +10,8 @@ class HomeConfig(AppConfig):
 
     def ready(self):
         # Import Elasticsearch documents so they get registered on startup.
+        # Keep the denormalized cross sell indexes in sync with widget writes.
+        from home import signals as home_signals  # noqa: F401
         from home.search import documents, signals  # noqa: F401
 
     # --- General ---
@@ -25,8 +27,28 @@ class HomeConfig(AppConfig):
     # --- AWS ---
     AWS_REGION = os.environ.get("AWS_REGION")
     S3_BUCKET_NAME = os.environ.get("S3_BUCKET_NAME")
+    # Endpoint of an S3 compatible store such as MinIO, AWS by default.
+    S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
     S3_UPLOAD_ATTACHMENT_PRESIGNED_URL_EXPIRY = timedelta(seconds=120)
 
+    # --- Cross sell ---
+    # Push cross sell impressions to a Redis stream drained by `drain_buffer cross_sell_impressions`
+    # instead of writing them while the widget request waits.
+    CROSS_SELL_IMPRESSION_WRITE_BEHIND = os.environ.get("CROSS_SELL_IMPRESSION_WRITE_BEHIND", "false").lower() == "true"
+    # Lifetime of the recommendations of a widget shell, in the Redis cache and in the CDN.
+    CROSS_SELL_SHELL_TTL = int(os.environ.get("CROSS_SELL_SHELL_TTL", 60))
+
+    # --- Upsell ---
+    # Push upsell conversions to a Redis stream drained by `drain_buffer upsell_conversions`
+    # instead of queueing a Celery task per conversion.
+    UPSELL_CONVERSION_WRITE_BEHIND = os.environ.get("UPSELL_CONVERSION_WRITE_BEHIND", "false").lower() == "true"
+
+    # --- Dashboard ---
+    # Add the activity rollup deltas to a Redis hash written every `ACTIVITY_ROLLUP_FLUSH_INTERVAL` seconds
+    # instead of upserting the rollup rows of today on every event.
+    ACTIVITY_ROLLUP_WRITE_BEHIND = os.environ.get("ACTIVITY_ROLLUP_WRITE_BEHIND", "false").lower() == "true"
+    ACTIVITY_ROLLUP_FLUSH_INTERVAL = int(os.environ.get("ACTIVITY_ROLLUP_FLUSH_INTERVAL", 10))
+
     # --- Redis ---
     REDIS_HOST = os.environ.get("REDIS_HOST", "redis")
     REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
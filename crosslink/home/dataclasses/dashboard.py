@@ -25,6 +25,11 @@ class ShopActivity:
         upsell: Dict[str, Decimal]
         cross_sell: Dict[str, Decimal]
 
+    @dataclass
+    class SectionDailyRate:
+        upsell: Dict[str, float]
+        cross_sell: Dict[str, float]
+
     impressions: SectionCount
     clicks: SectionCount
     total_sales: SectionCount
@@ -35,5 +40,5 @@ class ShopActivity:
     daily_clicks: SectionDailyCount
     daily_total_sales: SectionDailyCount
     daily_sales: SectionDailyValue
-    daily_ctrs: SectionDailyValue
-    daily_crs: SectionDailyValue
+    daily_ctrs: SectionDailyRate
+    daily_crs: SectionDailyRate
@@ -0,0 +1,2 @@
+from home.extensions.redis.client import redis_client
+from home.extensions.redis.stream import RedisStreamBuffer
@@ -0,0 +1,10 @@
+import redis
+from django.apps import apps
+
+redis_client = redis.StrictRedis(
+    host=apps.get_app_config("home").REDIS_HOST,
+    port=apps.get_app_config("home").REDIS_PORT,
+    db=apps.get_app_config("home").REDIS_DB,
+    password=apps.get_app_config("home").REDIS_PASSWORD,
+    decode_responses=True,
+)
@@ -0,0 +1,177 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+
+from home.extensions.redis.client import redis_client
+from redis import ResponseError
+
+logger = logging.getLogger(__file__)
+
+# Failed deliveries of a message after which it is moved to the dead letter stream.
+MAX_DELIVERIES = 5
+# Milliseconds after which the pending messages of another consumer are claimed, the time for a live
+# consumer to save a batch.
+CLAIM_MIN_IDLE_TIME = 5 * 60 * 1000
+
+Message = Tuple[str, Dict]
+
+
+class RedisStreamBuffer(ABC):
+    """
+    Write-behind buffer backed by a Redis stream and drained by a consumer group.
+    Subclasses define the stream, the group, the message field and how a batch is saved.
+    """
+
+    STREAM_KEY: str
+    STREAM_GROUP: str
+    MESSAGE_FIELD: str
+
+    @classmethod
+    def add(cls, payload: Dict) -> None:
+        redis_client.xadd(cls.STREAM_KEY, {cls.MESSAGE_FIELD: json.dumps(payload)})
+
+    @classmethod
+    @abstractmethod
+    def save_batch(cls, payloads: List[Dict]) -> int:
+        """
+        Save a batch of payloads, idempotently since batches are retried.
+        Return the number of saved payloads.
+        """
+
+    @classmethod
+    def create_group(cls) -> None:
+        try:
+            redis_client.xgroup_create(cls.STREAM_KEY, cls.STREAM_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    @classmethod
+    def dead_letter_key(cls) -> str:
+        return f"{cls.STREAM_KEY}:dead"
+
+    @classmethod
+    def read(cls, consumer: str, batch_size: int, last_id: str, block: int | None = None) -> List[Message]:
+        streams = redis_client.xreadgroup(
+            cls.STREAM_GROUP, consumer, {cls.STREAM_KEY: last_id}, count=batch_size, block=block
+        )
+        return [message for _, stream_messages in streams for message in stream_messages]
+
+    @classmethod
+    def acknowledge(cls, message_ids: List[str]) -> None:
+        if not message_ids:
+            return
+
+        pipeline = redis_client.pipeline()
+        pipeline.xack(cls.STREAM_KEY, cls.STREAM_GROUP, *message_ids)
+        pipeline.xdel(cls.STREAM_KEY, *message_ids)
+        pipeline.execute()
+
+    @classmethod
+    def dead_letter(cls, messages: List[Message]) -> None:
+        """
+        Move messages that could not be saved to the dead letter stream, for inspection.
+        """
+        logger.error(f"Moving {len(messages)} messages of {cls.STREAM_KEY} to {cls.dead_letter_key()}")
+        pipeline = redis_client.pipeline()
+        for message_id, fields in messages:
+            pipeline.xadd(cls.dead_letter_key(), fields | {"message_id": message_id})
+        pipeline.xack(cls.STREAM_KEY, cls.STREAM_GROUP, *[message_id for message_id, _ in messages])
+        pipeline.xdel(cls.STREAM_KEY, *[message_id for message_id, _ in messages])
+        pipeline.execute()
+
+    @classmethod
+    def save(cls, messages: List[Message]) -> int:
+        """
+        Save and acknowledge messages in one batch. When the batch fails, the messages are saved one
+        by one so that a bad message does not hold the others, the failing ones stay pending.
+        Return the number of saved messages.
+        """
+        try:
+            cls.save_batch([json.loads(fields[cls.MESSAGE_FIELD]) for _, fields in messages])
+            cls.acknowledge([message_id for message_id, _ in messages])
+            return len(messages)
+        except Exception as e:
+            logger.exception(f"Could not save a batch of {cls.STREAM_KEY}, saving its messages one by one: {e}")
+
+        saved_message_ids = []
+        for message_id, fields in messages:
+            try:
+                cls.save_batch([json.loads(fields[cls.MESSAGE_FIELD])])
+                saved_message_ids.append(message_id)
+            except Exception as e:
+                logger.exception(f"Could not save message {message_id} of {cls.STREAM_KEY}, left pending: {e}")
+        cls.acknowledge(saved_message_ids)
+        return len(saved_message_ids)
+
+    @classmethod
+    def drain(cls, consumer: str, batch_size: int, block: int | None = None) -> int:
+        """
+        Read a batch of new messages, save them and acknowledge them.
+        Return the number of read messages.
+        """
+        messages = cls.read(consumer, batch_size, ">", block=block)
+        if messages:
+            cls.save(messages)
+        return len(messages)
+
+    @classmethod
+    def claim_idle(cls, consumer: str, batch_size: int, min_idle_time: int = CLAIM_MIN_IDLE_TIME) -> int:
+        """
+        Move to `consumer` the pending messages that other consumers left unacknowledged for `min_idle_time`
+        milliseconds: a drainer that crashed or whose pod was replaced never comes back for them.
+        Return the number of claimed messages.
+        """
+        claimed, min_id = 0, "-"
+        while entries := redis_client.xpending_range(
+            cls.STREAM_KEY, cls.STREAM_GROUP, min=min_id, max="+", count=batch_size, idle=min_idle_time
+        ):
+            message_ids = [entry["message_id"] for entry in entries if entry["consumer"] != consumer]
+            if message_ids:
+                # Claimed without their fields so that the claim does not count as a delivery.
+                claimed += len(
+                    redis_client.xclaim(
+                        cls.STREAM_KEY, cls.STREAM_GROUP, consumer, min_idle_time, message_ids, justid=True
+                    )
+                )
+            min_id = f"({entries[-1]['message_id']}"
+        if claimed:
+            logger.warning(f"{consumer} claimed {claimed} idle pending messages of {cls.STREAM_KEY}")
+        return claimed
+
+    @classmethod
+    def drain_pending(cls, consumer: str, batch_size: int, min_idle_time: int = CLAIM_MIN_IDLE_TIME) -> int:
+        """
+        Retry once the messages that `consumer` read but did not acknowledge, along with the idle ones
+        it claims from other consumers. Messages that already failed `MAX_DELIVERIES` times are moved
+        to the dead letter stream instead.
+        Return the number of retried messages.
+        """
+        cls.claim_idle(consumer, batch_size, min_idle_time)
+
+        retried, last_id = 0, "0"
+        while messages := cls.read(consumer, batch_size, last_id):
+            last_id = messages[-1][0]
+            deliveries = {
+                entry["message_id"]: entry["times_delivered"]
+                for entry in redis_client.xpending_range(
+                    cls.STREAM_KEY,
+                    cls.STREAM_GROUP,
+                    min=messages[0][0],
+                    max=last_id,
+                    count=len(messages),
+                    consumername=consumer,
+                )
+            }
+            # Messages deleted from the stream while pending are read without their fields.
+            cls.acknowledge([message_id for message_id, fields in messages if not fields])
+            messages = [(message_id, fields) for message_id, fields in messages if fields]
+            dead_messages = [message for message in messages if deliveries.get(message[0], 0) > MAX_DELIVERIES]
+            if dead_messages:
+                cls.dead_letter(dead_messages)
+            retried_messages = [message for message in messages if message not in dead_messages]
+            if retried_messages:
+                cls.save(retried_messages)
+            retried += len(retried_messages)
+        return retried
@@ -1,6 +1,6 @@
 from datetime import timedelta
 from pathlib import PurePosixPath
-from typing import Dict, Optional
+from typing import BinaryIO, Dict, Optional
 
 import boto3
 import botocore
@@ -27,6 +27,7 @@ class S3Client:
             S3_RESSOURCE_NAME,
             region_name=aws_region or apps.get_app_config("home").AWS_REGION,
             config=Config(signature_version="s3v4"),
+            endpoint_url=apps.get_app_config("home").S3_ENDPOINT_URL,
         )
         self.bucket_name = bucket_name or apps.get_app_config("home").S3_BUCKET_NAME
 
@@ -42,6 +43,9 @@ class S3Client:
         key = S3Client.posix_path_to_key(filepath)
         return self.client.delete_object(Bucket=self.bucket_name, Key=key)
 
+    def upload_fileobj(self, fileobj: BinaryIO, filepath: PurePosixPath):
+        return self.client.upload_fileobj(fileobj, self.bucket_name, S3Client.posix_path_to_key(filepath))
+
     def generate_upload_presigned_url(self, filepath: PurePosixPath, expiry: timedelta) -> Dict:
         key = S3Client.posix_path_to_key(filepath)
         return self.client.generate_presigned_post(
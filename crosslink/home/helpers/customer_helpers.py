@@ -0,0 +1,35 @@
+import hashlib
+from typing import Dict
+
+
+def hash_identity(identity: str) -> str:
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def customer_email_key(email: str | None) -> str | None:
+    """
+    Hashed identity key of a customer from the normalized email.
+    """
+    if not email or not email.strip():
+        return None
+    return hash_identity(f"email:{email.strip().lower()}")
+
+
+def customer_name_key(first_name: str | None, last_name: str | None) -> str | None:
+    """
+    Hashed identity key of a customer from the normalized first and last names, when both are known.
+    """
+    if not first_name or not last_name or not first_name.strip() or not last_name.strip():
+        return None
+    return hash_identity(f"name:{' '.join(f'{first_name} {last_name}'.split()).casefold()}")
+
+
+def customer_keys(email: str | None, first_name: str | None, last_name: str | None) -> Dict[str, str | None]:
+    """
+    Values of the customer key fields stored on the impressions and conversions of a customer.
+    Both are stored so that a customer is matched on the name when the email differs.
+    """
+    return {
+        "customer_email_key": customer_email_key(email),
+        "customer_name_key": customer_name_key(first_name, last_name),
+    }
@@ -0,0 +1,47 @@
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from django.utils.text import compress_string
+from rest_framework.request import Request
+
+
+def build_not_modified_response(request: Request, etag: str | None) -> HttpResponse | None:
+    """
+    Return a 304 response when the client already has the representation of `etag`, None otherwise.
+    """
+    if not etag:
+        return None
+
+    response = get_conditional_response(request, etag=etag)
+    if not response or response.status_code != 304:
+        return None
+
+    response["ETag"] = etag
+    patch_vary_headers(response, ("Accept-Encoding",))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def build_compressed_response(
+    request: Request, content: str, content_type: str, etag: str | None = None
+) -> HttpResponse:
+    """
+    Return `content` gzipped when the client accepts it, with `etag` or a strong ETag computed on the sent bytes.
+    Return a 304 response when the client already has this representation.
+    """
+    body = content.encode("utf-8")
+    gzipped = "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "")
+    if gzipped:
+        body = compress_string(body)
+
+    etag = etag or quote_etag(hashlib.sha256(body).hexdigest())
+    response = HttpResponse(body, content_type=content_type)
+    response["ETag"] = etag
+    if gzipped:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    patch_cache_control(response, private=True, no_cache=True)
+
+    return get_conditional_response(request, etag=etag, response=response) or response
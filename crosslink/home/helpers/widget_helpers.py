@@ -1,9 +1,8 @@
 import logging
-from typing import Dict
-from urllib.parse import urlencode
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 
 from django.urls import reverse
-from home.models import Discount, Product
 from rest_framework.request import Request
 
 logger = logging.getLogger(__file__)
@@ -17,6 +16,8 @@ utm_params = urlencode(
     },
     safe="",
 )
+# UTM parameter carrying the click id to the recommended shop, and back in the landing site of its orders.
+CLICK_ID_PARAM = "utm_content"
 
 
 def build_widget_url_params(purchase_shop_url: str, request: Request) -> dict:
@@ -37,14 +38,53 @@ def build_visit_product_url(
     recommended_shop_url: str,
     request: Request,
     url: str,
-    product: Product,
-    discount: Discount | None,
+    cms_product_handle: str,
+    discount_code: str | None,
 ) -> str:
-    if discount:
-        discount_url_params = urlencode({"redirect": f"/products/{product.cms_product_handle}?{utm_params}"}, safe="")
-        rdir = f"https://{recommended_shop_url}/discount/{discount.code}?{discount_url_params}"
+    if discount_code:
+        discount_url_params = urlencode({"redirect": f"/products/{cms_product_handle}?{utm_params}"}, safe="")
+        rdir = f"https://{recommended_shop_url}/discount/{discount_code}?{discount_url_params}"
     else:
-        rdir = f"https://{recommended_shop_url}/products/{product.cms_product_handle}?{utm_params}"
+        rdir = f"https://{recommended_shop_url}/products/{cms_product_handle}?{utm_params}"
 
     widget_visit_product_url_params = widget_url_params | {"rdir": rdir}
     return request.build_absolute_uri(reverse(url) + "?" + urlencode(widget_visit_product_url_params, safe=""))
+
+
+def parse_rdir(rdir: str) -> Tuple[str, str | None]:
+    """
+    Inverse of the visit urls: return the recommended shop url of a redirection url and the handle
+    of the product it points to, if any, including through a discount redirection.
+    """
+    parsed_rdir = urlparse(rdir if "//" in rdir else f"//{rdir}")
+    path = parse_qs(parsed_rdir.query).get("redirect", [parsed_rdir.path])[0]
+    path_parts = urlparse(path).path.strip("/").split("/")
+    cms_product_handle = path_parts[1] if len(path_parts) > 1 and path_parts[0] == "products" else None
+    return parsed_rdir.netloc, cms_product_handle or None
+
+
+def add_click_id(rdir: str, click_id: str) -> str:
+    """
+    Add the click id to the UTM parameters of a redirection url, in the product path of a discount
+    redirection since Shopify only keeps the `redirect` parameter.
+    """
+    parsed_rdir = urlparse(rdir)
+    query = parse_qs(parsed_rdir.query)
+    if "redirect" in query:
+        query["redirect"] = [add_click_id(query["redirect"][0], click_id)]
+    else:
+        query[CLICK_ID_PARAM] = [click_id]
+    return urlunparse(parsed_rdir._replace(query=urlencode(query, doseq=True, safe="/")))
+
+
+def parse_click_id(landing_site: str | None) -> str | None:
+    """
+    Click id of the landing site of an order, if the customer came from a cross sell widget.
+    """
+    if not landing_site:
+        return None
+    parsed_landing_site = urlparse(landing_site)
+    query = parse_qs(parsed_landing_site.query)
+    if "redirect" in query:
+        return parse_click_id(query["redirect"][0])
+    return query.get(CLICK_ID_PARAM, [None])[0]
@@ -11,6 +11,8 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "configs.settings.local")
 django.setup()
 
 from home.models import Product, Shop, Variant
+from home.services.recommendations import RecommendationCardCache
+from home.services.upsell import UpsellOfferCache
 from home.utils import get_object_or_none
 
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
@@ -77,12 +79,16 @@ def process_product_event(event: dict):
             )
 
         Variant.objects.filter(product=product).exclude(cms_variant_id__in=variant_ids).delete()
+        Product.objects.filter(pk=product.pk).refresh_variant_summary()
         logger.info(f"Processed product {product.cms_product_id} ({event_type})")
 
     elif event_type == "delete":
         Product.objects.filter(shop=shop, cms_product_id=data["id"]).delete()
         logger.info(f"Deleted product {data['id']}")
 
+    RecommendationCardCache.invalidate_products(shop.id, [data["id"]])
+    UpsellOfferCache.refresh_products(shop.id, [data["id"]])
+
 
 def consume():
     consumer = wait_for_kafka()
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import time
+
+import django
+from confluent_kafka import Consumer, TopicPartition
+
+# Setup Django environment
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "configs.settings.local")
+django.setup()
+
+from home.kafka.producer import send_dead_order_event
+from home.services.conversions import CrossSellConversionService
+
+KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
+TOPIC = os.getenv("KAFKA_ORDER_TOPIC", "shopify-orders")
+GROUP_ID = os.getenv("KAFKA_ORDER_GROUP_ID", "shopify-order-consumer")
+BATCH_SIZE = int(os.getenv("KAFKA_ORDER_BATCH_SIZE", "500"))
+MAX_ATTEMPTS = int(os.getenv("KAFKA_ORDER_MAX_ATTEMPTS", "5"))
+RETRY_BACKOFF = float(os.getenv("KAFKA_ORDER_RETRY_BACKOFF", "1"))
+
+logger = logging.getLogger(__name__)
+
+
+def wait_for_kafka(retries=10, delay=5):
+    for attempt in range(1, retries + 1):
+        try:
+            # Offsets are committed once a batch is attributed, replayed orders are skipped by the attribution.
+            consumer = Consumer(
+                {
+                    "bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS,
+                    "group.id": GROUP_ID,
+                    "auto.offset.reset": "earliest",
+                    "enable.auto.commit": False,
+                }
+            )
+            consumer.list_topics(timeout=5)  # test connection
+            logger.info("Connected to Kafka!")
+            return consumer
+        except Exception as e:
+            logger.warning(f"Kafka not ready (attempt {attempt}/{retries}): {e}")
+            time.sleep(delay)
+    raise RuntimeError("Kafka not available after several retries")
+
+
+def attribute(pending):
+    """
+    Attributes the pending (message, order) pairs, one by one when the whole batch fails so that a
+    single failing order does not hold back the others. Returns the created conversions and the pairs
+    that failed with their error.
+    """
+    try:
+        return CrossSellConversionService.attribute_orders([order for _, order in pending]), []
+    except Exception as e:
+        if len(pending) == 1:
+            return 0, [(*pending[0], e)]
+        logger.exception(f"Failed to attribute {len(pending)} orders, attributing them one by one: {e}")
+
+    created, failed = 0, []
+    for msg, order in pending:
+        try:
+            created += CrossSellConversionService.attribute_orders([order])
+        except Exception as e:
+            failed.append((msg, order, e))
+    return created, failed
+
+
+def process(messages):
+    """
+    Attributes a batch of order messages, retrying the failing orders with an exponential backoff.
+    Malformed messages and orders still failing after `MAX_ATTEMPTS` go to the dead letter topic.
+    """
+    pending = []
+    for msg in messages:
+        if msg.error():
+            logger.error(f"Kafka error: {msg.error()}")
+            continue
+        try:
+            pending.append((msg, json.loads(msg.value().decode("utf-8"))))
+        except ValueError as e:
+            logger.error(f"Dead lettering malformed order message: {e}")
+            send_dead_order_event(msg.key(), msg.value(), str(e))
+
+    created = 0
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        attempt_created, failed = attribute(pending)
+        created += attempt_created
+        if not failed:
+            return created
+        pending = [(msg, order) for msg, order, _ in failed]
+        if attempt < MAX_ATTEMPTS:
+            logger.warning(f"Retrying {len(pending)} orders (attempt {attempt}/{MAX_ATTEMPTS}): {failed[0][2]}")
+            time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+
+    for msg, order, e in failed:
+        logger.error(f"Dead lettering order {order.get('checkout_token')} of {order.get('shop_url')}: {e}")
+        send_dead_order_event(msg.key(), msg.value(), str(e))
+    return created
+
+
+def rewind(consumer, messages):
+    """
+    Seeks back to the first offset of each partition of the batch so that it is consumed again.
+    """
+    offsets = {}
+    for msg in messages:
+        if msg.error():
+            continue
+        partition = (msg.topic(), msg.partition())
+        offsets[partition] = min(offsets.get(partition, msg.offset()), msg.offset())
+    for (topic, partition), offset in offsets.items():
+        consumer.seek(TopicPartition(topic, partition, offset))
+
+
+def consume():
+    consumer = wait_for_kafka()
+
+    consumer.subscribe([TOPIC])
+    try:
+        while True:
+            messages = consumer.consume(num_messages=BATCH_SIZE, timeout=1.0)
+            if not messages:
+                continue
+
+            # Offsets are only committed once every order is attributed or dead lettered.
+            try:
+                created = process(messages)
+                consumer.commit(asynchronous=False)
+                logger.info(f"Processed {len(messages)} order messages, {created} conversions created")
+            except Exception as e:
+                logger.exception(f"Failed to process order messages, consuming them again: {e}")
+                rewind(consumer, messages)
+                time.sleep(RETRY_BACKOFF)
+
+    except KeyboardInterrupt:
+        logger.info("Consumer stopped")
+    finally:
+        consumer.close()
+
+
+if __name__ == "__main__":
+    consume()
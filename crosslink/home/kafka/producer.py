@@ -1,13 +1,16 @@
 import json
 import logging
 
-from confluent_kafka import Producer
+from confluent_kafka import KafkaException, Producer
 from django.conf import settings
 
 logger = logging.getLogger(__file__)
 
 KAFKA_BOOTSTRAP_SERVERS = getattr(settings, "KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
 TOPIC = "shopify-products"
+ORDER_TOPIC = "shopify-orders"
+DEAD_ORDER_TOPIC = "shopify-orders-dead"
+ORDER_DELIVERY_TIMEOUT = 10
 
 producer_config = {
     "bootstrap.servers": KAFKA_BOOTSTRAP_SERVERS,
@@ -41,3 +44,35 @@ def send_product_event(event_type: str, product_data: dict):
         callback=delivery_report,
     )
     producer.flush()
+
+
+def produce_and_confirm(topic: str, key, value, headers: dict = None):
+    """
+    Produces a message and waits for its delivery, raises `KafkaException` when it is not delivered
+    so that the caller does not acknowledge an event that was lost.
+    """
+    errors = []
+
+    def on_delivery(err, msg):
+        delivery_report(err, msg)
+        if err is not None:
+            errors.append(err)
+
+    producer.produce(topic=topic, key=key, value=value, headers=headers, callback=on_delivery)
+    if producer.flush(ORDER_DELIVERY_TIMEOUT) or errors:
+        raise KafkaException(errors[0] if errors else f"Message {key} to {topic} not delivered")
+
+
+def send_order_event(order_data: dict):
+    """
+    order_data: JSON-serializable order payload, see `CrossSellConversionService`.
+    Orders are keyed by shop so that the orders of a shop are attributed by a single consumer.
+    """
+    produce_and_confirm(ORDER_TOPIC, order_data["shop_url"], json.dumps(order_data))
+
+
+def send_dead_order_event(key, value: bytes, error: str):
+    """
+    Parks an order message that could not be attributed, with the reason in its `error` header.
+    """
+    produce_and_confirm(DEAD_ORDER_TOPIC, key, value, headers={"error": error})
@@ -0,0 +1,39 @@
+import logging
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from home.services.partitions import EVENT_TABLES, EventPartitionService, add_months
+
+logger = logging.getLogger(__file__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the monthly partitions of the event tables older than the retention to gzipped CSV files, "
+        "in the S3 bucket or in a local directory, then detach them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tables", nargs="+", choices=list(EVENT_TABLES), default=list(EVENT_TABLES))
+        parser.add_argument("--retention-months", type=int, default=13, help="Months of events kept attached")
+        parser.add_argument("--directory", type=Path, help="Archive to this directory instead of the S3 bucket")
+        parser.add_argument("--drop", action="store_true", help="Drop the partitions once detached")
+
+    def handle(self, *args, **options):
+        oldest_kept_month = add_months(timezone.now().date().replace(day=1), -options["retention_months"])
+
+        for table in options["tables"]:
+            if not EventPartitionService.is_partitioned(table):
+                logger.info(f"{table} is not partitioned, skipped")
+                continue
+
+            for partition, month in sorted(EventPartitionService.monthly_partitions(table).items()):
+                if month >= oldest_kept_month:
+                    continue
+                location = EventPartitionService.archive_partition(
+                    table, partition, directory=options["directory"], drop=options["drop"]
+                )
+                logger.info(f"{partition} archived to {location} and detached")
+
+        self.stdout.write(self.style.SUCCESS("Event partitions archived"))
@@ -0,0 +1,142 @@
+import math
+import random
+import time
+from dataclasses import asdict
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, List
+
+from django.core.management.base import BaseCommand, CommandError
+from home.dataclasses.dashboard import ShopActivity
+from home.models import Shop, ShopDailyActivity
+from home.models.shop import DailyMetrics
+from home.utils import daterange
+
+
+def dict_series(shop: Shop, start_date: date, end_date: date, daily_metrics: Dict[date, DailyMetrics]) -> ShopActivity:
+    """
+    Reference implementation of the activity with per day dictionaries and decimal arithmetic,
+    as the dashboard computed it before the array engine.
+    """
+    days = list(daterange(start_date, end_date))
+    daily = {
+        metric: {str(day): daily_metrics[day][metric] if day in daily_metrics else 0 for day in days}
+        for metric in ShopDailyActivity.METRICS
+    }
+    totals = {metric: sum(daily[metric].values()) for metric in ShopDailyActivity.METRICS}
+
+    def section(section_type, metric: str):
+        return section_type(daily[f"upsell_{metric}"], daily[f"cross_sell_{metric}"])
+
+    def rates(numerator: str, denominator: str) -> ShopActivity.SectionDailyRate:
+        return ShopActivity.SectionDailyRate(
+            *[
+                {
+                    day: 100 * Decimal(daily[f"{prefix}_{numerator}"][day]) / Decimal(value) if value > 0 else 0
+                    for day, value in daily[f"{prefix}_{denominator}"].items()
+                }
+                for prefix in ("upsell", "cross_sell")
+            ]
+        )
+
+    impressions = ShopActivity.SectionCount(totals["upsell_impressions"], totals["cross_sell_impressions"])
+    clicks = ShopActivity.SectionCount(totals["upsell_clicks"], totals["cross_sell_clicks"])
+    total_sales = ShopActivity.SectionCount(totals["upsell_total_sales"], totals["cross_sell_total_sales"])
+    return ShopActivity(
+        impressions,
+        clicks,
+        total_sales,
+        ShopActivity.SectionValue(Decimal(totals["upsell_sales"]), Decimal(totals["cross_sell_sales"])),
+        shop.ctr(clicks, impressions),
+        shop.cr(total_sales, clicks),
+        section(ShopActivity.SectionDailyCount, "impressions"),
+        section(ShopActivity.SectionDailyCount, "clicks"),
+        section(ShopActivity.SectionDailyCount, "total_sales"),
+        section(ShopActivity.SectionDailyValue, "sales"),
+        rates("clicks", "impressions"),
+        rates("total_sales", "clicks"),
+    )
+
+
+def differences(activity: Dict, reference: Dict, path: str = "") -> List[str]:
+    """
+    Paths of the values of two activities that differ. Daily rates are compared with a relative
+    tolerance, every other value must be equal and of the same type.
+    """
+    if isinstance(reference, dict):
+        if activity.keys() != reference.keys():
+            return [path]
+        return [
+            difference
+            for key in reference
+            for difference in differences(activity[key], reference[key], f"{path}.{key}" if path else key)
+        ]
+    if path.startswith(("daily_ctrs", "daily_crs")):
+        return [] if math.isclose(activity, reference, rel_tol=1e-12) else [path]
+    return [] if activity == reference and type(activity) is type(reference) else [path]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the dashboard daily series computed by the array engine of `Shop.activity` with the previous "
+        "dictionary based computation, on synthetic rollups. No database is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--years", type=int, nargs="+", default=[1, 3, 5], help="Lengths of the ranges")
+        parser.add_argument("--active-ratio", type=float, default=0.8, help="Share of the days with activity")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--random-seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options["random_seed"])
+        shop = Shop(id=0)
+
+        self.stdout.write(f"{'range':>8} {'dict ms':>10} {'array ms':>10} {'speedup':>8}")
+        for years in options["years"]:
+            end_date = date.today()
+            start_date = end_date - timedelta(days=365 * years - 1)
+            daily_metrics = {
+                day: self.random_metrics()
+                for day in daterange(start_date, end_date)
+                if random.random() < options["active_ratio"]
+            }
+            start_datetime = datetime.combine(start_date, datetime.min.time(), tzinfo=timezone.utc)
+            end_datetime = datetime.combine(end_date, datetime.min.time(), tzinfo=timezone.utc)
+
+            activity = shop.activity(start_datetime, end_datetime, daily_metrics)
+            reference = dict_series(shop, start_date, end_date, daily_metrics)
+            mismatches = differences(asdict(activity), asdict(reference))
+            if mismatches:
+                raise CommandError(
+                    f"The array engine and the reference disagree on {years} years: {', '.join(sorted(mismatches)[:10])}"
+                )
+
+            dict_ms = self.timeit(lambda: dict_series(shop, start_date, end_date, daily_metrics), options["repeat"])
+            array_ms = self.timeit(
+                lambda: shop.activity(start_datetime, end_datetime, daily_metrics), options["repeat"]
+            )
+            self.stdout.write(f"{f'{years}y':>8} {dict_ms:>10.2f} {array_ms:>10.2f} {dict_ms / array_ms:>7.1f}x")
+
+    @staticmethod
+    def random_metrics() -> DailyMetrics:
+        impressions = random.randint(0, 500)
+        clicks = random.randint(0, impressions)
+        total_sales = random.randint(0, clicks)
+        return {
+            "upsell_impressions": impressions,
+            "cross_sell_impressions": impressions,
+            "upsell_clicks": clicks,
+            "cross_sell_clicks": clicks,
+            "upsell_total_sales": total_sales,
+            "cross_sell_total_sales": total_sales,
+            "upsell_sales": Decimal(random.randint(0, 100000)).scaleb(-2),
+            "cross_sell_sales": Decimal(random.randint(0, 100000)).scaleb(-2),
+        }
+
+    @staticmethod
+    def timeit(function, repeat: int) -> float:
+        started_at = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        return (time.perf_counter() - started_at) / repeat * 1000
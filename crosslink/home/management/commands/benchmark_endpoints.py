@@ -0,0 +1,319 @@
+import base64
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+from urllib.parse import urlencode
+
+import jwt
+import numpy as np
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from faker import Faker
+from home.models import CrossSellWidget, Shop, UpsellWidget, WidgetStatus
+from home.services.recommendations import EligibleShopIndex
+from redis import RedisError
+
+# Maximum SQL queries per request and p95 latency in milliseconds of each endpoint.
+DEFAULT_BUDGETS = {
+    "cross_sell_widget": {"queries": 8, "p95_ms": 200},
+    "upsell_offer": {"queries": 8, "p95_ms": 200},
+    "sign_changeset": {"queries": 2, "p95_ms": 100},
+    "product_create": {"queries": 3, "p95_ms": 100},
+    "product_update": {"queries": 3, "p95_ms": 100},
+    "product_delete": {"queries": 3, "p95_ms": 100},
+}
+
+
+@dataclass
+class EndpointResult:
+    endpoint: str
+    latencies: List[float] = field(default_factory=list)
+    queries: List[int] = field(default_factory=list)
+    errors: int = 0
+    duration: float = 0
+
+    def percentile(self, value: int) -> float:
+        return float(np.percentile(self.latencies, value)) * 1000 if self.latencies else 0
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.duration if self.duration else 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the public Shopify endpoints concurrently and report throughput, latency and SQL queries per request. "
+        "Requests are sent in process with the Django test client, so that the queries of each request can be counted. "
+        "Fail when an endpoint exceeds its query or latency budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", action="store_true", help="Generate a fake catalog and widgets first")
+        parser.add_argument("--shops", type=int, default=20)
+        parser.add_argument("--products-per-shop", type=int, default=200)
+        parser.add_argument("--max-variants", type=int, default=4)
+        parser.add_argument("--endpoints", nargs="+", choices=list(DEFAULT_BUDGETS), default=list(DEFAULT_BUDGETS))
+        parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint")
+        parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests per endpoint")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--random-seed", type=int, default=42)
+        parser.add_argument(
+            "--query-budget", action="append", default=[], metavar="ENDPOINT=QUERIES", help="Override a query budget"
+        )
+        parser.add_argument(
+            "--latency-budget", action="append", default=[], metavar="ENDPOINT=MS", help="Override a p95 budget"
+        )
+
+    def handle(self, *args, **options):
+        self.secret_key = apps.get_app_config("shopify_app").SHOPIFY_API_SECRET_KEY
+        if not self.secret_key:
+            raise CommandError("SHOPIFY_API_SECRET_KEY must be set to sign the upsell tokens and webhooks.")
+
+        random.seed(options["random_seed"])
+        Faker.seed(options["random_seed"])
+        budgets = self.budgets(options["query_budget"], options["latency_budget"])
+
+        if options["seed"]:
+            call_command(
+                "generate_fake_catalog",
+                shops=options["shops"],
+                products_per_shop=options["products_per_shop"],
+                max_variants=options["max_variants"],
+            )
+            self.seed_widgets()
+
+        self.shops = list(Shop.objects.filter(cross_sell_widgets__status=WidgetStatus.ACTIVE.value).distinct())
+        self.upsell_widgets = list(
+            UpsellWidget.objects.filter(status=WidgetStatus.ACTIVE.value).select_related("shop")[:100]
+        )
+        if not self.shops or not self.upsell_widgets:
+            raise CommandError("No active widgets to benchmark, run the command with --seed.")
+
+        results = [
+            self.run_endpoint(
+                endpoint,
+                getattr(self, f"{endpoint}_request"),
+                options["requests"],
+                options["warmup"],
+                options["concurrency"],
+            )
+            for endpoint in options["endpoints"]
+        ]
+        self.report(results)
+
+        failures = [failure for result in results for failure in self.check_budget(result, budgets[result.endpoint])]
+        if failures:
+            raise CommandError("Benchmark budgets exceeded:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("All endpoints are within their budgets"))
+
+    def budgets(self, query_budgets: List[str], latency_budgets: List[str]) -> Dict[str, Dict]:
+        budgets = {endpoint: dict(budget) for endpoint, budget in DEFAULT_BUDGETS.items()}
+        for overrides, key in ((query_budgets, "queries"), (latency_budgets, "p95_ms")):
+            for override in overrides:
+                endpoint, _, value = override.partition("=")
+                if endpoint not in budgets or not value.isdigit():
+                    raise CommandError(f"Invalid budget {override}")
+                budgets[endpoint][key] = int(value)
+        return budgets
+
+    def seed_widgets(self):
+        """
+        Give each shop without widgets an active cross sell widget and an active upsell widget.
+        """
+        self.stdout.write("Creating widgets...")
+        cross_sell_widgets = []
+        upsell_widgets = []
+        for shop in Shop.objects.filter(cross_sell_widgets__isnull=True, upsell_widgets__isnull=True):
+            cms_product_ids = list(shop.products.values_list("cms_product_id", flat=True)[:20])
+            if len(cms_product_ids) < 2:
+                continue
+            cross_sell_widgets.append(CrossSellWidget(shop=shop, name="Benchmark", cms_product_ids=cms_product_ids[:6]))
+            upsell_widgets.append(
+                UpsellWidget(
+                    shop=shop,
+                    name="Benchmark",
+                    upsell_product_id=cms_product_ids[0],
+                    trigger_product_ids=cms_product_ids[1:],
+                )
+            )
+        CrossSellWidget.objects.bulk_create(cross_sell_widgets)
+        UpsellWidget.objects.bulk_create(upsell_widgets)
+
+        # Bulk inserts skip the signals keeping the eligible shops up to date.
+        try:
+            EligibleShopIndex.rebuild()
+        except RedisError as e:
+            self.stderr.write(f"Unable to rebuild the eligible shop index: {e}")
+
+    def run_endpoint(self, endpoint: str, build_request: Callable, requests: int, warmup: int, concurrency: int):
+        """
+        Send `requests` requests built by `build_request` from `concurrency` threads.
+        Each thread has its own client and database connection.
+        """
+        self.stdout.write(f"Benchmarking {endpoint}...")
+        result = EndpointResult(endpoint)
+        lock = threading.Lock()
+        # Requests are built upfront so that building them is not measured.
+        measured_requests = [build_request() for _ in range(requests)]
+        warmup_requests = [build_request() for _ in range(warmup)]
+
+        def worker(worker_requests: List[Dict], measure: bool):
+            client = Client(raise_request_exception=False)
+            try:
+                for request in worker_requests:
+                    with CaptureQueriesContext(connection) as queries:
+                        started_at = time.perf_counter()
+                        response = client.generic(**request)
+                        latency = time.perf_counter() - started_at
+                    if not measure:
+                        continue
+                    with lock:
+                        result.latencies.append(latency)
+                        result.queries.append(len(queries))
+                        result.errors += response.status_code >= 400
+            finally:
+                connection.close()
+
+        for worker_requests, measure in ((warmup_requests, False), (measured_requests, True)):
+            threads = [
+                threading.Thread(target=worker, args=(worker_requests[index::concurrency], measure))
+                for index in range(concurrency)
+            ]
+            started_at = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            result.duration = time.perf_counter() - started_at
+        return result
+
+    def report(self, results: List[EndpointResult]):
+        header = f"{'endpoint':<20}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        header += f"{'queries':>10}{'max q':>8}"
+        self.stdout.write(header)
+        for result in results:
+            self.stdout.write(
+                f"{result.endpoint:<20}{len(result.latencies):>10}{result.errors:>8}{result.throughput:>10.1f}"
+                f"{result.percentile(50):>10.1f}{result.percentile(95):>10.1f}{result.percentile(99):>10.1f}"
+                f"{np.mean(result.queries) if result.queries else 0:>10.1f}{max(result.queries, default=0):>8}"
+            )
+
+    def check_budget(self, result: EndpointResult, budget: Dict) -> List[str]:
+        failures = []
+        if result.errors:
+            failures.append(f"{result.endpoint}: {result.errors} requests failed")
+        if max(result.queries, default=0) > budget["queries"]:
+            failures.append(f"{result.endpoint}: {max(result.queries)} queries per request > {budget['queries']}")
+        if result.percentile(95) > budget["p95_ms"]:
+            failures.append(f"{result.endpoint}: p95 {result.percentile(95):.1f}ms > {budget['p95_ms']}ms")
+        return failures
+
+    # --- Requests ---
+
+    def cross_sell_widget_request(self) -> Dict:
+        shop = random.choice(self.shops)
+        return {
+            "method": "GET",
+            "path": reverse("shopify:shopify_app_cross_sell_widget")
+            + "?"
+            + urlencode(
+                {
+                    "shop": shop.shop_url,
+                    "checkout_token": uuid.uuid4().hex,
+                    "checkout_customer_id": random.randint(1, 10**9),
+                    "checkout_shipping_address_first_name": "John",
+                }
+            ),
+        }
+
+    def upsell_token(self, upsell_widget: UpsellWidget, checkout_token: str) -> str:
+        return jwt.encode(
+            {
+                "input_data": {
+                    "initialPurchase": {
+                        "referenceId": checkout_token,
+                        "customerId": random.randint(1, 10**9),
+                        "lineItems": [
+                            {"product": {"id": product_id}} for product_id in upsell_widget.trigger_product_ids[:2]
+                        ],
+                    }
+                }
+            },
+            self.secret_key,
+            algorithm="HS256",
+        )
+
+    def upsell_offer_request(self) -> Dict:
+        upsell_widget = random.choice(self.upsell_widgets)
+        return {
+            "method": "GET",
+            "path": reverse("shopify:shopify_app_upsell_offer")
+            + "?"
+            + urlencode(
+                {"shop_url": upsell_widget.shop.shop_url, "token": self.upsell_token(upsell_widget, uuid.uuid4().hex)}
+            ),
+        }
+
+    def sign_changeset_request(self) -> Dict:
+        upsell_widget = random.choice(self.upsell_widgets)
+        checkout_token = uuid.uuid4().hex
+        return {
+            "method": "POST",
+            "path": reverse("shopify:shopify_app_upsell_sign_changeset"),
+            "content_type": "application/json",
+            "data": json.dumps(
+                {
+                    "shop_url": upsell_widget.shop.shop_url,
+                    "token": self.upsell_token(upsell_widget, checkout_token),
+                    "referenceId": checkout_token,
+                    "upsell_widget_id": upsell_widget.id,
+                    "changes": [{"type": "add_variant", "variantId": random.randint(1, 10**9), "quantity": 1}],
+                }
+            ),
+        }
+
+    def webhook_request(self, url_name: str, payload: Dict) -> Dict:
+        body = json.dumps(payload).encode("utf-8")
+        digest = hmac.new(self.secret_key.encode("utf-8"), body, digestmod=hashlib.sha256).digest()
+        return {
+            "method": "POST",
+            "path": reverse(f"shopify:{url_name}"),
+            "content_type": "application/json",
+            "data": body,
+            "HTTP_X_SHOPIFY_HMAC_SHA256": base64.b64encode(digest).decode("utf-8"),
+            "HTTP_X_SHOPIFY_SHOP_DOMAIN": random.choice(self.shops).shop_url,
+            "HTTP_X_SHOPIFY_WEBHOOK_ID": str(uuid.uuid4()),
+        }
+
+    def product_payload(self) -> Dict:
+        product_id = random.randint(1, 10**12)
+        return {
+            "id": product_id,
+            "status": "active",
+            "title": f"Benchmark product {product_id}",
+            "handle": f"benchmark-product-{product_id}",
+            "body_html": "",
+            "options": [],
+            "variants": [{"id": product_id, "title": "Default", "price": "10.00", "inventory_quantity": 10}],
+            "images": [],
+        }
+
+    def product_create_request(self) -> Dict:
+        return self.webhook_request("product_create", self.product_payload())
+
+    def product_update_request(self) -> Dict:
+        return self.webhook_request("product_update", self.product_payload())
+
+    def product_delete_request(self) -> Dict:
+        return self.webhook_request("product_delete", {"id": random.randint(1, 10**12)})
@@ -0,0 +1,59 @@
+import logging
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from home.extensions.redis.stream import CLAIM_MIN_IDLE_TIME
+from home.services.conversions import UpsellConversionBuffer
+from home.services.impressions import CrossSellImpressionBuffer
+
+logger = logging.getLogger(__file__)
+
+# Write-behind buffers, by the name they are drained with.
+BUFFERS = {
+    "cross_sell_impressions": CrossSellImpressionBuffer,
+    "upsell_conversions": UpsellConversionBuffer,
+}
+
+
+class Command(BaseCommand):
+    help = "Bulk insert the messages of a write-behind buffer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("buffer", type=str, choices=BUFFERS)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--block", type=int, default=5000, help="Milliseconds to wait for new messages")
+        parser.add_argument(
+            "--retry-interval", type=int, default=60, help="Seconds between two retries of the pending messages"
+        )
+        parser.add_argument(
+            "--claim-min-idle",
+            type=int,
+            default=CLAIM_MIN_IDLE_TIME,
+            help="Milliseconds after which the pending messages of other consumers are claimed",
+        )
+        parser.add_argument("--consumer", type=str, default=os.environ.get("HOSTNAME", socket.gethostname()))
+
+    def handle(self, *args, **options):
+        buffer_name = options["buffer"]
+        buffer = BUFFERS[buffer_name]
+        batch_size = options["batch_size"]
+        consumer = options["consumer"]
+
+        buffer.create_group()
+
+        self.stdout.write(f"Draining {buffer_name} as {consumer}...")
+        try:
+            retried_at = 0.0
+            while True:
+                # Retry the messages read but not saved by this consumer, or by a consumer that is gone.
+                if time.monotonic() - retried_at > options["retry_interval"]:
+                    buffer.drain_pending(consumer, batch_size, options["claim_min_idle"])
+                    retried_at = time.monotonic()
+
+                drained = buffer.drain(consumer, batch_size, block=options["block"])
+                if drained:
+                    logger.info(f"Saved {drained} {buffer_name}")
+        except KeyboardInterrupt:
+            self.stdout.write(f"{buffer_name} drainer stopped")
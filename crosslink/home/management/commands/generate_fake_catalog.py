@@ -96,3 +96,4 @@ class Command(BaseCommand):
                 )
 
         Variant.objects.bulk_create(variant_batch)
+        products.refresh_variant_summary()
@@ -59,5 +59,6 @@ class Command(BaseCommand):
                         )
                     )
             Variant.objects.bulk_create(variants_to_create, batch_size=200)
+            Product.objects.filter(shop=shop).refresh_variant_summary()
 
         self.stdout.write(self.style.SUCCESS(f"Generated {num_shops*num_products} products with variants"))
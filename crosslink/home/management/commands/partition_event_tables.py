@@ -0,0 +1,42 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from home.services.partitions import EVENT_TABLES, EventPartitionService, add_months
+
+logger = logging.getLogger(__file__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the monthly partitions of the partitioned event tables ahead of time. "
+        "With --convert, first convert the plain event tables into tables partitioned by month."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tables", nargs="+", choices=list(EVENT_TABLES), default=list(EVENT_TABLES))
+        parser.add_argument("--months-ahead", type=int, default=3, help="Future months to create partitions for")
+        parser.add_argument("--convert", action="store_true", help="Convert the tables that are not partitioned")
+
+    def handle(self, *args, **options):
+        current_month = timezone.now().date().replace(day=1)
+
+        for table in options["tables"]:
+            if not EventPartitionService.is_partitioned(table):
+                if not options["convert"]:
+                    logger.info(f"{table} is not partitioned, skipped")
+                    continue
+                try:
+                    EventPartitionService.convert(table, options["months_ahead"])
+                except ValueError as e:
+                    self.stderr.write(f"{table} is not converted: {e}")
+                    continue
+                logger.info(f"{table} converted to monthly partitions")
+                continue
+
+            partitions = EventPartitionService.create_partitions(
+                table, current_month, add_months(current_month, options["months_ahead"])
+            )
+            logger.info(f"{table} partitioned up to {partitions[-1]}")
+
+        self.stdout.write(self.style.SUCCESS("Event partitions created"))
@@ -0,0 +1,77 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from home.models import CrossSellConversion, Shop
+from home.services.conversions import CrossSellConversionService
+
+logger = logging.getLogger(__file__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Attribute again the cross sell conversions of a date range with the current attribution rules. "
+        "The work is split by shop and day across a pool of processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start-date", type=date.fromisoformat, required=True, help="First day, YYYY-MM-DD")
+        parser.add_argument("--end-date", type=date.fromisoformat, help="Last day, YYYY-MM-DD, today by default")
+        parser.add_argument("--shops", type=int, nargs="+", help="Ids of the shops to attribute, all shops by default")
+        parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Size of the process pool")
+
+    def handle(self, *args, **options):
+        start_date = options["start_date"]
+        end_date = options["end_date"] or date.today()
+        started_at = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+        ended_at = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+
+        conversions = CrossSellConversion.objects.filter(created_at__gte=started_at, created_at__lt=ended_at)
+        if options["shops"]:
+            conversions = conversions.filter(
+                purchase_shop_url__in=Shop.objects.filter(id__in=options["shops"]).values("shop_url")
+            )
+        shop_days = list(
+            conversions.annotate(day=TruncDate("created_at"))
+            .order_by("purchase_shop_url", "day")
+            .values_list("purchase_shop_url", "day")
+            .distinct()
+        )
+        self.stdout.write(f"Attributing the conversions of {len(shop_days)} shop days from {start_date} to {end_date}")
+
+        # The workers are forked and open their own database connection, they must not share this one.
+        connections.close_all()
+        started = time.perf_counter()
+        total_conversions = total_links = 0
+        with ProcessPoolExecutor(max_workers=options["processes"]) as executor:
+            futures = {
+                executor.submit(CrossSellConversionService.reattribute, *shop_day): shop_day for shop_day in shop_days
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                shop_url, day = futures[future]
+                try:
+                    conversion_count, link_count = future.result()
+                except Exception as e:
+                    logger.exception(f"Failed to attribute the conversions of {shop_url} on {day}: {e}")
+                    continue
+
+                total_conversions += conversion_count
+                total_links += link_count
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"[{done}/{len(shop_days)}] {shop_url} {day}: {conversion_count} conversions, "
+                    f"{link_count} links ({total_conversions / elapsed:.1f} conversions/s)"
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total_conversions} conversions and {total_links} links written "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+        )
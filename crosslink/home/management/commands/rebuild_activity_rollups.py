@@ -0,0 +1,30 @@
+import logging
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from home.models import Shop
+from home.services.activity import ShopActivityRollup
+
+logger = logging.getLogger(__file__)
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily activity rollups of the shops from the raw impressions, clicks and conversions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start-date", type=date.fromisoformat, required=True, help="First day, YYYY-MM-DD")
+        parser.add_argument("--end-date", type=date.fromisoformat, help="Last day, YYYY-MM-DD, today by default")
+        parser.add_argument("--shops", type=int, nargs="+", help="Ids of the shops to rebuild, all shops by default")
+
+    def handle(self, *args, **options):
+        start_date = options["start_date"]
+        end_date = options["end_date"] or date.today()
+        shops = Shop.objects.order_by("id")
+        if options["shops"]:
+            shops = shops.filter(id__in=options["shops"])
+
+        for shop in shops:
+            ShopActivityRollup.rebuild(shop, start_date, end_date)
+            logger.info(f"Rebuilt the activity rollups of shop {shop.id} from {start_date} to {end_date}")
+
+        self.stdout.write(self.style.SUCCESS("Activity rollups rebuilt"))
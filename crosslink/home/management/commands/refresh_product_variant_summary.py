@@ -0,0 +1,23 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from home.models import Product, Shop
+
+logger = logging.getLogger(__file__)
+
+
+class Command(BaseCommand):
+    help = "Backfill the price, min price, inventory and stock columns of the products from their variants"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shops", type=int, nargs="+", help="Ids of the shops to backfill, all shops by default")
+
+    def handle(self, *args, **options):
+        shop_ids = options["shops"] or Shop.objects.order_by("id").values_list("id", flat=True)
+
+        # One UPDATE per shop keeps the transactions short on large catalogs.
+        for shop_id in shop_ids:
+            updated = Product.objects.filter(shop_id=shop_id).refresh_variant_summary()
+            logger.info(f"Refreshed {updated} products of shop {shop_id}")
+
+        self.stdout.write(self.style.SUCCESS("Product variant summaries refreshed"))
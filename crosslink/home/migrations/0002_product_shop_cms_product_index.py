@@ -0,0 +1,17 @@
+# Generated by Django 4.1 on 2026-10-18 09:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["shop", "cms_product_id"], name="products_shop_cms_product_idx"),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1 on 2026-10-18 10:12
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0002_product_shop_cms_product_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crosssellimpression",
+            name="uuid",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            "UPDATE cross_sell_impressions SET uuid = gen_random_uuid() WHERE uuid IS NULL;",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name="crosssellimpression",
+            name="uuid",
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+    ]
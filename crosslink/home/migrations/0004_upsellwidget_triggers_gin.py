@@ -0,0 +1,20 @@
+# Generated by Django 4.1 on 2026-10-18 09:55
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0003_crosssellimpression_uuid"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="upsellwidget",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["trigger_product_ids"], name="upsell_widgets_triggers_gin"
+            ),
+        ),
+    ]
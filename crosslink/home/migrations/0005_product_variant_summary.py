@@ -0,0 +1,59 @@
+# Generated by Django 4.1 on 2026-10-18 09:58
+
+from django.db import migrations, models
+from django.db.models import Exists, Min, OuterRef, Subquery, Sum
+
+
+def refresh_variant_summaries(apps, schema_editor):
+    """
+    Fill the variant columns of the existing products, as `ProductQuerySet.refresh_variant_summary`,
+    with one UPDATE per shop to keep the transactions short on large catalogs.
+    """
+    Product = apps.get_model("home", "Product")
+    Shop = apps.get_model("home", "Shop")
+    Variant = apps.get_model("home", "Variant")
+
+    variants = Variant.objects.filter(product=OuterRef("pk"))
+    variant_totals = variants.order_by().values("product")
+    for shop_id in Shop.objects.order_by("id").values_list("id", flat=True):
+        Product.objects.filter(shop_id=shop_id).update(
+            price=Subquery(variants.order_by("pk").values("price")[:1]),
+            min_price=Subquery(variant_totals.annotate(min_price=Min("price")).values("min_price")),
+            inventory_quantity=Subquery(
+                variant_totals.annotate(total_inventory_quantity=Sum("inventory_quantity")).values(
+                    "total_inventory_quantity"
+                )
+            ),
+            in_stock=Exists(variants.filter(inventory_quantity__gt=0)),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0004_upsellwidget_triggers_gin"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="in_stock",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="inventory_quantity",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="min_price",
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="price",
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(refresh_variant_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.1 on 2026-10-18 10:00
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def discounted_price(upsell_widget, price: Decimal) -> Decimal:
+    """
+    `UpsellWidget.apply_discount`, historical models have no custom methods.
+    """
+    if upsell_widget.discount_type == "percentage":
+        final_price = max(price * (Decimal(1) - upsell_widget.discount_value / Decimal(100)), Decimal(0))
+    elif upsell_widget.discount_type == "fixed_amount":
+        final_price = max(price - upsell_widget.discount_value, Decimal(0))
+    else:
+        final_price = price
+    return round(final_price, 2)
+
+
+def backfill_sales(apps, schema_editor):
+    """
+    Compute the sales of the existing conversions as `UpsellConversion.line_sales`, in batches.
+    """
+    UpsellConversion = apps.get_model("home", "UpsellConversion")
+    conversions = UpsellConversion.objects.select_related("upsell_impression__upsell_widget", "variant").order_by("id")
+
+    last_id = 0
+    while batch := list(conversions.filter(id__gt=last_id)[:BATCH_SIZE]):
+        for conversion in batch:
+            conversion.sales = conversion.quantity * discounted_price(
+                conversion.upsell_impression.upsell_widget, conversion.variant.price
+            )
+        UpsellConversion.objects.bulk_update(batch, ["sales"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0005_product_variant_summary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="upsellconversion",
+            name="sales",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1 on 2026-10-18 10:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0006_upsellconversion_sales"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShopDailyActivity",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True)),
+                ("date", models.DateField()),
+                ("upsell_impressions", models.IntegerField(default=0)),
+                ("cross_sell_impressions", models.IntegerField(default=0)),
+                ("upsell_clicks", models.IntegerField(default=0)),
+                ("cross_sell_clicks", models.IntegerField(default=0)),
+                ("upsell_total_sales", models.IntegerField(default=0)),
+                ("cross_sell_total_sales", models.IntegerField(default=0)),
+                ("upsell_sales", models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ("cross_sell_sales", models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="daily_activities", to="home.shop"
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "shop_daily_activities",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="shopdailyactivity",
+            constraint=models.UniqueConstraint(fields=("shop", "date"), name="shop_daily_activities_shop_date_uniq"),
+        ),
+    ]
@@ -0,0 +1,132 @@
+# Generated by Django 4.1 on 2026-10-18 10:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+from home.helpers.widget_helpers import parse_rdir
+
+BATCH_SIZE = 1000
+
+# Links of the existing impressions, as `CrossSellImpressionQuerySet.link_recommended_shops`.
+LINK_RECOMMENDED_SHOPS_SQL = """
+    INSERT INTO cross_sell_impression_recommended_shops (impression_id, recommended_shop_id, created_at)
+    SELECT impressions.id, shops.id, impressions.created_at
+    FROM cross_sell_impressions AS impressions
+    JOIN shops ON shops.shop_url = ANY(impressions.recommended_shop_urls)
+    ON CONFLICT (impression_id, recommended_shop_id) DO NOTHING
+"""
+
+
+def resolve_click_targets(apps, schema_editor):
+    """
+    Recommended shop and product of the existing clicks, parsed from their redirection url
+    as `CrossSellClick.resolve_targets`, in batches.
+    """
+    CrossSellClick = apps.get_model("home", "CrossSellClick")
+    Product = apps.get_model("home", "Product")
+    Shop = apps.get_model("home", "Shop")
+
+    clicks = CrossSellClick.objects.filter(rdir__isnull=False).order_by("id").only("id", "rdir")
+    last_id = 0
+    while batch := list(clicks.filter(id__gt=last_id)[:BATCH_SIZE]):
+        parsed_rdirs = {click.rdir: parse_rdir(click.rdir) for click in batch if click.rdir}
+        shop_ids = dict(
+            Shop.objects.filter(shop_url__in={shop_url for shop_url, _ in parsed_rdirs.values()}).values_list(
+                "shop_url", "id"
+            )
+        )
+        product_ids = {
+            (shop_id, cms_product_handle): product_id
+            for shop_id, cms_product_handle, product_id in Product.objects.filter(
+                shop_id__in=shop_ids.values(),
+                cms_product_handle__in={handle for _, handle in parsed_rdirs.values() if handle},
+            ).values_list("shop_id", "cms_product_handle", "id")
+        }
+        for click in batch:
+            shop_url, cms_product_handle = parsed_rdirs.get(click.rdir, (None, None))
+            click.recommended_shop_id = shop_ids.get(shop_url)
+            click.recommended_product_id = product_ids.get((click.recommended_shop_id, cms_product_handle))
+        CrossSellClick.objects.bulk_update(batch, ["recommended_shop", "recommended_product"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0007_shop_daily_activity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CrossSellRecommendedShop",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(null=True)),
+            ],
+            options={
+                "db_table": "cross_sell_impression_recommended_shops",
+            },
+        ),
+        migrations.AddField(
+            model_name="crosssellclick",
+            name="recommended_product",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="cross_sell_clicks",
+                to="home.product",
+            ),
+        ),
+        migrations.AddField(
+            model_name="crosssellclick",
+            name="recommended_shop",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="cross_sell_clicks",
+                to="home.shop",
+            ),
+        ),
+        migrations.AddField(
+            model_name="crosssellimpression",
+            name="recommended_shops",
+            field=models.ManyToManyField(
+                related_name="recommended_cross_sell_impressions",
+                through="home.CrossSellRecommendedShop",
+                to="home.shop",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="crosssellclick",
+            index=models.Index(fields=["recommended_shop", "created_at"], name="cs_clicks_shop_created_idx"),
+        ),
+        migrations.AddField(
+            model_name="crosssellrecommendedshop",
+            name="impression",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="recommended_shop_links",
+                to="home.crosssellimpression",
+            ),
+        ),
+        migrations.AddField(
+            model_name="crosssellrecommendedshop",
+            name="recommended_shop",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, related_name="cross_sell_recommendations", to="home.shop"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="crosssellrecommendedshop",
+            index=models.Index(fields=["recommended_shop", "created_at"], name="cs_reco_shop_created_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="crosssellrecommendedshop",
+            constraint=models.UniqueConstraint(
+                fields=("impression", "recommended_shop"), name="cross_sell_recommended_shops_uniq"
+            ),
+        ),
+        migrations.RunSQL(LINK_RECOMMENDED_SHOPS_SQL, migrations.RunSQL.noop),
+        migrations.RunPython(resolve_click_targets, migrations.RunPython.noop),
+    ]
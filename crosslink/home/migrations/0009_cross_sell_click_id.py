@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0008_cross_sell_recommended_shops"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crosssellclick",
+            name="click_id",
+            field=models.CharField(blank=True, max_length=16, null=True, unique=True),
+        ),
+    ]
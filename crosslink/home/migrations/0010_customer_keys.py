@@ -0,0 +1,28 @@
+# Generated by Django 4.1 on 2026-10-18 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0009_cross_sell_click_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crosssellconversion",
+            name="customer_key",
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="crosssellimpression",
+            name="customer_key",
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="upsellimpression",
+            name="customer_key",
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+    ]
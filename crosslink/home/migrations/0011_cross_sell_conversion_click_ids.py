@@ -0,0 +1,21 @@
+# Generated by Django 4.1 on 2026-10-18 10:22
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0010_customer_keys"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crosssellconversion",
+            name="click_ids",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.CharField(max_length=16), default=list, size=None
+            ),
+        ),
+    ]
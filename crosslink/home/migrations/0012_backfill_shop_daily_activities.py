@@ -0,0 +1,79 @@
+# Generated by Django 4.1 on 2026-10-18 11:40
+
+from django.db import migrations
+
+METRICS = [
+    "upsell_impressions",
+    "cross_sell_impressions",
+    "upsell_clicks",
+    "cross_sell_clicks",
+    "upsell_total_sales",
+    "cross_sell_total_sales",
+    "upsell_sales",
+    "cross_sell_sales",
+]
+
+# Per shop and per day aggregations of the raw events, as in `Shop.daily_events`.
+EVENT_AGGREGATIONS = [
+    (
+        "upsell_impressions AS events JOIN upsell_widgets AS widgets ON widgets.id = events.upsell_widget_id",
+        "widgets.shop_id",
+        {"upsell_impressions": "count(*)"},
+    ),
+    (
+        "cross_sell_impression_recommended_shops AS events",
+        "events.recommended_shop_id",
+        {"cross_sell_impressions": "count(*)"},
+    ),
+    (
+        "upsell_conversions AS events"
+        " JOIN upsell_impressions AS impressions ON impressions.id = events.upsell_impression_id"
+        " JOIN upsell_widgets AS widgets ON widgets.id = impressions.upsell_widget_id",
+        "widgets.shop_id",
+        {
+            "upsell_clicks": "count(*)",
+            "upsell_total_sales": "count(*) FILTER (WHERE events.quantity > 0)",
+            "upsell_sales": "coalesce(sum(events.sales), 0)",
+        },
+    ),
+    (
+        "cross_sell_clicks AS events",
+        "events.recommended_shop_id",
+        {"cross_sell_clicks": "count(*)"},
+    ),
+    (
+        "cross_sell_conversions AS events JOIN shops ON shops.shop_url = events.purchase_shop_url",
+        "shops.id",
+        {"cross_sell_total_sales": "count(*)", "cross_sell_sales": "coalesce(sum(events.sales), 0)"},
+    ),
+]
+
+
+def backfill_sql(source: str, shop_id: str, aggregations: dict) -> str:
+    """
+    Overwrite the metrics of the days before today with their value computed from the raw events.
+    Today is left to the event write paths, which have been incrementing it since the rollups exist.
+    """
+    values = [aggregations.get(metric, "0") for metric in METRICS]
+    return f"""
+        INSERT INTO shop_daily_activities (created_at, updated_at, shop_id, date, {", ".join(METRICS)})
+        SELECT now(), now(), {shop_id}, (events.created_at AT TIME ZONE 'UTC')::date, {", ".join(values)}
+        FROM {source}
+        WHERE {shop_id} IS NOT NULL
+        AND events.created_at < date_trunc('day', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+        GROUP BY 3, 4
+        ON CONFLICT (shop_id, date) DO UPDATE SET
+        {", ".join(f"{metric} = EXCLUDED.{metric}" for metric in aggregations)}, updated_at = EXCLUDED.updated_at
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0011_cross_sell_conversion_click_ids"),
+    ]
+
+    operations = [
+        migrations.RunSQL(backfill_sql(*event_aggregation), migrations.RunSQL.noop)
+        for event_aggregation in EVENT_AGGREGATIONS
+    ]
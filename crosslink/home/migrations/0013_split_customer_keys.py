@@ -0,0 +1,59 @@
+# Generated by Django 4.1 on 2026-10-18 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0012_backfill_shop_daily_activities"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="crosssellconversion",
+            old_name="customer_key",
+            new_name="customer_email_key",
+        ),
+        migrations.RenameField(
+            model_name="crosssellimpression",
+            old_name="customer_key",
+            new_name="customer_email_key",
+        ),
+        migrations.RenameField(
+            model_name="upsellimpression",
+            old_name="customer_key",
+            new_name="customer_email_key",
+        ),
+        # Rows without email held the name key, it is recomputed by the next migration.
+        migrations.RunSQL(
+            "UPDATE cross_sell_conversions SET customer_email_key = NULL "
+            "WHERE customer_email IS NULL OR btrim(customer_email) = '';",
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            "UPDATE cross_sell_impressions SET customer_email_key = NULL "
+            "WHERE customer_email IS NULL OR btrim(customer_email) = '';",
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            "UPDATE upsell_impressions SET customer_email_key = NULL "
+            "WHERE customer_email IS NULL OR btrim(customer_email) = '';",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddField(
+            model_name="crosssellconversion",
+            name="customer_name_key",
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="crosssellimpression",
+            name="customer_name_key",
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="upsellimpression",
+            name="customer_name_key",
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.1 on 2026-10-18 16:40
+
+from django.db import migrations
+from django.db.models import Q
+from home.helpers.customer_helpers import customer_keys
+
+BATCH_SIZE = 1000
+
+
+def compute_customer_keys(apps, schema_editor):
+    """
+    Customer keys of the existing impressions and conversions that miss one, in batches, before the
+    customer fields they are computed from are dropped.
+    """
+    for model_name in ["CrossSellImpression", "UpsellImpression", "CrossSellConversion"]:
+        model = apps.get_model("home", model_name)
+        rows = (
+            model.objects.filter(
+                Q(customer_email_key__isnull=True, customer_email__isnull=False)
+                | Q(customer_name_key__isnull=True, customer_first_name__isnull=False, customer_last_name__isnull=False)
+            )
+            .order_by("id")
+            .only("id", "customer_email", "customer_first_name", "customer_last_name")
+        )
+        last_id = 0
+        while batch := list(rows.filter(id__gt=last_id)[:BATCH_SIZE]):
+            for row in batch:
+                for field, key in customer_keys(
+                    row.customer_email, row.customer_first_name, row.customer_last_name
+                ).items():
+                    setattr(row, field, key)
+            model.objects.bulk_update(batch, ["customer_email_key", "customer_name_key"])
+            last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0013_split_customer_keys"),
+    ]
+
+    operations = [
+        migrations.RunPython(compute_customer_keys, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="crosssellconversion",
+            name="customer_email",
+        ),
+        migrations.RemoveField(
+            model_name="crosssellconversion",
+            name="customer_first_name",
+        ),
+        migrations.RemoveField(
+            model_name="crosssellconversion",
+            name="customer_last_name",
+        ),
+        migrations.RemoveField(
+            model_name="crosssellimpression",
+            name="customer_email",
+        ),
+        migrations.RemoveField(
+            model_name="crosssellimpression",
+            name="customer_last_name",
+        ),
+        migrations.RemoveField(
+            model_name="upsellimpression",
+            name="customer_email",
+        ),
+        migrations.RemoveField(
+            model_name="upsellimpression",
+            name="customer_first_name",
+        ),
+        migrations.RemoveField(
+            model_name="upsellimpression",
+            name="customer_last_name",
+        ),
+    ]
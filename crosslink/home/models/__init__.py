@@ -1,5 +1,6 @@
 from home.models.base import *
 from home.models.cross_sell import *
+from home.models.daily_activity import *
 from home.models.discount import *
 from home.models.product import *
 from home.models.shop import *
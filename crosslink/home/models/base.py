@@ -41,9 +41,10 @@ class WidgetImpression(TimeStampMixin):
     order_id = models.BigIntegerField(null=True)
     checkout_token = models.CharField(max_length=256, null=True)
     customer_id = models.BigIntegerField(null=True)
-    customer_email = models.EmailField(null=True)
-    customer_first_name = models.CharField(max_length=128, null=True)
-    customer_last_name = models.CharField(max_length=128, null=True)
+    # Hashes of the normalized customer email and name, see `customer_keys`. Customers are only matched
+    # on these keys, their email and last name are not stored.
+    customer_email_key = models.CharField(max_length=64, null=True, db_index=True)
+    customer_name_key = models.CharField(max_length=64, null=True, db_index=True)
     page_url = models.URLField(max_length=1024, null=True)
 
     class Meta:
@@ -1,7 +1,10 @@
-from typing import List
+import secrets
+import uuid
+from typing import Dict, Iterable, List, Tuple
 
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.db import connection, models
+from home.helpers.widget_helpers import parse_rdir
 from home.models import TimeStampMixin, Widget, WidgetImpression
 
 
@@ -32,11 +35,43 @@ class CrossSellWidget(Widget):
         return ProductSerializer(products, many=True).data
 
 
+class CrossSellImpressionQuerySet(models.QuerySet):
+    def link_recommended_shops(self) -> int:
+        """
+        Insert the links between the impressions and the shops of their `recommended_shop_urls`
+        in a single statement. Existing links are left untouched.
+        Return the number of inserted links.
+        """
+        impressions_sql, params = self.order_by().values("id").query.sql_with_params()
+        shop_table = self.model._meta.get_field("recommended_shops").related_model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {CrossSellRecommendedShop._meta.db_table} (impression_id, recommended_shop_id, created_at)
+                SELECT impressions.id, shops.id, impressions.created_at
+                FROM {self.model._meta.db_table} AS impressions
+                JOIN {shop_table} AS shops ON shops.shop_url = ANY(impressions.recommended_shop_urls)
+                WHERE impressions.id IN ({impressions_sql})
+                ON CONFLICT (impression_id, recommended_shop_id) DO NOTHING
+                """,
+                params,
+            )
+            return cursor.rowcount
+
+
 class CrossSellImpression(WidgetImpression):
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    # Greets the customer in the widget title.
+    customer_first_name = models.CharField(max_length=128, null=True)
     purchase_shop_url = models.URLField()
     recommended_shop_urls = ArrayField(base_field=models.URLField(max_length=1000), default=list, blank=True)
+    recommended_shops = models.ManyToManyField(
+        "Shop", through="CrossSellRecommendedShop", related_name="recommended_cross_sell_impressions"
+    )
     cross_sell_widgets = models.ManyToManyField(CrossSellWidget, related_name="cross_sell_impressions")
 
+    objects = CrossSellImpressionQuerySet.as_manager()
+
     class Meta:
         db_table = "cross_sell_impressions"
         unique_together = ["purchase_shop_url", "checkout_token"]
@@ -55,24 +90,87 @@ class CrossSellImpression(WidgetImpression):
         return f"We would like you to discover our partners. We were seduced by their products which share our values."
 
 
+class CrossSellRecommendedShop(models.Model):
+    """
+    Link between an impression and each of its recommended shops. It holds the impression date so that
+    the impressions of a shop over a period are read with an index range scan.
+    """
+
+    impression = models.ForeignKey(CrossSellImpression, models.CASCADE, related_name="recommended_shop_links")
+    recommended_shop = models.ForeignKey("Shop", models.CASCADE, related_name="cross_sell_recommendations")
+    created_at = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = "cross_sell_impression_recommended_shops"
+        constraints = [
+            models.UniqueConstraint(fields=["impression", "recommended_shop"], name="cross_sell_recommended_shops_uniq")
+        ]
+        indexes = [models.Index(fields=["recommended_shop", "created_at"], name="cs_reco_shop_created_idx")]
+
+
 class CrossSellClick(TimeStampMixin):
     purchase_shop_url = models.URLField(null=True)
     rdir = models.URLField(max_length=500, null=True)
     checkout_page_url = models.URLField(max_length=1024, null=True)
     impression = models.ForeignKey(CrossSellImpression, models.CASCADE, related_name="clicks", null=True)
+    # Parsed from the `rdir` when the click is logged.
+    recommended_shop = models.ForeignKey(
+        "Shop", models.SET_NULL, related_name="cross_sell_clicks", null=True, blank=True
+    )
+    recommended_product = models.ForeignKey(
+        "Product", models.SET_NULL, related_name="cross_sell_clicks", null=True, blank=True
+    )
+    # Carried to the recommended shop in the UTM parameters, orders are attributed to the click by it.
+    click_id = models.CharField(max_length=16, unique=True, null=True, blank=True)
 
     class Meta:
         db_table = "cross_sell_clicks"
         unique_together = ["purchase_shop_url", "impression", "rdir"]
+        indexes = [models.Index(fields=["recommended_shop", "created_at"], name="cs_clicks_shop_created_idx")]
+
+    @staticmethod
+    def new_click_id() -> str:
+        return secrets.token_urlsafe(9)
+
+    @classmethod
+    def resolve_targets(cls, rdirs: Iterable[str]) -> Dict[str, Tuple[int | None, int | None]]:
+        """
+        Ids of the recommended shop and product that each redirection url points to, resolved with two queries.
+        """
+        parsed_rdirs = {rdir: parse_rdir(rdir) for rdir in rdirs if rdir}
+        shop_model = cls._meta.get_field("recommended_shop").related_model
+        product_model = cls._meta.get_field("recommended_product").related_model
+        shop_ids = dict(
+            shop_model.objects.filter(shop_url__in={shop_url for shop_url, _ in parsed_rdirs.values()}).values_list(
+                "shop_url", "id"
+            )
+        )
+        cms_product_handles = {handle for _, handle in parsed_rdirs.values() if handle}
+        product_ids = (
+            {
+                (shop_id, cms_product_handle): product_id
+                for shop_id, cms_product_handle, product_id in product_model.objects.filter(
+                    shop_id__in=shop_ids.values(), cms_product_handle__in=cms_product_handles
+                ).values_list("shop_id", "cms_product_handle", "id")
+            }
+            if shop_ids and cms_product_handles
+            else {}
+        )
+
+        return {
+            rdir: (shop_ids.get(shop_url), product_ids.get((shop_ids.get(shop_url), cms_product_handle)))
+            for rdir, (shop_url, cms_product_handle) in parsed_rdirs.items()
+        }
 
 
 class CrossSellConversion(TimeStampMixin):
     purchase_shop_url = models.URLField()
     checkout_token = models.CharField(max_length=256, null=True)
     customer_id = models.BigIntegerField(null=True)
-    customer_email = models.EmailField(null=True)
-    customer_first_name = models.CharField(max_length=128, null=True)
-    customer_last_name = models.CharField(max_length=128, null=True)
+    customer_email_key = models.CharField(max_length=64, null=True, db_index=True)
+    customer_name_key = models.CharField(max_length=64, null=True, db_index=True)
+    # Click ids of the landing site of the order, kept so that the order can be attributed again.
+    click_ids = ArrayField(base_field=models.CharField(max_length=16), default=list)
 
     cms_variant_ids = ArrayField(base_field=models.CharField(max_length=256), default=list)
     quantities = ArrayField(base_field=models.IntegerField(), default=list)
@@ -0,0 +1,36 @@
+from django.db import models
+from home.models import TimeStampMixin
+
+
+class ShopDailyActivity(TimeStampMixin):
+    """
+    Per shop and per day rollup of the widget events, split by upsell and cross sell.
+    Counters are incremented by the event write paths and can be recomputed from the raw events
+    with the `rebuild_activity_rollups` command.
+    """
+
+    shop = models.ForeignKey("Shop", models.CASCADE, related_name="daily_activities")
+    date = models.DateField()
+    upsell_impressions = models.IntegerField(default=0)
+    cross_sell_impressions = models.IntegerField(default=0)
+    upsell_clicks = models.IntegerField(default=0)
+    cross_sell_clicks = models.IntegerField(default=0)
+    upsell_total_sales = models.IntegerField(default=0)
+    cross_sell_total_sales = models.IntegerField(default=0)
+    upsell_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cross_sell_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    METRICS = [
+        "upsell_impressions",
+        "cross_sell_impressions",
+        "upsell_clicks",
+        "cross_sell_clicks",
+        "upsell_total_sales",
+        "cross_sell_total_sales",
+        "upsell_sales",
+        "cross_sell_sales",
+    ]
+
+    class Meta:
+        db_table = "shop_daily_activities"
+        constraints = [models.UniqueConstraint(fields=["shop", "date"], name="shop_daily_activities_shop_date_uniq")]
@@ -1,9 +1,29 @@
 from django.contrib.postgres.fields import ArrayField
 from django.db import models
-from django.db.models import Sum
+from django.db.models import Exists, Min, OuterRef, Subquery, Sum
 from home.models import TimeStampMixin
 
 
+class ProductQuerySet(models.QuerySet):
+    def refresh_variant_summary(self) -> int:
+        """
+        Recompute the variant columns of the products (price, min price, inventory, stock)
+        in a single UPDATE. To be called after any write to the variants of the products.
+        """
+        variants = Variant.objects.filter(product=OuterRef("pk"))
+        variant_totals = variants.order_by().values("product")
+        return self.update(
+            price=Subquery(variants.order_by("pk").values("price")[:1]),
+            min_price=Subquery(variant_totals.annotate(min_price=Min("price")).values("min_price")),
+            inventory_quantity=Subquery(
+                variant_totals.annotate(total_inventory_quantity=Sum("inventory_quantity")).values(
+                    "total_inventory_quantity"
+                )
+            ),
+            in_stock=Exists(variants.filter(inventory_quantity__gt=0)),
+        )
+
+
 class Product(TimeStampMixin):
     shop = models.ForeignKey("Shop", models.CASCADE, related_name="products")
     title = models.TextField(null=True)
@@ -13,14 +33,17 @@ class Product(TimeStampMixin):
     cms_product_handle = models.TextField(null=True)
     variant_options = ArrayField(base_field=models.JSONField(), null=True)
     description = models.TextField(null=True)
+    # Denormalized from the variants by `ProductQuerySet.refresh_variant_summary`, null without variants.
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    inventory_quantity = models.IntegerField(null=True)
+    in_stock = models.BooleanField(default=False)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         db_table = "products"
-
-    @property
-    def price(self) -> str:
-        variant = self.variants.select_related("product").first()
-        return variant.price if variant else ""
+        indexes = [models.Index(fields=["shop", "cms_product_id"], name="products_shop_cms_product_idx")]
 
     @property
     def visit_url(self) -> str:
@@ -32,10 +55,6 @@ class Product(TimeStampMixin):
             return self.title[:40] + "..."
         return self.title
 
-    @property
-    def inventory_quantity(self) -> int:
-        return self.variants.aggregate(Sum("inventory_quantity"))["inventory_quantity__sum"]
-
 
 class Variant(TimeStampMixin):
     shop_url = models.URLField()
@@ -1,20 +1,24 @@
-from datetime import datetime
+from datetime import date, datetime, time, timedelta, timezone
 from decimal import Decimal
 from pathlib import PurePosixPath
-from typing import Dict, Tuple
+from typing import Dict
 
 from django.apps import apps
 from django.db import models
 from home.dataclasses.dashboard import ShopActivity
-from home.models import CMS, CrossSellClick, CrossSellConversion, CrossSellImpression, TimeStampMixin
+from home.helpers.metric_helpers import DailyMetricArrays
+from home.models import (
+    CMS,
+    CrossSellClick,
+    CrossSellConversion,
+    CrossSellRecommendedShop,
+    ShopDailyActivity,
+    TimeStampMixin,
+)
 from home.models.upsell import UpsellConversion, UpsellImpression
-from home.utils import daterange, group_by_day, sum_by_day
+from home.utils import DailySeries, aggregate_by_day
 
-CreatedAtDateRange = Dict[str, Tuple[datetime, datetime]]
-DailyActivity = Tuple[
-    Tuple[ShopActivity.SectionDailyCount, ShopActivity.SectionDailyCount, ShopActivity.SectionDailyCount],
-    Tuple[ShopActivity.SectionDailyValue, ShopActivity.SectionDailyValue, ShopActivity.SectionDailyValue],
-]
+DailyMetrics = Dict[str, int | Decimal]
 
 
 class Shop(TimeStampMixin):
@@ -59,25 +63,44 @@ class Shop(TimeStampMixin):
             )
         )
 
-    def impressions(self, created_at_date_range: CreatedAtDateRange) -> ShopActivity.SectionCount:
-        upsell_impressions_count = UpsellImpression.objects.filter(
-            upsell_widget__shop__id=self.id, **created_at_date_range
-        ).count()
-        cross_sell_impressions_count = CrossSellImpression.objects.filter(
-            recommended_shop_urls__contains=[self.shop_url], **created_at_date_range
-        ).count()
-
-        return ShopActivity.SectionCount(upsell_impressions_count, cross_sell_impressions_count)
-
-    def clicks(self, created_at_date_range: CreatedAtDateRange) -> ShopActivity.SectionCount:
-        upsell_clicks_count = UpsellConversion.objects.filter(
-            upsell_impression__upsell_widget__shop__id=self.id, **created_at_date_range
-        ).count()
-        cross_sell_clicks_count = CrossSellClick.objects.filter(
-            rdir__icontains=self.shop_url, **created_at_date_range
-        ).count()
+    def daily_events(self, start_date: date, end_date: date) -> Dict[str, DailySeries]:
+        """
+        Daily series of the activity metrics of the shop between two days, computed from the raw events
+        with one grouped query per event table.
+        """
+        created_at_range = {
+            "created_at__gte": datetime.combine(start_date, time.min, tzinfo=timezone.utc),
+            "created_at__lt": datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=timezone.utc),
+        }
+        upsell_conversions = UpsellConversion.objects.filter(
+            upsell_impression__upsell_widget__shop_id=self.id, **created_at_range
+        )
 
-        return ShopActivity.SectionCount(upsell_clicks_count, cross_sell_clicks_count)
+        return (
+            aggregate_by_day(
+                UpsellImpression.objects.filter(upsell_widget__shop_id=self.id, **created_at_range),
+                upsell_impressions=models.Count("id"),
+            )
+            | aggregate_by_day(
+                CrossSellRecommendedShop.objects.filter(recommended_shop_id=self.id, **created_at_range),
+                cross_sell_impressions=models.Count("id"),
+            )
+            | aggregate_by_day(
+                upsell_conversions,
+                upsell_clicks=models.Count("id"),
+                upsell_total_sales=models.Count("id", filter=models.Q(quantity__gt=0)),
+                upsell_sales=models.Sum("sales"),
+            )
+            | aggregate_by_day(
+                CrossSellClick.objects.filter(recommended_shop_id=self.id, **created_at_range),
+                cross_sell_clicks=models.Count("id"),
+            )
+            | aggregate_by_day(
+                CrossSellConversion.objects.filter(purchase_shop_url=self.shop_url, **created_at_range),
+                cross_sell_total_sales=models.Count("id"),
+                cross_sell_sales=models.Sum("sales"),
+            )
+        )
 
     def ctr(
         self, clicks: ShopActivity.SectionCount, impressions: ShopActivity.SectionCount
@@ -91,30 +114,6 @@ class Shop(TimeStampMixin):
 
         return ShopActivity.SectionDailyValue(upsell_ctr, cross_sell_ctr)
 
-    def sales(self, created_at_date_range: CreatedAtDateRange) -> ShopActivity.SectionValue:
-        upsell_conversions = UpsellConversion.objects.filter(
-            upsell_impression__upsell_widget__shop__id=self.id, **created_at_date_range
-        )
-        upsell_sales = Decimal(sum([upsell_conversion.sales for upsell_conversion in upsell_conversions]))
-        cross_sell_sales = Decimal(
-            CrossSellConversion.objects.filter(purchase_shop_url=self.shop_url, **created_at_date_range).aggregate(
-                models.Sum("sales")
-            )["sales__sum"]
-            or 0
-        ).quantize(Decimal("0.01"))
-
-        return ShopActivity.SectionValue(upsell_sales, cross_sell_sales)
-
-    def total_sales(self, created_at_date_range: CreatedAtDateRange) -> ShopActivity.SectionCount:
-        upsell_total_sales = UpsellConversion.objects.filter(
-            upsell_impression__upsell_widget__shop__id=self.id, quantity__gt=0, **created_at_date_range
-        ).count()
-        cross_sell_total_sales = CrossSellConversion.objects.filter(
-            purchase_shop_url=self.shop_url, **created_at_date_range
-        ).count()
-
-        return ShopActivity.SectionCount(upsell_total_sales, cross_sell_total_sales)
-
     def cr(
         self, total_sales: ShopActivity.SectionCount, clicks: ShopActivity.SectionCount
     ) -> ShopActivity.SectionValue:
@@ -125,140 +124,60 @@ class Shop(TimeStampMixin):
 
         return ShopActivity.SectionValue(upsell_cr, cross_sell_cr)
 
-    def daily_activity(
-        self, start_date: datetime, end_date: datetime, created_at_date_range: CreatedAtDateRange
-    ) -> DailyActivity:
-        daily_upsell_impressions = group_by_day(
-            UpsellImpression.objects.filter(upsell_widget__shop__id=self.id, **created_at_date_range)
-        )
-        daily_cross_sell_impressions = group_by_day(
-            CrossSellImpression.objects.filter(recommended_shop_urls__contains=[self.shop_url], **created_at_date_range)
-        )
-
-        daily_upsell_clicks = group_by_day(
-            UpsellConversion.objects.filter(upsell_impression__upsell_widget__shop__id=self.id, **created_at_date_range)
-        )
-        daily_cross_sell_clicks = group_by_day(
-            CrossSellClick.objects.filter(rdir__icontains=self.shop_url, **created_at_date_range)
-        )
-
-        daily_upsell_total_sales = group_by_day(
-            UpsellConversion.objects.filter(
-                upsell_impression__upsell_widget__shop__id=self.id, quantity__gt=0, **created_at_date_range
+    def daily_metrics(self, start_date: date, end_date: date) -> Dict[date, DailyMetrics]:
+        """
+        Metrics of the days between two dates read from the daily rollups, in one query.
+        Days without rollup are missing.
+        """
+        return {
+            daily_values["date"]: {metric: daily_values[metric] for metric in ShopDailyActivity.METRICS}
+            for daily_values in self.daily_activities.filter(date__range=(start_date, end_date)).values(
+                "date", *ShopDailyActivity.METRICS
             )
-        )
-        daily_cross_sell_total_sales = group_by_day(
-            CrossSellConversion.objects.filter(purchase_shop_url=self.shop_url, **created_at_date_range)
-        )
-
-        daily_upsell_sales = sum_by_day(
-            UpsellConversion.objects.filter(
-                upsell_impression__upsell_widget__shop__id=self.id, **created_at_date_range
-            ),
-            lambda x: x.sales,
-        )
-        daily_cross_sell_sales = sum_by_day(
-            CrossSellConversion.objects.filter(purchase_shop_url=self.shop_url, **created_at_date_range),
-            lambda x: x.sales,
-        )
-
-        daily_upsell_ctrs = {
-            date: (
-                100 * Decimal(daily_upsell_clicks.get(date, 0)) / Decimal(impressions)
-                if impressions > 0
-                else Decimal(0)
-            )
-            for date, impressions in daily_upsell_impressions.items()
-        }
-        daily_cross_sell_ctrs = {
-            date: (
-                100 * Decimal(daily_cross_sell_clicks.get(date, 0)) / Decimal(impressions)
-                if impressions > 0
-                else Decimal(0)
-            )
-            for date, impressions in daily_cross_sell_impressions.items()
-        }
-
-        daily_upsell_crs = {
-            date: 100 * Decimal(daily_upsell_total_sales.get(date, 0)) / Decimal(clicks) if clicks > 0 else Decimal(0)
-            for date, clicks in daily_upsell_clicks.items()
-        }
-        daily_cross_sell_crs = {
-            date: (
-                100 * Decimal(daily_cross_sell_total_sales.get(date, 0)) / Decimal(clicks) if clicks > 0 else Decimal(0)
-            )
-            for date, clicks in daily_cross_sell_clicks.items()
         }
 
-        daily_infos = [
-            daily_upsell_impressions,
-            daily_cross_sell_impressions,
-            daily_upsell_clicks,
-            daily_cross_sell_clicks,
-            daily_upsell_total_sales,
-            daily_cross_sell_total_sales,
-            daily_upsell_sales,
-            daily_cross_sell_sales,
-            daily_upsell_ctrs,
-            daily_cross_sell_ctrs,
-            daily_upsell_crs,
-            daily_cross_sell_crs,
-        ]
-
-        for dt in daterange(start_date, end_date):
-            date = str(dt.date())
-            for daily_info in daily_infos:
-                if date not in daily_info:
-                    daily_info[date] = 0
-
-        for daily_info in daily_infos:
-            sorted_dict = dict(sorted(daily_info.items()))
-            daily_info.clear()
-            daily_info.update(sorted_dict)
-
-        return (
-            (
-                ShopActivity.SectionDailyCount(
-                    daily_upsell_impressions,
-                    daily_cross_sell_impressions,
-                ),
-                ShopActivity.SectionDailyCount(
-                    daily_upsell_clicks,
-                    daily_cross_sell_clicks,
-                ),
-                ShopActivity.SectionDailyCount(
-                    daily_upsell_total_sales,
-                    daily_cross_sell_total_sales,
-                ),
-            ),
-            (
-                ShopActivity.SectionDailyValue(
-                    daily_upsell_sales,
-                    daily_cross_sell_sales,
-                ),
-                ShopActivity.SectionDailyValue(daily_upsell_ctrs, daily_cross_sell_ctrs),
-                ShopActivity.SectionDailyValue(daily_upsell_crs, daily_cross_sell_crs),
-            ),
+    def activity(
+        self, start_date: datetime, end_date: datetime, daily_metrics: Dict[date, DailyMetrics] | None = None
+    ) -> ShopActivity:
+        """
+        Activity of the shop between two dates, built from the given daily metrics or read from the daily rollups.
+        """
+        if daily_metrics is None:
+            daily_metrics = self.daily_metrics(start_date.date(), end_date.date())
+        daily = DailyMetricArrays(
+            start_date.date(),
+            end_date.date(),
+            daily_metrics,
+            ShopDailyActivity.METRICS,
+            amount_metrics={"upsell_sales", "cross_sell_sales"},
         )
 
-    def activity(self, start_date: datetime, end_date: datetime) -> ShopActivity:
-        created_at_date_range = {"created_at__range": (start_date, end_date)}
-
-        impressions = self.impressions(created_at_date_range)
-        clicks = self.clicks(created_at_date_range)
-        ctr = self.ctr(clicks, impressions)
-        sales = self.sales(created_at_date_range)
-        total_sales = self.total_sales(created_at_date_range)
-        cr = self.cr(total_sales, clicks)
-        daily_activity_counts, daily_activity_values = self.daily_activity(start_date, end_date, created_at_date_range)
+        impressions = ShopActivity.SectionCount(
+            daily.total("upsell_impressions"), daily.total("cross_sell_impressions")
+        )
+        clicks = ShopActivity.SectionCount(daily.total("upsell_clicks"), daily.total("cross_sell_clicks"))
+        total_sales = ShopActivity.SectionCount(
+            daily.total("upsell_total_sales"), daily.total("cross_sell_total_sales")
+        )
+        sales = ShopActivity.SectionValue(daily.total("upsell_sales"), daily.total("cross_sell_sales"))
 
         return ShopActivity(
             impressions,
             clicks,
             total_sales,
             sales,
-            ctr,
-            cr,
-            *daily_activity_counts,
-            *daily_activity_values,
+            self.ctr(clicks, impressions),
+            self.cr(total_sales, clicks),
+            ShopActivity.SectionDailyCount(daily.series("upsell_impressions"), daily.series("cross_sell_impressions")),
+            ShopActivity.SectionDailyCount(daily.series("upsell_clicks"), daily.series("cross_sell_clicks")),
+            ShopActivity.SectionDailyCount(daily.series("upsell_total_sales"), daily.series("cross_sell_total_sales")),
+            ShopActivity.SectionDailyValue(daily.series("upsell_sales"), daily.series("cross_sell_sales")),
+            ShopActivity.SectionDailyRate(
+                daily.rate_series("upsell_clicks", "upsell_impressions"),
+                daily.rate_series("cross_sell_clicks", "cross_sell_impressions"),
+            ),
+            ShopActivity.SectionDailyRate(
+                daily.rate_series("upsell_total_sales", "upsell_clicks"),
+                daily.rate_series("cross_sell_total_sales", "cross_sell_clicks"),
+            ),
         )
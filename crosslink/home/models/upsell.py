@@ -1,6 +1,7 @@
 from decimal import Decimal
 
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from home.models import DiscountType, Product, TimeStampMixin, Widget, WidgetImpression
 
@@ -16,6 +17,7 @@ class UpsellWidget(Widget):
 
     class Meta:
         db_table = "upsell_widgets"
+        indexes = [GinIndex(fields=["trigger_product_ids"], name="upsell_widgets_triggers_gin")]
 
     @property
     def detailed_upsell_product(self) -> dict:
@@ -59,6 +61,19 @@ class UpsellWidget(Widget):
             for variant in variants
         ]
 
+    def apply_discount(self, price: Decimal) -> Decimal:
+        """
+        Return the price of the upsell product once the widget discount is applied.
+        """
+        if self.discount_type == DiscountType.PERCENTAGE.value:
+            final_price = max(price * (Decimal(1) - self.discount_value / Decimal(100)), Decimal(0))
+        elif self.discount_type == DiscountType.FIXED_AMOUNT.value:
+            final_price = max(price - self.discount_value, Decimal(0))
+        else:
+            final_price = price
+
+        return round(final_price, 2)
+
 
 class UpsellImpression(WidgetImpression):
     upsell_widget = models.ForeignKey("UpsellWidget", models.CASCADE, related_name="upsell_impressions")
@@ -72,16 +87,12 @@ class UpsellConversion(TimeStampMixin):
     upsell_impression = models.OneToOneField(UpsellImpression, models.CASCADE, related_name="upsell_conversion")
     variant = models.ForeignKey("Variant", models.CASCADE, related_name="upsell_conversions")
     quantity = models.IntegerField(default=0)
+    # Discounted amount of the converted line, computed by `line_sales` when the conversion is saved.
+    sales = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     class Meta:
         db_table = "upsell_conversions"
 
-    @property
-    def sales(self):
-        discount_value = self.upsell_impression.upsell_widget.discount_value
-        discount_type = self.upsell_impression.upsell_widget.discount_type
-        if discount_type == DiscountType.PERCENTAGE:
-            discounted_price = self.variant.price * (Decimal(1) - discount_value / Decimal(100))
-        else:
-            discounted_price = abs(self.variant.price - discount_value)
-        return self.quantity * discounted_price
+    @staticmethod
+    def line_sales(upsell_widget: UpsellWidget, variant_price: Decimal, quantity: int) -> Decimal:
+        return quantity * upsell_widget.apply_discount(variant_price)
@@ -1,5 +1,6 @@
 from home.serializers.cross_sell import *
 from home.serializers.dashboard import *
+from home.serializers.export import *
 from home.serializers.product import *
 from home.serializers.shop import *
 from home.serializers.upsell import *
@@ -13,7 +13,15 @@ class CrossSellWidgetSerializer(serializers.ModelSerializer):
 
 
 class CrossSellImpressionSerializer(serializers.ModelSerializer):
+    cross_sell_widgets = serializers.SerializerMethodField()
 
     class Meta:
         model = CrossSellImpression
-        fields = "__all__"
+        exclude = ["recommended_shops"]
+
+    def get_cross_sell_widgets(self, cross_sell_impression: CrossSellImpression):
+        # Impressions built by the cross sell service already carry their widget ids,
+        # and buffered impressions are not saved yet.
+        if hasattr(cross_sell_impression, "cross_sell_widget_ids"):
+            return cross_sell_impression.cross_sell_widget_ids
+        return list(cross_sell_impression.cross_sell_widgets.values_list("id", flat=True))
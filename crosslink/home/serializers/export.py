@@ -0,0 +1,10 @@
+from home.services.export import EXPORT_FILE_FORMATS, EventExportService
+from rest_framework import serializers
+
+
+class EventExportRequestSerializer(serializers.Serializer):
+    event = serializers.ChoiceField(choices=list(EventExportService.EVENTS))
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    # Not `format`, which DRF reserves for the renderer selection.
+    file_format = serializers.ChoiceField(choices=EXPORT_FILE_FORMATS, default="csv")
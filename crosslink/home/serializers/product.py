@@ -4,12 +4,17 @@ from rest_framework import serializers
 
 class ProductSerializer(serializers.ModelSerializer):
     shortened_title = serializers.ReadOnlyField()
-    price = serializers.ReadOnlyField()
-    inventory_quantity = serializers.ReadOnlyField()
+    # Same output as the former variant based property: a number, or "" for products without variants.
+    price = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = "__all__"
+        # Denormalized from the variants, see `ProductQuerySet.refresh_variant_summary`.
+        read_only_fields = ("price", "min_price", "inventory_quantity", "in_stock")
+
+    def get_price(self, obj):
+        return obj.price if obj.price is not None else ""
 
 
 class ProductESSerializer(serializers.Serializer):
@@ -0,0 +1,175 @@
+import logging
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Dict
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import DecimalField
+from django.utils import timezone
+from home.extensions.redis import redis_client
+from home.models import Shop, ShopDailyActivity
+from home.services.dashboard import DashboardCache
+from home.utils import daterange
+from redis import RedisError, ResponseError
+
+logger = logging.getLogger(__file__)
+
+ActivityDeltas = Dict[str, int | Decimal]
+
+# Redis hash of the deltas not written to the rollups yet, in write-behind mode, and the hash being written.
+ACTIVITY_DELTAS_KEY = "activity:deltas"
+ACTIVITY_FLUSHING_KEY = "activity:deltas:flushing"
+# Set for `ACTIVITY_ROLLUP_FLUSH_INTERVAL` seconds by the write that flushes the deltas.
+ACTIVITY_FLUSH_DUE_KEY = "activity:deltas:flushed"
+ACTIVITY_FLUSH_LOCK_KEY = "activity:deltas:lock"
+ACTIVITY_FLUSH_LOCK_TIMEOUT = 300
+
+
+class ShopActivityRollup:
+    @classmethod
+    def increment(
+        cls, deltas_by_shop: Dict[int | str, ActivityDeltas], shop_field: str = "id", day: date | None = None
+    ) -> None:
+        """
+        Add metric deltas to the rollups of `day` (today by default).
+        Shops are identified by `shop_field`, `id` or `shop_url`. Unknown shops are ignored.
+        In write-behind mode the deltas are added to a Redis hash once the transaction commits, and
+        written in batches, so that the hot rows of today are not upserted by every event.
+        """
+        deltas_by_shop = {shop_key: deltas for shop_key, deltas in deltas_by_shop.items() if any(deltas.values())}
+        if not deltas_by_shop:
+            return
+
+        day = day or timezone.now().date()
+        if apps.get_app_config("home").ACTIVITY_ROLLUP_WRITE_BEHIND:
+            transaction.on_commit(lambda: cls.buffer(deltas_by_shop, shop_field, day))
+        else:
+            cls.write(deltas_by_shop, shop_field, day)
+
+    @staticmethod
+    def is_decimal(metric: str) -> bool:
+        return isinstance(ShopDailyActivity._meta.get_field(metric), DecimalField)
+
+    @classmethod
+    def buffer(cls, deltas_by_shop: Dict[int | str, ActivityDeltas], shop_field: str, day: date) -> None:
+        """
+        Add the deltas to the Redis hash, amounts in cents, and flush the hash if it is due.
+        The deltas are written right away if Redis is unavailable.
+        """
+        try:
+            pipeline = redis_client.pipeline()
+            for shop_key, deltas in deltas_by_shop.items():
+                for metric, delta in deltas.items():
+                    if delta:
+                        pipeline.hincrby(
+                            ACTIVITY_DELTAS_KEY,
+                            f"{day.isoformat()}:{metric}:{shop_field}:{shop_key}",
+                            int(round(Decimal(str(delta)) * 100)) if cls.is_decimal(metric) else delta,
+                        )
+            pipeline.execute()
+        except RedisError as e:
+            logger.error(f"Activity rollup buffer unavailable, writing the deltas synchronously: {e}")
+            cls.write(deltas_by_shop, shop_field, day)
+            return
+
+        try:
+            flush_interval = apps.get_app_config("home").ACTIVITY_ROLLUP_FLUSH_INTERVAL
+            if redis_client.set(ACTIVITY_FLUSH_DUE_KEY, 1, nx=True, ex=flush_interval):
+                cls.flush()
+        except RedisError as e:
+            logger.error(f"Unable to flush the activity rollup buffer: {e}")
+
+    @classmethod
+    def flush(cls) -> int:
+        """
+        Write the buffered deltas with one statement per day in a single transaction.
+        A hash whose write failed is written again by the next flush, before the newer deltas.
+        Return the number of written deltas.
+        """
+        lock = redis_client.lock(ACTIVITY_FLUSH_LOCK_KEY, timeout=ACTIVITY_FLUSH_LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            return 0
+
+        try:
+            if not redis_client.exists(ACTIVITY_FLUSHING_KEY):
+                try:
+                    redis_client.rename(ACTIVITY_DELTAS_KEY, ACTIVITY_FLUSHING_KEY)
+                except ResponseError:
+                    # No buffered deltas.
+                    return 0
+
+            deltas = redis_client.hgetall(ACTIVITY_FLUSHING_KEY)
+            deltas_by_day = defaultdict(lambda: defaultdict(dict))
+            for field, delta in deltas.items():
+                day, metric, shop_field, shop_key = field.split(":", 3)
+                deltas_by_day[(date.fromisoformat(day), shop_field)][int(shop_key) if shop_field == "id" else shop_key][
+                    metric
+                ] = (Decimal(delta) / 100 if cls.is_decimal(metric) else int(delta))
+
+            with transaction.atomic():
+                for (day, shop_field), deltas_by_shop in deltas_by_day.items():
+                    cls.write(deltas_by_shop, shop_field, day)
+            redis_client.delete(ACTIVITY_FLUSHING_KEY)
+            return len(deltas)
+        finally:
+            lock.release()
+
+    @classmethod
+    def write(cls, deltas_by_shop: Dict[int | str, ActivityDeltas], shop_field: str, day: date) -> None:
+        """
+        Add metric deltas to the rollups of `day` in a single statement.
+        The cached dashboard metrics of a past day are dropped once the transaction commits.
+        """
+        now = timezone.now()
+        fields = [ShopDailyActivity._meta.get_field(metric) for metric in ShopDailyActivity.METRICS]
+        columns = ", ".join(field.column for field in fields)
+        table = ShopDailyActivity._meta.db_table
+        casted_columns = [f"v.{field.column}::{field.db_type(connection)}" for field in fields]
+        row_sql = "(" + ", ".join(["%s"] * (len(fields) + 1)) + ")"
+        params = [now, now, day]
+        for shop_key, deltas in deltas_by_shop.items():
+            params += [shop_key] + [deltas.get(field.name, 0) for field in fields]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (created_at, updated_at, date, shop_id, {columns})
+                SELECT %s, %s, %s, shops.id, {", ".join(casted_columns)}
+                FROM (VALUES {", ".join([row_sql] * len(deltas_by_shop))}) AS v(shop_key, {columns})
+                JOIN {Shop._meta.db_table} AS shops ON shops.{Shop._meta.get_field(shop_field).column} = v.shop_key
+                ON CONFLICT (shop_id, date) DO UPDATE SET
+                {", ".join(f"{field.column} = {table}.{field.column} + EXCLUDED.{field.column}" for field in fields)},
+                updated_at = EXCLUDED.updated_at
+                RETURNING shop_id
+                """,
+                params,
+            )
+            shop_ids = [shop_id for (shop_id,) in cursor.fetchall()]
+
+        if shop_ids and day < now.date():
+            transaction.on_commit(lambda: DashboardCache.invalidate_day(shop_ids, day))
+
+    @classmethod
+    def rebuild(cls, shop: Shop, start_date: date, end_date: date) -> None:
+        """
+        Recompute the rollups of the shop between `start_date` and `end_date` from its raw events.
+        """
+        daily_values = {metric: dict(series) for metric, series in shop.daily_events(start_date, end_date).items()}
+        daily_activities = [
+            ShopDailyActivity(
+                shop=shop,
+                date=day,
+                **{metric: daily_values[metric].get(day) or 0 for metric in ShopDailyActivity.METRICS},
+            )
+            for day in daterange(start_date, end_date)
+        ]
+
+        ShopDailyActivity.objects.bulk_create(
+            daily_activities,
+            update_conflicts=True,
+            unique_fields=["shop_id", "date"],
+            update_fields=ShopDailyActivity.METRICS + ["updated_at"],
+        )
+        DashboardCache.invalidate(shop.id, start_date, end_date)
@@ -0,0 +1,423 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from home.extensions.redis import RedisStreamBuffer
+from home.helpers.customer_helpers import customer_keys
+from home.models import (
+    CrossSellClick,
+    CrossSellConversion,
+    CrossSellImpression,
+    CrossSellWidget,
+    Product,
+    UpsellConversion,
+    UpsellImpression,
+    UpsellWidget,
+    Variant,
+)
+from home.services.activity import ShopActivityRollup
+
+logger = logging.getLogger(__file__)
+
+CONVERSION_STREAM_KEY = "upsell:conversions"
+CONVERSION_STREAM_GROUP = "conversion-drainers"
+
+# Bounds of the customer matching of the orders without click id.
+FALLBACK_ATTRIBUTION_WINDOW = timedelta(days=30)
+FALLBACK_MAX_IMPRESSIONS = 100
+
+ConversionPayload = Dict
+OrderPayload = Dict
+
+
+class UpsellConversionBuffer(RedisStreamBuffer):
+    """
+    Write-behind buffer of upsell conversions, used when `UPSELL_CONVERSION_WRITE_BEHIND` is set
+    and drained by the `drain_buffer upsell_conversions` command.
+    A payload holds the `upsell_widget_id`, `checkout_token`, Shopify `variant_id` and `quantity`
+    of an accepted offer.
+    """
+
+    STREAM_KEY = CONVERSION_STREAM_KEY
+    STREAM_GROUP = CONVERSION_STREAM_GROUP
+    MESSAGE_FIELD = "conversion"
+
+    @classmethod
+    def save_batch(cls, payloads: List[ConversionPayload]) -> int:
+        """
+        Resolve the impressions and the shop scoped variants of the batch in bulk and insert the
+        conversions. Conversions of an impression that already converted are skipped, so that
+        retried sign changesets and replayed batches are no-ops.
+        Return the number of conversions sent to the database.
+        """
+        upsell_widgets = UpsellWidget.objects.in_bulk({payload["upsell_widget_id"] for payload in payloads})
+        impression_ids = {
+            (upsell_widget_id, checkout_token): impression_id
+            for upsell_widget_id, checkout_token, impression_id in UpsellImpression.objects.filter(
+                upsell_widget_id__in=upsell_widgets,
+                checkout_token__in={payload["checkout_token"] for payload in payloads},
+            ).values_list("upsell_widget_id", "checkout_token", "id")
+        }
+        variants = {
+            (shop_id, cms_variant_id): (variant_id, variant_price)
+            for shop_id, cms_variant_id, variant_id, variant_price in Variant.objects.filter(
+                product__shop_id__in={upsell_widget.shop_id for upsell_widget in upsell_widgets.values()},
+                cms_variant_id__in={str(payload["variant_id"]) for payload in payloads},
+            ).values_list("product__shop_id", "cms_variant_id", "id", "price")
+        }
+        converted_impression_ids = set(
+            UpsellConversion.objects.filter(upsell_impression_id__in=impression_ids.values()).values_list(
+                "upsell_impression_id", flat=True
+            )
+        )
+
+        conversions = []
+        activity_deltas = defaultdict(Counter)
+        for payload in payloads:
+            upsell_widget = upsell_widgets.get(payload["upsell_widget_id"])
+            impression_id = impression_ids.get((payload["upsell_widget_id"], payload["checkout_token"]))
+            variant = variants.get((upsell_widget.shop_id, str(payload["variant_id"]))) if upsell_widget else None
+            if not impression_id or not variant:
+                logger.warning(f"Upsell conversion skipped, unknown impression or variant: {payload}")
+                continue
+
+            if impression_id in converted_impression_ids:
+                continue
+
+            variant_id, variant_price = variant
+            conversion = UpsellConversion(
+                upsell_impression_id=impression_id,
+                variant_id=variant_id,
+                quantity=payload["quantity"],
+                sales=UpsellConversion.line_sales(upsell_widget, variant_price, payload["quantity"]),
+            )
+            conversions.append(conversion)
+            converted_impression_ids.add(impression_id)
+            activity_deltas[upsell_widget.shop_id].update(
+                {
+                    "upsell_clicks": 1,
+                    "upsell_total_sales": int(conversion.quantity > 0),
+                    "upsell_sales": conversion.sales,
+                }
+            )
+
+        with transaction.atomic():
+            UpsellConversion.objects.bulk_create(conversions, ignore_conflicts=True)
+            ShopActivityRollup.increment(activity_deltas)
+        return len(conversions)
+
+
+class CrossSellConversionService:
+    """
+    Attribution of the orders of recommended shops to the cross sell clicks and impressions that led to them.
+    An order payload holds the `shop_url`, `checkout_token`, customer fields or their keys, the `cms_variant_ids`,
+    `cms_product_ids`, `quantities` and `total_prices` of its lines, the `click_ids` of its landing site
+    and optionally the `ordered_at` time the attribution window ends at, now by default.
+    """
+
+    @staticmethod
+    def order_time(order: OrderPayload, now: datetime) -> datetime:
+        """
+        Time of the order, the `ordered_at` of the payload is an ISO 8601 string once it went through Kafka.
+        """
+        ordered_at = order.get("ordered_at")
+        if isinstance(ordered_at, str):
+            ordered_at = parse_datetime(ordered_at)
+        return ordered_at or now
+
+    @staticmethod
+    def order_customer_keys(order: OrderPayload) -> Dict[str, str | None]:
+        """
+        Customer keys of the order, computed from its customer fields unless the payload already holds them.
+        """
+        if "customer_email_key" in order:
+            return {field: order[field] for field in ["customer_email_key", "customer_name_key"]}
+        return customer_keys(order["customer_email"], order["customer_first_name"], order["customer_last_name"])
+
+    @classmethod
+    def match_customers(cls, orders: List[OrderPayload]) -> Dict[Tuple[str, str], Tuple[List[int], List[int]]]:
+        """
+        Ids of the clicks and impressions of the customer of each order in the attribution window before it,
+        by (`shop_url`, `checkout_token`). The impressions are matched on the customer email or name key and
+        the clicks on the handles of the purchased products.
+        The candidate impressions, products and clicks of the whole batch are read in one query each.
+        """
+        now = timezone.now()
+        customers = {
+            (order["shop_url"], order["checkout_token"]): (
+                cls.order_time(order, now),
+                cls.order_customer_keys(order),
+            )
+            for order in orders
+        }
+        matches = {order_key: ([], []) for order_key in customers}
+        matched_orders = [
+            order for order in orders if any(customers[(order["shop_url"], order["checkout_token"])][1].values())
+        ]
+        if not matched_orders:
+            return matches
+
+        email_keys = {keys["customer_email_key"] for _, keys in customers.values()} - {None}
+        name_keys = {keys["customer_name_key"] for _, keys in customers.values()} - {None}
+        order_times = [customers[(order["shop_url"], order["checkout_token"])][0] for order in matched_orders]
+        candidate_impressions = list(
+            CrossSellImpression.objects.filter(
+                Q(customer_email_key__in=email_keys) | Q(customer_name_key__in=name_keys),
+                recommended_shop_urls__overlap=list({order["shop_url"] for order in matched_orders}),
+                created_at__range=(min(order_times) - FALLBACK_ATTRIBUTION_WINDOW, max(order_times)),
+            )
+            .order_by("-created_at")
+            .values_list("id", "customer_email_key", "customer_name_key", "recommended_shop_urls", "created_at")
+        )
+        product_handles = defaultdict(list)
+        for shop_url, cms_product_id, cms_product_handle in (
+            Product.objects.filter(
+                shop__shop_url__in={order["shop_url"] for order in matched_orders},
+                cms_product_id__in={
+                    cms_product_id for order in matched_orders for cms_product_id in order["cms_product_ids"]
+                },
+            )
+            .exclude(cms_product_handle=None)
+            .values_list("shop__shop_url", "cms_product_id", "cms_product_handle")
+        ):
+            product_handles[(shop_url, cms_product_id)].append(cms_product_handle.lower())
+
+        impression_ids = {}
+        for order in matched_orders:
+            ordered_at, keys = customers[(order["shop_url"], order["checkout_token"])]
+            impression_ids[(order["shop_url"], order["checkout_token"])] = [
+                id
+                for id, email_key, name_key, recommended_shop_urls, created_at in candidate_impressions
+                if (
+                    (email_key and email_key == keys["customer_email_key"])
+                    or (name_key and name_key == keys["customer_name_key"])
+                )
+                and order["shop_url"] in recommended_shop_urls
+                and ordered_at - FALLBACK_ATTRIBUTION_WINDOW <= created_at <= ordered_at
+            ][:FALLBACK_MAX_IMPRESSIONS]
+
+        clicks = defaultdict(list)
+        for id, impression_id, rdir in (
+            CrossSellClick.objects.filter(impression_id__in={id for ids in impression_ids.values() for id in ids})
+            .exclude(rdir=None)
+            .values_list("id", "impression_id", "rdir")
+        ):
+            clicks[impression_id].append((id, rdir.lower()))
+
+        for order in matched_orders:
+            order_impression_ids = impression_ids[(order["shop_url"], order["checkout_token"])]
+            handles = [
+                handle
+                for cms_product_id in order["cms_product_ids"]
+                for handle in product_handles[(order["shop_url"], cms_product_id)]
+            ]
+            matches[(order["shop_url"], order["checkout_token"])] = (
+                [
+                    id
+                    for impression_id in order_impression_ids
+                    for id, rdir in clicks[impression_id]
+                    if any(handle in rdir for handle in handles)
+                ],
+                order_impression_ids,
+            )
+        return matches
+
+    @classmethod
+    def resolve_attributions(cls, orders: List[OrderPayload]) -> Dict[Tuple[str, str], Tuple[List[int], List[int]]]:
+        """
+        Ids of the clicks and impressions each order is attributed to, by (`shop_url`, `checkout_token`).
+        Clicks are looked up by the click ids of the orders in one query and must point to the shop of the
+        order, their impression is optional. The orders without a known click id fall back to `match_customers`.
+        """
+        clicks = {
+            click_id: (id, impression_id, recommended_shop_url)
+            for click_id, id, impression_id, recommended_shop_url in CrossSellClick.objects.filter(
+                click_id__in={click_id for order in orders for click_id in order.get("click_ids") or []},
+            ).values_list("click_id", "id", "impression_id", "recommended_shop__shop_url")
+        }
+        attributions, unmatched_orders = {}, []
+        for order in orders:
+            order_clicks = [
+                clicks[click_id]
+                for click_id in order.get("click_ids") or []
+                if click_id in clicks and clicks[click_id][2] == order["shop_url"]
+            ]
+            if not order_clicks:
+                unmatched_orders.append(order)
+                continue
+            attributions[(order["shop_url"], order["checkout_token"])] = (
+                [id for id, _, _ in order_clicks],
+                list({impression_id for _, impression_id, _ in order_clicks if impression_id}),
+            )
+        return attributions | cls.match_customers(unmatched_orders)
+
+    @classmethod
+    def attribute_orders(cls, orders: List[OrderPayload]) -> int:
+        """
+        Create the conversions of a batch of orders attributed by `resolve_attributions`.
+        The purchased products count when one of the attributed impressions showed them, or, for orders
+        only attributed to clicks without impression, when a cross sell widget of the shop offers them.
+        Conversions and their clicks and impressions are inserted in bulk, orders that already converted
+        are skipped so that replayed batches are no-ops.
+        Return the number of created conversions.
+        """
+        orders = [
+            order
+            for order in {(order["shop_url"], order["checkout_token"]): order for order in orders}.values()
+            if order["total_prices"] and order["cms_variant_ids"] and order["quantities"]
+        ]
+        converted_orders = set(
+            CrossSellConversion.objects.filter(
+                checkout_token__in={order["checkout_token"] for order in orders}
+            ).values_list("purchase_shop_url", "checkout_token")
+        )
+        orders = [order for order in orders if (order["shop_url"], order["checkout_token"]) not in converted_orders]
+        if not orders:
+            return 0
+
+        attributions = cls.resolve_attributions(orders)
+
+        through_model = CrossSellImpression.cross_sell_widgets.through
+        widget_product_ids = defaultdict(set)
+        for impression_id, shop_url, cms_product_ids in through_model.objects.filter(
+            crosssellimpression_id__in={id for _, impression_ids in attributions.values() for id in impression_ids}
+        ).values_list("crosssellimpression_id", "crosssellwidget__shop__shop_url", "crosssellwidget__cms_product_ids"):
+            widget_product_ids[(impression_id, shop_url)].update(cms_product_ids)
+        shop_product_ids = defaultdict(set)
+        for shop_url, cms_product_ids in CrossSellWidget.objects.filter(
+            shop__shop_url__in={
+                shop_url
+                for (shop_url, _), (click_ids, impression_ids) in attributions.items()
+                if click_ids and not impression_ids
+            }
+        ).values_list("shop__shop_url", "cms_product_ids"):
+            shop_product_ids[shop_url].update(cms_product_ids)
+
+        conversions = []
+        for order in orders:
+            click_ids, impression_ids = attributions[(order["shop_url"], order["checkout_token"])]
+            available_product_ids = (
+                set().union(
+                    *[widget_product_ids[(impression_id, order["shop_url"])] for impression_id in impression_ids]
+                )
+                if impression_ids or not click_ids
+                else shop_product_ids[order["shop_url"]]
+            )
+            purchased_variants = zip(
+                order["cms_variant_ids"], order["cms_product_ids"], order["quantities"], order["total_prices"]
+            )
+            selected_variants = [variant for variant in purchased_variants if variant[1] in available_product_ids]
+            if not selected_variants:
+                continue
+
+            conversions.append(
+                CrossSellConversion(
+                    purchase_shop_url=order["shop_url"],
+                    checkout_token=order["checkout_token"],
+                    customer_id=order["customer_id"],
+                    **cls.order_customer_keys(order),
+                    click_ids=order.get("click_ids") or [],
+                    cms_variant_ids=[variant[0] for variant in selected_variants],
+                    quantities=[variant[2] for variant in selected_variants],
+                    sales=sum([float(variant[3]) for variant in selected_variants]),
+                )
+            )
+        if not conversions:
+            return 0
+
+        with transaction.atomic():
+            CrossSellConversion.objects.bulk_create(conversions, ignore_conflicts=True)
+            conversion_ids = {
+                (shop_url, checkout_token): id
+                for shop_url, checkout_token, id in CrossSellConversion.objects.filter(
+                    checkout_token__in={conversion.checkout_token for conversion in conversions}
+                ).values_list("purchase_shop_url", "checkout_token", "id")
+            }
+            click_through_model = CrossSellConversion.clicks.through
+            impression_through_model = CrossSellConversion.impressions.through
+            click_links, impression_links = [], []
+            activity_deltas = defaultdict(Counter)
+            for conversion in conversions:
+                conversion_id = conversion_ids[(conversion.purchase_shop_url, conversion.checkout_token)]
+                click_ids, impression_ids = attributions[(conversion.purchase_shop_url, conversion.checkout_token)]
+                click_links += [
+                    click_through_model(crosssellconversion_id=conversion_id, crosssellclick_id=click_id)
+                    for click_id in click_ids
+                ]
+                impression_links += [
+                    impression_through_model(crosssellconversion_id=conversion_id, crosssellimpression_id=impression_id)
+                    for impression_id in impression_ids
+                ]
+                activity_deltas[conversion.purchase_shop_url].update(
+                    {"cross_sell_total_sales": 1, "cross_sell_sales": Decimal(str(conversion.sales))}
+                )
+            click_through_model.objects.bulk_create(click_links, ignore_conflicts=True)
+            impression_through_model.objects.bulk_create(impression_links, ignore_conflicts=True)
+            ShopActivityRollup.increment(activity_deltas, shop_field="shop_url")
+        return len(conversions)
+
+    @classmethod
+    def reattribute(cls, shop_url: str, day: date) -> Tuple[int, int]:
+        """
+        Attribute again the conversions of a shop created on a day, with the current attribution rules.
+        Their click and impression links are replaced in bulk.
+        Return the number of conversions and of links written.
+        """
+        started_at = timezone.make_aware(datetime.combine(day, time.min))
+        conversions = list(
+            CrossSellConversion.objects.filter(
+                purchase_shop_url=shop_url, created_at__gte=started_at, created_at__lt=started_at + timedelta(days=1)
+            )
+        )
+        if not conversions:
+            return 0, 0
+
+        cms_product_ids = dict(
+            Variant.objects.filter(
+                shop_url=shop_url,
+                cms_variant_id__in={
+                    cms_variant_id for conversion in conversions for cms_variant_id in conversion.cms_variant_ids
+                },
+            ).values_list("cms_variant_id", "product__cms_product_id")
+        )
+        attributions = cls.resolve_attributions(
+            [
+                {
+                    "shop_url": shop_url,
+                    "checkout_token": conversion.checkout_token,
+                    "customer_email_key": conversion.customer_email_key,
+                    "customer_name_key": conversion.customer_name_key,
+                    "cms_product_ids": [
+                        cms_product_ids.get(cms_variant_id) for cms_variant_id in conversion.cms_variant_ids
+                    ],
+                    "click_ids": conversion.click_ids,
+                    "ordered_at": conversion.created_at,
+                }
+                for conversion in conversions
+            ]
+        )
+        click_through_model = CrossSellConversion.clicks.through
+        impression_through_model = CrossSellConversion.impressions.through
+        click_links = [
+            click_through_model(crosssellconversion_id=conversion.id, crosssellclick_id=click_id)
+            for conversion in conversions
+            for click_id in attributions[(shop_url, conversion.checkout_token)][0]
+        ]
+        impression_links = [
+            impression_through_model(crosssellconversion_id=conversion.id, crosssellimpression_id=impression_id)
+            for conversion in conversions
+            for impression_id in attributions[(shop_url, conversion.checkout_token)][1]
+        ]
+        with transaction.atomic():
+            conversion_ids = [conversion.id for conversion in conversions]
+            click_through_model.objects.filter(crosssellconversion_id__in=conversion_ids).delete()
+            impression_through_model.objects.filter(crosssellconversion_id__in=conversion_ids).delete()
+            click_through_model.objects.bulk_create(click_links, ignore_conflicts=True)
+            impression_through_model.objects.bulk_create(impression_links, ignore_conflicts=True)
+        return len(conversions), len(click_links) + len(impression_links)
@@ -1,50 +1,242 @@
-from typing import Dict
+import hashlib
+import json
+import logging
+from functools import cache
+from typing import Dict, List, Tuple
 
 from django.apps import apps
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import connection
+from django.db.models import Q
+from django.template import Context, Template
+from django.utils import timezone
+from django.utils.http import quote_etag
+from home.extensions.redis import redis_client
+from home.helpers.customer_helpers import customer_keys
+from home.helpers.widget_helpers import build_widget_url_params
 from home.models import CrossSellImpression, CrossSellWidget, Shop, WidgetStatus
 from home.serializers import CrossSellImpressionSerializer, ShopSerializer
-from home.services.recommendations import RecommendationService
+from home.services.activity import ShopActivityRollup
+from home.services.impressions import CrossSellImpressionBuffer
+from home.services.recommendations import RecommendationCardCache, RecommendationService
+from home.templates.cross_sell import CROSSSELL_WIDGET_HTML_TEMPLATE
 from home.utils import get_object_or_none
+from redis import RedisError
 from rest_framework.request import Request
 
+logger = logging.getLogger(__file__)
+
+# Lifetime of the widgets rendered for a checkout, that the ETag of its reloads is computed from.
+RENDERED_WIDGETS_TTL = 24 * 60 * 60
+
+
+@cache
+def cross_sell_widget_template() -> Template:
+    """
+    The widget template is compiled once per process.
+    """
+    return Template(CROSSSELL_WIDGET_HTML_TEMPLATE)
+
 
 class CrossSellHtmlService:
     @classmethod
-    def create_cross_sell_impression(cls, purchase_shop: Shop, request: Request, size: int) -> CrossSellImpression:
+    def upsert_cross_sell_impression(cls, **values) -> CrossSellImpression:
+        """
+        Insert a cross sell impression, or return the existing one with the same
+        (`purchase_shop_url`, `checkout_token`), in a single statement.
+        The returned impression has a `created` attribute telling whether it was inserted.
+        """
+        now = timezone.now()
+        values = {"created_at": now, "updated_at": now} | values
+        fields = [field for field in CrossSellImpression._meta.concrete_fields if not field.primary_key]
+        columns = [field.column for field in fields]
+        params = [
+            field.get_db_prep_save(
+                values[field.attname] if field.attname in values else field.get_default(), connection
+            )
+            for field in fields
+        ]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {CrossSellImpression._meta.db_table} ({", ".join(columns)})
+                VALUES ({", ".join(["%s"] * len(columns))})
+                ON CONFLICT (purchase_shop_url, checkout_token)
+                DO UPDATE SET checkout_token = EXCLUDED.checkout_token
+                RETURNING id, {", ".join(columns)}, (xmax = 0) AS created
+                """,
+                params,
+            )
+            row = cursor.fetchone()
+
+        cross_sell_impression = CrossSellImpression.from_db(
+            connection.alias, ["id"] + [field.attname for field in fields], row[:-1]
+        )
+        cross_sell_impression.created = row[-1]
+        return cross_sell_impression
+
+    @classmethod
+    def add_cross_sell_widgets(cls, cross_sell_impression: CrossSellImpression, widget_ids: List[int]) -> None:
+        """
+        Link widgets to an impression with a single bulk insert into the m2m through table.
+        """
+        through_model = CrossSellImpression.cross_sell_widgets.through
+        through_model.objects.bulk_create(
+            [
+                through_model(crosssellimpression_id=cross_sell_impression.id, crosssellwidget_id=widget_id)
+                for widget_id in widget_ids
+            ],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def impression_values(cls, purchase_shop: Shop, request: Request) -> Dict:
+        customer_first_name = request.GET.get("checkout_shipping_address_first_name")
+        return {
+            "purchase_shop_url": purchase_shop.shop_url,
+            "checkout_token": request.GET.get("checkout_token"),
+            "order_id": request.GET.get("checkout_order_id"),
+            "customer_id": request.GET.get("checkout_customer_id"),
+            "customer_first_name": customer_first_name,
+            "page_url": request.GET.get("page_url"),
+        } | customer_keys(
+            request.GET.get("checkout_customer_email"),
+            customer_first_name,
+            request.GET.get("checkout_shipping_address_last_name"),
+        )
+
+    @classmethod
+    def select_cross_sell_widgets(cls, purchase_shop: Shop, size: int) -> Tuple[List[str], List[int]]:
+        """
+        Pick the recommended shops and one active widget for each of them.
+        Return the recommended shop urls and the widget ids.
+        """
         recommended_shops = RecommendationService.get_recommended_shops(purchase_shop, size=size)
-        selected_cross_sell_widgets = CrossSellWidget.objects.filter(
-            shop__in=recommended_shops, status=WidgetStatus.ACTIVE.value
-        ).distinct("shop")
-        cross_sell_impression = CrossSellImpression.objects.create(
-            purchase_shop_url=purchase_shop.shop_url,
-            recommended_shop_urls=[shop.shop_url for shop in recommended_shops],
-            customer_email=request.GET.get("checkout_customer_email"),
-            checkout_token=request.GET.get("checkout_token"),
-            order_id=request.GET.get("checkout_order_id"),
-            customer_id=request.GET.get("checkout_customer_id"),
-            customer_first_name=request.GET.get("checkout_shipping_address_first_name"),
-            customer_last_name=request.GET.get("checkout_shipping_address_last_name"),
-            page_url=request.GET.get("page_url"),
+        selected_cross_sell_widget_ids = list(
+            CrossSellWidget.objects.filter(shop__in=recommended_shops, status=WidgetStatus.ACTIVE.value)
+            .order_by("shop")
+            .distinct("shop")
+            .values_list("id", flat=True)
         )
-        cross_sell_impression.cross_sell_widgets.set(selected_cross_sell_widgets)
+        return [shop.shop_url for shop in recommended_shops], selected_cross_sell_widget_ids
+
+    @classmethod
+    def shown_cross_sell_widgets(cls, widget_ids: List[int]) -> Tuple[List[str], List[int]]:
+        """
+        Same as `select_cross_sell_widgets` for widgets already picked by a widget shell.
+        Widgets that are not active anymore are dropped.
+        """
+        widget_shop_urls = dict(
+            CrossSellWidget.objects.filter(id__in=widget_ids, status=WidgetStatus.ACTIVE.value).values_list(
+                "id", "shop__shop_url"
+            )
+        )
+        shown_widget_ids = [widget_id for widget_id in widget_ids if widget_id in widget_shop_urls]
+        return [widget_shop_urls[widget_id] for widget_id in shown_widget_ids], shown_widget_ids
+
+    @classmethod
+    def impression_widgets(
+        cls, purchase_shop: Shop, size: int, widget_ids: List[int] | None = None
+    ) -> Tuple[List[str], List[int]]:
+        if widget_ids is None:
+            return cls.select_cross_sell_widgets(purchase_shop, size)
+        return cls.shown_cross_sell_widgets(widget_ids)
+
+    @classmethod
+    def create_cross_sell_impression(
+        cls, purchase_shop: Shop, request: Request, size: int, widget_ids: List[int] | None = None
+    ) -> CrossSellImpression:
+        """
+        Save the impression of the checkout, or return the existing one.
+        The widgets are picked here unless `widget_ids` are given.
+        The returned impression has `created` and `cross_sell_widget_ids` attributes.
+        """
+        checkout_token = request.GET.get("checkout_token")
+        if checkout_token:
+            # Reloads of the checkout are answered with a single query, before any widget selection.
+            cross_sell_impression = (
+                CrossSellImpression.objects.filter(
+                    purchase_shop_url=purchase_shop.shop_url, checkout_token=checkout_token
+                )
+                .annotate(
+                    widget_ids=ArrayAgg(
+                        "cross_sell_widgets__id",
+                        filter=Q(cross_sell_widgets__isnull=False),
+                        ordering="cross_sell_widgets__id",
+                    )
+                )
+                .first()
+            )
+            if cross_sell_impression:
+                cross_sell_impression.created = False
+                cross_sell_impression.cross_sell_widget_ids = cross_sell_impression.widget_ids or []
+                return cross_sell_impression
+
+        recommended_shop_urls, selected_cross_sell_widget_ids = cls.impression_widgets(purchase_shop, size, widget_ids)
+        cross_sell_impression = cls.upsert_cross_sell_impression(
+            recommended_shop_urls=recommended_shop_urls,
+            **cls.impression_values(purchase_shop, request),
+        )
+        if cross_sell_impression.created:
+            cls.add_cross_sell_widgets(cross_sell_impression, selected_cross_sell_widget_ids)
+            cross_sell_impression.cross_sell_widget_ids = selected_cross_sell_widget_ids
+            CrossSellImpression.objects.filter(id=cross_sell_impression.id).link_recommended_shops()
+            ShopActivityRollup.increment(
+                {shop_url: {"cross_sell_impressions": 1} for shop_url in recommended_shop_urls}, shop_field="shop_url"
+            )
+        else:
+            cross_sell_impression.cross_sell_widget_ids = list(
+                cross_sell_impression.cross_sell_widgets.values_list("id", flat=True)
+            )
         return cross_sell_impression
 
+    @classmethod
+    def buffer_cross_sell_impression(
+        cls, purchase_shop: Shop, request: Request, size: int, widget_ids: List[int] | None = None
+    ) -> CrossSellImpression:
+        """
+        Write-behind version of `create_cross_sell_impression`: the impression is pushed to
+        the impression buffer and is not saved when this method returns.
+        """
+        payload = CrossSellImpressionBuffer.get(purchase_shop.shop_url, request.GET.get("checkout_token"))
+        if not payload:
+            recommended_shop_urls, selected_cross_sell_widget_ids = cls.impression_widgets(
+                purchase_shop, size, widget_ids
+            )
+            payload = CrossSellImpressionBuffer.push(
+                cls.impression_values(purchase_shop, request) | {"recommended_shop_urls": recommended_shop_urls},
+                selected_cross_sell_widget_ids,
+            )
+
+        cross_sell_impression = CrossSellImpressionBuffer.to_impression(payload)
+        cross_sell_impression.cross_sell_widget_ids = payload["cross_sell_widget_ids"]
+        return cross_sell_impression
+
+    @classmethod
+    def record_cross_sell_impression(
+        cls, purchase_shop: Shop, request: Request, size: int, widget_ids: List[int] | None = None
+    ) -> CrossSellImpression:
+        """
+        Buffer the impression of the checkout in write-behind mode, save it otherwise.
+        Checkouts without token are never buffered, the per checkout key would be shared by all of them.
+        """
+        if apps.get_app_config("home").CROSS_SELL_IMPRESSION_WRITE_BEHIND and request.GET.get("checkout_token"):
+            try:
+                return cls.buffer_cross_sell_impression(purchase_shop, request, size, widget_ids)
+            except RedisError as e:
+                logger.error(f"Cross sell impression buffer unavailable, saving impression synchronously: {e}")
+        return cls.create_cross_sell_impression(purchase_shop, request, size, widget_ids)
+
     @classmethod
     def widget_context(cls, request: Request, size=2) -> Dict:
         purchase_shop = get_object_or_none(Shop, shop_url=request.GET.get("shop"))
         if not purchase_shop:
             return None
 
-        widget_impression = get_object_or_none(
-            CrossSellImpression,
-            purchase_shop_url=purchase_shop.shop_url,
-            checkout_token=request.GET.get("checkout_token", ""),
-        )
-        if not widget_impression:
-            widget_impression = cls.create_cross_sell_impression(purchase_shop, request, size=size)
-
+        widget_impression = cls.record_cross_sell_impression(purchase_shop, request, size)
         recommendations = RecommendationService.build_recommendations(
-            purchase_shop, widget_impression, request, size=size
+            purchase_shop, widget_impression.cross_sell_widget_ids, request, size=size
         )
         if not recommendations:
             return None
@@ -53,6 +245,8 @@ class CrossSellHtmlService:
             "widget_impression": CrossSellImpressionSerializer(widget_impression).data,
             "shop": ShopSerializer(purchase_shop).data,
             "shipping_first_name": request.GET.get("checkout_shipping_address_first_name"),
+            "widget_title": widget_impression.widget_title(),
+            "widget_description": widget_impression.widget_description(),
             "recommendations": recommendations,
             "widget_callback": request.GET.get("jsonp"),
             "environment": apps.get_app_config("home").ENVIRONMENT,
@@ -66,3 +260,178 @@ class CrossSellHtmlService:
         #     request.GET.get("jsonp"),
         #     environment,
         # )
+
+    @staticmethod
+    def rendered_widgets_key(request: Request) -> str:
+        return f"cross_sell:rendered_widgets:{request.GET.get('shop')}:{request.GET.get('checkout_token')}"
+
+    @classmethod
+    def widget_etag(cls, request: Request, widget_ids: List[int]) -> str:
+        """
+        ETag of the rendered widget of a checkout. The rendering only depends on the request parameters,
+        the impression of the checkout and the cards of its widgets, so it changes with their versions.
+        """
+        versions = RecommendationCardCache.get_versions(widget_ids)
+        representation = json.dumps(
+            [
+                sorted(request.GET.items()),
+                "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""),
+                [[widget_id, versions[widget_id]] for widget_id in widget_ids],
+            ]
+        )
+        return quote_etag(hashlib.sha256(representation.encode("utf-8")).hexdigest())
+
+    @classmethod
+    def rendered_widget_etag(cls, request: Request) -> str | None:
+        """
+        ETag of the widget already rendered for the checkout, computed from Redis only so that
+        conditional requests are answered before any database work.
+        """
+        if not request.GET.get("checkout_token"):
+            return None
+        try:
+            widget_ids = redis_client.get(cls.rendered_widgets_key(request))
+            return cls.widget_etag(request, json.loads(widget_ids)) if widget_ids else None
+        except RedisError as e:
+            logger.error(f"Unable to read the rendered widgets of checkout {request.GET.get('checkout_token')}: {e}")
+            return None
+
+    @classmethod
+    def remember_rendered_widget(cls, request: Request, context: Dict) -> str | None:
+        """
+        Keep the widgets rendered for the checkout and return the ETag of the rendering.
+        """
+        if not request.GET.get("checkout_token"):
+            return None
+        widget_ids = [recommendation["cross_sell_widget_id"] for recommendation in context["recommendations"]]
+        try:
+            redis_client.set(cls.rendered_widgets_key(request), json.dumps(widget_ids), ex=RENDERED_WIDGETS_TTL)
+            return cls.widget_etag(request, widget_ids)
+        except RedisError as e:
+            logger.error(f"Unable to keep the rendered widgets of checkout {request.GET.get('checkout_token')}: {e}")
+            return None
+
+    @staticmethod
+    def shell_key(purchase_shop: Shop) -> str:
+        return f"cross_sell:shell:{purchase_shop.id}"
+
+    @classmethod
+    def shell_widget_ids(cls, purchase_shop: Shop, size: int) -> List[int]:
+        """
+        Widgets shown by the widget shell of a purchase shop. The selection is shared by all
+        the checkouts of the shop and rotates every `CROSS_SELL_SHELL_TTL` seconds.
+        The previous selection is kept with it, the CDN serves shells picked before a rotation
+        for up to `CROSS_SELL_SHELL_TTL` seconds after it.
+        """
+        shell_key = cls.shell_key(purchase_shop)
+        shell = {}
+        try:
+            cached_shell = redis_client.get(shell_key)
+            shell = json.loads(cached_shell) if cached_shell else {}
+            if shell and shell["rotate_at"] > timezone.now().timestamp():
+                return shell["widget_ids"]
+        except RedisError as e:
+            logger.error(f"Unable to read the cross sell shell of shop {purchase_shop.id}: {e}")
+
+        _, selected_cross_sell_widget_ids = cls.select_cross_sell_widgets(purchase_shop, size)
+        shell_ttl = apps.get_app_config("home").CROSS_SELL_SHELL_TTL
+        try:
+            redis_client.set(
+                shell_key,
+                json.dumps(
+                    {
+                        "widget_ids": selected_cross_sell_widget_ids,
+                        "previous_widget_ids": shell.get("widget_ids", []),
+                        "rotate_at": timezone.now().timestamp() + shell_ttl,
+                    }
+                ),
+                ex=2 * shell_ttl,
+            )
+        except RedisError as e:
+            logger.error(f"Unable to cache the cross sell shell of shop {purchase_shop.id}: {e}")
+        return selected_cross_sell_widget_ids
+
+    @classmethod
+    def shell_shown_widget_ids(cls, purchase_shop: Shop, widget_ids: List[int]) -> List[int]:
+        """
+        Keep the widgets of a beacon that the shell of the purchase shop may have shown, so that
+        beacons cannot record impressions of arbitrary widgets. Nothing is kept if the shell is unknown.
+        """
+        try:
+            cached_shell = redis_client.get(cls.shell_key(purchase_shop))
+        except RedisError as e:
+            logger.error(f"Unable to read the cross sell shell of shop {purchase_shop.id}: {e}")
+            return []
+        if not cached_shell:
+            return []
+
+        shell = json.loads(cached_shell)
+        shell_widget_ids = set(shell["widget_ids"]) | set(shell["previous_widget_ids"])
+        return [widget_id for widget_id in widget_ids if widget_id in shell_widget_ids]
+
+    @classmethod
+    def shell_context(cls, request: Request, size=2) -> Dict:
+        """
+        Checkout independent part of the widget, cacheable by a CDN.
+        It must be requested with the `shop` parameter only: the checkout parameters of the
+        visit urls are left empty and are filled in by the checkout page with the `visit_params`
+        returned by the beacon.
+        """
+        purchase_shop = get_object_or_none(Shop, shop_url=request.GET.get("shop"))
+        if not purchase_shop:
+            return None
+
+        recommendations = RecommendationService.build_recommendations(
+            purchase_shop, cls.shell_widget_ids(purchase_shop, size), request, size=size
+        )
+        if not recommendations:
+            return None
+
+        return {
+            "cross_sell_widget_ids": [recommendation["cross_sell_widget_id"] for recommendation in recommendations],
+            "recommendations": recommendations,
+            "environment": apps.get_app_config("home").ENVIRONMENT,
+        }
+
+    @classmethod
+    def beacon_context(cls, request: Request, size=2) -> Dict:
+        """
+        Checkout dependent part of the widget: record the impression of the widgets shown by
+        the shell (`widget_ids` parameter) and return the personalized greeting, with the checkout
+        parameters of the visit urls of the shell.
+        """
+        purchase_shop = get_object_or_none(Shop, shop_url=request.GET.get("shop"))
+        if not purchase_shop:
+            return None
+
+        widget_ids = cls.shell_shown_widget_ids(
+            purchase_shop,
+            [int(widget_id) for widget_id in request.GET.get("widget_ids", "").split(",") if widget_id.isdigit()],
+        )
+        if not widget_ids:
+            return None
+
+        widget_impression = cls.record_cross_sell_impression(purchase_shop, request, size, widget_ids[:size])
+        return {
+            "widget_title": widget_impression.widget_title(),
+            "widget_description": widget_impression.widget_description(),
+            "visit_params": build_widget_url_params(purchase_shop.shop_url, request),
+        }
+
+    @classmethod
+    def render_widget(cls, context: Dict) -> str:
+        """
+        Render the JSONP widget script from a widget context.
+        Only the values used by the template are passed to it.
+        """
+        return cross_sell_widget_template().render(
+            Context(
+                {
+                    "widget_callback": context["widget_callback"],
+                    "environment": context["environment"],
+                    "widget_title": context["widget_title"],
+                    "widget_description": context["widget_description"],
+                    "recommendations": context["recommendations"],
+                }
+            )
+        )
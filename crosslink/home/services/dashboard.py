@@ -0,0 +1,147 @@
+import json
+import logging
+from datetime import date
+from typing import Dict, List
+
+from django.utils import timezone
+from home.extensions.redis import redis_client
+from home.models import Shop, ShopDailyActivity
+from home.models.shop import DailyMetrics
+from home.utils import daterange
+from redis import RedisError
+
+logger = logging.getLogger(__file__)
+
+# Lifetime of the metrics of the current day.
+DASHBOARD_CACHE_TTL = 300
+# Lifetime of the past days of a shop since their last write. Past days are also dropped whenever their
+# rollups change, this only bounds the memory of the shops that stop opening their dashboard.
+DASHBOARD_PAST_DAYS_TTL = 7 * 24 * 3600
+DASHBOARD_LOCK_TIMEOUT = 30
+DASHBOARD_LOCK_WAIT = 10
+
+
+class DashboardCache:
+    """
+    Per shop and per day cache of the dashboard metrics, any date range is assembled from it.
+    Past days are stored in a per shop hash, dropped when their rollups change, the current day in a
+    short lived key.
+    Missing days are computed behind a per shop lock, so that concurrent dashboard loads of a shop
+    read the rollups once.
+    """
+
+    @staticmethod
+    def past_days_key(shop_id: int) -> str:
+        return f"dashboard:days:{shop_id}"
+
+    @staticmethod
+    def current_day_key(shop_id: int, day: date) -> str:
+        return f"dashboard:day:{shop_id}:{day}"
+
+    @staticmethod
+    def lock_key(shop_id: int) -> str:
+        return f"dashboard:lock:{shop_id}"
+
+    @staticmethod
+    def decode(cached_metrics: str) -> DailyMetrics:
+        return {
+            metric: ShopDailyActivity._meta.get_field(metric).to_python(value)
+            for metric, value in json.loads(cached_metrics).items()
+        }
+
+    @classmethod
+    def read(cls, shop_id: int, days: List[date]) -> Dict[date, DailyMetrics]:
+        today = timezone.now().date()
+        past_days = [day for day in days if day < today]
+        current_days = [day for day in days if day >= today]
+
+        pipeline = redis_client.pipeline(transaction=False)
+        if past_days:
+            pipeline.hmget(cls.past_days_key(shop_id), [str(day) for day in past_days])
+        if current_days:
+            pipeline.mget([cls.current_day_key(shop_id, day) for day in current_days])
+        results = pipeline.execute()
+        cached_metrics = (results.pop(0) if past_days else []) + (results.pop(0) if current_days else [])
+
+        return {day: cls.decode(metrics) for day, metrics in zip(past_days + current_days, cached_metrics) if metrics}
+
+    @classmethod
+    def write(cls, shop_id: int, daily_metrics: Dict[date, DailyMetrics]) -> None:
+        today = timezone.now().date()
+        past_days = {
+            str(day): json.dumps(metrics, default=str) for day, metrics in daily_metrics.items() if day < today
+        }
+
+        pipeline = redis_client.pipeline(transaction=False)
+        if past_days:
+            pipeline.hset(cls.past_days_key(shop_id), mapping=past_days)
+            pipeline.expire(cls.past_days_key(shop_id), DASHBOARD_PAST_DAYS_TTL)
+        for day, metrics in daily_metrics.items():
+            if day >= today:
+                pipeline.set(
+                    cls.current_day_key(shop_id, day), json.dumps(metrics, default=str), ex=DASHBOARD_CACHE_TTL
+                )
+        pipeline.execute()
+
+    @classmethod
+    def compute(cls, shop: Shop, days: List[date]) -> Dict[date, DailyMetrics]:
+        """
+        Read the metrics of the days from the rollups in one query, days without activity included.
+        """
+        daily_metrics = shop.daily_metrics(min(days), max(days))
+        empty_metrics = {metric: 0 for metric in ShopDailyActivity.METRICS}
+        return {day: daily_metrics.get(day, empty_metrics) for day in days}
+
+    @classmethod
+    def get(cls, shop: Shop, start_date: date, end_date: date) -> Dict[date, DailyMetrics]:
+        """
+        Metrics of the days between two dates. Only the days missing from the cache are computed.
+        """
+        days = list(daterange(start_date, end_date))
+        try:
+            daily_metrics = cls.read(shop.id, days)
+            if len(daily_metrics) == len(days):
+                return daily_metrics
+
+            with redis_client.lock(
+                cls.lock_key(shop.id), timeout=DASHBOARD_LOCK_TIMEOUT, blocking_timeout=DASHBOARD_LOCK_WAIT
+            ):
+                # Another request may have computed the days while this one was waiting for the lock.
+                daily_metrics |= cls.read(shop.id, [day for day in days if day not in daily_metrics])
+                missing_days = [day for day in days if day not in daily_metrics]
+                if missing_days:
+                    computed_metrics = cls.compute(shop, missing_days)
+                    cls.write(shop.id, computed_metrics)
+                    daily_metrics |= computed_metrics
+            return daily_metrics
+        except RedisError as e:
+            logger.warning(f"Dashboard cache unavailable for shop {shop.id}: {e}")
+            return cls.compute(shop, days)
+
+    @classmethod
+    def invalidate(cls, shop_id: int, start_date: date, end_date: date) -> None:
+        """
+        Drop the cached metrics of the days between two dates, e.g. after their rollups were rebuilt.
+        """
+        days = list(daterange(start_date, end_date))
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            pipeline.hdel(cls.past_days_key(shop_id), *[str(day) for day in days])
+            pipeline.delete(*[cls.current_day_key(shop_id, day) for day in days])
+            pipeline.execute()
+        except RedisError as e:
+            logger.warning(f"Dashboard cache of shop {shop_id} not invalidated: {e}")
+
+    @classmethod
+    def invalidate_day(cls, shop_ids: List[int], day: date) -> None:
+        """
+        Drop the cached metrics of a day of several shops, e.g. after late deltas were added to its rollups.
+        """
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            for shop_id in shop_ids:
+                pipeline.hdel(cls.past_days_key(shop_id), str(day))
+                pipeline.delete(cls.current_day_key(shop_id, day))
+            pipeline.execute()
+        except RedisError as e:
+            logger.warning(f"Dashboard cache of {day} not invalidated for shops {shop_ids}: {e}")
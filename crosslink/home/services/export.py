@@ -0,0 +1,72 @@
+import csv
+import json
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Callable, Dict, Iterator, List
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Model, QuerySet
+from home.models import (
+    CrossSellClick,
+    CrossSellConversion,
+    CrossSellImpression,
+    Shop,
+    UpsellConversion,
+    UpsellImpression,
+)
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FILE_FORMATS = ["csv", "ndjson"]
+
+
+class Echo:
+    """
+    File-like object whose `write` returns the written value, so that `csv.writer` rows can be streamed.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+class EventExportService:
+    """
+    Raw events export of a shop. Only the events of the shop's own checkouts are exported, so that
+    the customers of the other shops are never exposed.
+    """
+
+    EVENTS: Dict[str, Callable[[Shop], QuerySet]] = {
+        "cross_sell_impressions": lambda shop: CrossSellImpression.objects.filter(purchase_shop_url=shop.shop_url),
+        "cross_sell_clicks": lambda shop: CrossSellClick.objects.filter(purchase_shop_url=shop.shop_url),
+        "cross_sell_conversions": lambda shop: CrossSellConversion.objects.filter(purchase_shop_url=shop.shop_url),
+        "upsell_impressions": lambda shop: UpsellImpression.objects.filter(upsell_widget__shop=shop),
+        "upsell_conversions": lambda shop: UpsellConversion.objects.filter(upsell_impression__upsell_widget__shop=shop),
+    }
+
+    @staticmethod
+    def columns(model: type[Model]) -> List[str]:
+        return [field.attname for field in model._meta.concrete_fields]
+
+    @classmethod
+    def rows(cls, shop: Shop, event: str, start_date: date, end_date: date) -> Iterator[Dict]:
+        """
+        Events created between two dates, fetched by chunks through a server side cursor.
+        """
+        queryset = cls.EVENTS[event](shop).filter(
+            created_at__gte=datetime.combine(start_date, time.min, tzinfo=timezone.utc),
+            created_at__lt=datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=timezone.utc),
+        )
+        columns = cls.columns(queryset.model)
+        for row in queryset.order_by("id").values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield dict(zip(columns, row))
+
+    @classmethod
+    def stream(cls, shop: Shop, event: str, start_date: date, end_date: date, file_format: str) -> Iterator[str]:
+        rows = cls.rows(shop, event, start_date, end_date)
+        if file_format == "ndjson":
+            for row in rows:
+                yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+            return
+
+        writer = csv.writer(Echo())
+        yield writer.writerow(cls.columns(cls.EVENTS[event](shop).model))
+        for row in rows:
+            yield writer.writerow(row.values())
@@ -0,0 +1,133 @@
+import json
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+from django.utils import timezone
+from home.extensions.redis import RedisStreamBuffer, redis_client
+from home.helpers.customer_helpers import customer_keys
+from home.models import CrossSellImpression
+from home.services.activity import ShopActivityRollup
+
+IMPRESSION_STREAM_KEY = "cross_sell:impressions"
+IMPRESSION_STREAM_GROUP = "impression-drainers"
+CHECKOUT_IMPRESSION_TTL = 24 * 60 * 60
+
+ImpressionPayload = Dict
+
+
+class CrossSellImpressionBuffer(RedisStreamBuffer):
+    """
+    Write-behind buffer of cross sell impressions.
+    Impressions get a client generated `uuid` and are pushed to a Redis stream, the
+    `drain_buffer cross_sell_impressions` command bulk inserts them with their widget links.
+    Reloads of the same checkout are answered from a per checkout key so that they show
+    the same recommendations without touching the database.
+    """
+
+    STREAM_KEY = IMPRESSION_STREAM_KEY
+    STREAM_GROUP = IMPRESSION_STREAM_GROUP
+    MESSAGE_FIELD = "impression"
+
+    @staticmethod
+    def checkout_key(purchase_shop_url: str, checkout_token: str | None) -> str:
+        return f"cross_sell:checkout_impression:{purchase_shop_url}:{checkout_token}"
+
+    @classmethod
+    def get(cls, purchase_shop_url: str, checkout_token: str | None) -> ImpressionPayload | None:
+        cached_payload = redis_client.get(cls.checkout_key(purchase_shop_url, checkout_token))
+        return json.loads(cached_payload) if cached_payload else None
+
+    @classmethod
+    def push(cls, values: Dict, cross_sell_widget_ids: List[int]) -> ImpressionPayload:
+        """
+        Buffer a new impression, unless another request of the same checkout already did.
+        Return the buffered impression payload.
+        """
+        payload = values | {
+            "uuid": str(uuid.uuid4()),
+            "created_at": timezone.now().isoformat(),
+            "cross_sell_widget_ids": cross_sell_widget_ids,
+        }
+        checkout_key = cls.checkout_key(values["purchase_shop_url"], values["checkout_token"])
+        if not redis_client.set(checkout_key, json.dumps(payload), nx=True, ex=CHECKOUT_IMPRESSION_TTL):
+            return cls.get(values["purchase_shop_url"], values["checkout_token"]) or payload
+
+        cls.add(payload)
+        return payload
+
+    @staticmethod
+    def to_impression(payload: ImpressionPayload) -> CrossSellImpression:
+        # Payloads buffered before the customer email and last name were dropped still hold them.
+        impression = CrossSellImpression(
+            **{
+                field: value
+                for field, value in payload.items()
+                if field
+                not in ["cross_sell_widget_ids", "created_at", "customer_key", "customer_email", "customer_last_name"]
+            }
+        )
+        # Payloads buffered before the customer keys were split get both keys here.
+        if "customer_key" in payload:
+            for field, value in customer_keys(
+                payload.get("customer_email"), payload.get("customer_first_name"), payload.get("customer_last_name")
+            ).items():
+                setattr(impression, field, value)
+        # Payloads buffered before the render time was added are dated when they are saved.
+        impression.created_at = (
+            datetime.fromisoformat(payload["created_at"]) if payload.get("created_at") else timezone.now()
+        )
+        return impression
+
+    @classmethod
+    def save_batch(cls, payloads: List[ImpressionPayload]) -> int:
+        """
+        Bulk insert impressions and their widget links. Impressions that already exist are skipped,
+        so that a batch can safely be replayed. Impressions are dated with the time of the widget rendering.
+        """
+        payload_uuids = [payload["uuid"] for payload in payloads]
+        existing_uuids = set(CrossSellImpression.objects.filter(uuid__in=payload_uuids).values_list("uuid", flat=True))
+        impressions = [cls.to_impression(payload) for payload in payloads]
+        rendered_at = {str(impression.uuid): impression.created_at for impression in impressions}
+        CrossSellImpression.objects.bulk_create(impressions, ignore_conflicts=True)
+        impression_ids = dict(CrossSellImpression.objects.filter(uuid__in=payload_uuids).values_list("uuid", "id"))
+        # `bulk_create` dates the rows with the insertion time, as `created_at` is an `auto_now_add` field.
+        CrossSellImpression.objects.bulk_update(
+            [
+                CrossSellImpression(id=impression_ids[impression_uuid], created_at=rendered_at[str(impression_uuid)])
+                for impression_uuid in impression_ids.keys() - existing_uuids
+            ],
+            ["created_at"],
+        )
+
+        through_model = CrossSellImpression.cross_sell_widgets.through
+        through_model.objects.bulk_create(
+            [
+                through_model(
+                    crosssellimpression_id=impression_ids[uuid.UUID(payload["uuid"])], crosssellwidget_id=widget_id
+                )
+                for payload in payloads
+                if uuid.UUID(payload["uuid"]) in impression_ids
+                for widget_id in payload["cross_sell_widget_ids"]
+            ],
+            ignore_conflicts=True,
+        )
+        CrossSellImpression.objects.filter(uuid__in=payload_uuids).link_recommended_shops()
+
+        inserted_payloads = {
+            payload["uuid"]: payload
+            for payload in payloads
+            if uuid.UUID(payload["uuid"]) in impression_ids.keys() - existing_uuids
+        }
+        recommended_shop_impressions = defaultdict(Counter)
+        for payload in inserted_payloads.values():
+            rendered_on = timezone.localdate(rendered_at[payload["uuid"]])
+            recommended_shop_impressions[rendered_on].update(payload["recommended_shop_urls"])
+        for day, shop_impressions in recommended_shop_impressions.items():
+            ShopActivityRollup.increment(
+                {shop_url: {"cross_sell_impressions": count} for shop_url, count in shop_impressions.items()},
+                shop_field="shop_url",
+                day=day,
+            )
+        return len(impression_ids)
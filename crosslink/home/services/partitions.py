@@ -0,0 +1,216 @@
+import gzip
+import logging
+import re
+import tempfile
+from datetime import date
+from pathlib import Path, PurePosixPath
+from typing import Dict, List
+
+from django.db import connection, transaction
+from django.utils import timezone
+from home.extensions.s3 import S3Client
+
+logger = logging.getLogger(__file__)
+
+# Event tables and the column they are partitioned by, one partition per month.
+# The cross sell impressions, clicks and conversions and the upsell impressions are not partitioned: their writes
+# rely on unique keys that a partitioned table could only enforce with the partition column, the checkout upserts,
+# the click get_or_create and click ids, and the replayed orders skipped by the attribution. Their dashboard reads
+# go through the daily rollups. The webhook deduplication only looks at the recent events and needs no unique key.
+EVENT_TABLES: Dict[str, str] = {
+    "shopify_app_shopifywebhookevent": "received_at",
+}
+ARCHIVE_PREFIX = PurePosixPath("archives/events")
+
+
+def add_months(month: date, months: int) -> date:
+    month_index = month.year * 12 + month.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+class EventPartitionService:
+    """
+    Monthly range partitions of the event tables: conversion of a plain table, creation of the
+    partitions ahead of time, archival and detachment of the old ones.
+    """
+
+    @staticmethod
+    def partition_name(table: str, month: date) -> str:
+        return f"{table}_{month:%Y_%m}"
+
+    @staticmethod
+    def is_partitioned(table: str) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT 1 FROM pg_partitioned_table
+                JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid
+                WHERE pg_class.relname = %s
+                """,
+                [table],
+            )
+            return cursor.fetchone() is not None
+
+    @staticmethod
+    def unique_indexes(table: str) -> List[str]:
+        """
+        Unique indexes of the table besides its primary key.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT index_class.relname FROM pg_index
+                JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+                WHERE pg_index.indrelid = %s::regclass AND pg_index.indisunique AND NOT pg_index.indisprimary
+                """,
+                [table],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    @classmethod
+    def create_partitions(cls, table: str, start_month: date, end_month: date) -> List[str]:
+        """
+        Create the monthly partitions from `start_month` to `end_month` included, and the default partition.
+        Return the names of the partitions.
+        """
+        partitions = []
+        month = start_month.replace(day=1)
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+            while month <= end_month:
+                partition = cls.partition_name(table, month)
+                cursor.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table}
+                    FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')
+                    """
+                )
+                partitions.append(partition)
+                month = add_months(month, 1)
+        return partitions
+
+    @classmethod
+    def monthly_partitions(cls, table: str) -> Dict[str, date]:
+        """
+        Attached monthly partitions of the table with their month.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = %s
+                """,
+                [table],
+            )
+            partition_names = [row[0] for row in cursor.fetchall()]
+
+        pattern = re.compile(rf"^{table}_(\d{{4}})_(\d{{2}})$")
+        return {
+            name: date(int(match.group(1)), int(match.group(2)), 1)
+            for name in partition_names
+            if (match := pattern.match(name))
+        }
+
+    @classmethod
+    @transaction.atomic
+    def convert(cls, table: str, months_ahead: int) -> None:
+        """
+        Convert a plain table into a table partitioned by month, in a single transaction.
+        The primary key gets the partition column, the foreign keys referencing the table are dropped since
+        Postgres requires them to reference a unique key of the parent. Django still performs the cascades of
+        these relations. The id identity goes on after the copied ids.
+        Tables with unique indexes are refused, they could no longer be enforced across the partitions.
+        """
+        column = EVENT_TABLES[table]
+        if unique_indexes := cls.unique_indexes(table):
+            raise ValueError(f"{table} has unique indexes without {column}: {', '.join(unique_indexes)}")
+        old_table = f"{table}_unpartitioned"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT indexdef FROM pg_indexes WHERE tablename = %s
+                AND indexname NOT IN (
+                    SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'
+                )
+                """,
+                [table, table],
+            )
+            index_definitions = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                """
+                SELECT conrelid::regclass, conname FROM pg_constraint
+                WHERE confrelid = %s::regclass AND contype = 'f'
+                """,
+                [table],
+            )
+            for referencing_table, constraint in cursor.fetchall():
+                logger.info(f"Dropping the foreign key {constraint} of {referencing_table}")
+                cursor.execute(f"ALTER TABLE {referencing_table} DROP CONSTRAINT {constraint}")
+            cursor.execute(f"SELECT min({column}), max({column}), max(id) FROM {table}")
+            first_event_at, last_event_at, last_id = cursor.fetchone()
+
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+            cursor.execute(
+                f"CREATE TABLE {table} (LIKE {old_table} INCLUDING DEFAULTS INCLUDING IDENTITY "
+                f"INCLUDING CONSTRAINTS INCLUDING STORAGE) PARTITION BY RANGE ({column})"
+            )
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+            cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {column})")
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id RESTART WITH {(last_id or 0) + 1}")
+
+            today = timezone.now().date()
+            cls.create_partitions(
+                table,
+                (first_event_at.date() if first_event_at else today).replace(day=1),
+                add_months(max(last_event_at.date() if last_event_at else today, today).replace(day=1), months_ahead),
+            )
+            cursor.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = %s ORDER BY ordinal_position",
+                [old_table],
+            )
+            columns = [row[0] for row in cursor.fetchall()]
+            # Rows without date, if any, are dated with the first event so that none is lost.
+            cursor.execute(
+                f"""
+                INSERT INTO {table} ({", ".join(columns)})
+                SELECT {", ".join(f"COALESCE({name}, %s)" if name == column else name for name in columns)}
+                FROM {old_table}
+                """,
+                [first_event_at or timezone.now()],
+            )
+            cursor.execute(f"DROP TABLE {old_table}")
+
+            # Indexes are built once the rows are loaded, and are propagated to every partition.
+            for index_definition in index_definitions:
+                cursor.execute(index_definition)
+
+    @classmethod
+    def archive_partition(cls, table: str, partition: str, directory: Path | None = None, drop: bool = False) -> str:
+        """
+        Export the partition to a gzipped CSV file, in `directory` or in the S3 bucket, then detach it,
+        and drop it if `drop`.
+        Return the location of the archive.
+        """
+        key = ARCHIVE_PREFIX / table / f"{partition}.csv.gz"
+        with tempfile.TemporaryFile() as archive:
+            with gzip.GzipFile(fileobj=archive, mode="wb") as compressed_archive:
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(f"COPY {partition} TO STDOUT WITH CSV HEADER", compressed_archive)
+            archive.seek(0)
+
+            if directory:
+                location = directory / key
+                location.parent.mkdir(parents=True, exist_ok=True)
+                location.write_bytes(archive.read())
+            else:
+                s3_client = S3Client()
+                s3_client.upload_fileobj(archive, key)
+                location = f"s3://{s3_client.bucket_name}/{key}"
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+            if drop:
+                cursor.execute(f"DROP TABLE {partition}")
+        return str(location)
@@ -1,105 +1,334 @@
-from typing import Dict, List
+import json
+import logging
+import operator
+from functools import reduce
+from typing import Dict, List, Tuple
 
 import numpy as np
 from django.apps import apps
+from django.db.models import Q
+from home.extensions.redis import redis_client
 from home.helpers.widget_helpers import build_visit_product_url, build_visit_shop_url, build_widget_url_params
-from home.models import CrossSellImpression, Product, Shop, WidgetStatus
+from home.models import CrossSellWidget, Product, Shop, WidgetStatus
+from redis import RedisError
 from rest_framework.request import Request
 
+logger = logging.getLogger(__file__)
+
+ELIGIBLE_SHOPS_KEY = "cross_sell:eligible_shops"
+# Set when the index is built, also when no shop is eligible and the set does not exist.
+# Its expiry bounds how long changes that bypass the signals are missed.
+ELIGIBLE_SHOPS_BUILT_KEY = "cross_sell:eligible_shops:built"
+ELIGIBLE_SHOPS_TTL = 60 * 60
+RECOMMENDATION_CARD_CACHE_TTL = 24 * 60 * 60
+
+
+class EligibleShopIndex:
+    """
+    Redis set of the ids of shops that have at least one active cross sell widget.
+    It is kept up to date by the cross sell widget signals so that sampling partners
+    does not need to scan every shop, and rebuilt from the database every `ELIGIBLE_SHOPS_TTL`.
+    Bulk changes of widgets with `QuerySet.update()` or `bulk_create` do not send the signals,
+    code doing them must call `invalidate`.
+    """
+
+    @classmethod
+    def eligible_shop_ids(cls) -> List[int]:
+        return list(
+            CrossSellWidget.objects.filter(status=WidgetStatus.ACTIVE.value)
+            .order_by()
+            .values_list("shop_id", flat=True)
+            .distinct()
+        )
+
+    @classmethod
+    def rebuild(cls) -> List[int]:
+        shop_ids = cls.eligible_shop_ids()
+        pipeline = redis_client.pipeline()
+        pipeline.delete(ELIGIBLE_SHOPS_KEY)
+        if shop_ids:
+            pipeline.sadd(ELIGIBLE_SHOPS_KEY, *shop_ids)
+        pipeline.set(ELIGIBLE_SHOPS_BUILT_KEY, 1, ex=ELIGIBLE_SHOPS_TTL)
+        pipeline.execute()
+        return shop_ids
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """
+        Have the index rebuilt by the next sampling.
+        """
+        try:
+            redis_client.delete(ELIGIBLE_SHOPS_BUILT_KEY)
+        except RedisError as e:
+            logger.error(f"Eligible shop index: could not invalidate: {e}")
+
+    @classmethod
+    def refresh_shop(cls, shop_id: int) -> None:
+        """
+        Add or remove a shop from the index depending on whether it still has an active widget.
+        """
+        is_eligible = CrossSellWidget.objects.filter(shop_id=shop_id, status=WidgetStatus.ACTIVE.value).exists()
+        try:
+            if is_eligible:
+                redis_client.sadd(ELIGIBLE_SHOPS_KEY, shop_id)
+            else:
+                redis_client.srem(ELIGIBLE_SHOPS_KEY, shop_id)
+        except RedisError as e:
+            logger.error(f"Eligible shop index: could not refresh shop {shop_id}: {e}")
+
+    @classmethod
+    def sample(cls, size: int, excluded_shop_id: int | None = None) -> List[int]:
+        """
+        Return up to `size` random eligible shop ids, `excluded_shop_id` excluded.
+        Falls back on the database when Redis is unavailable.
+        """
+        try:
+            if not redis_client.exists(ELIGIBLE_SHOPS_BUILT_KEY):
+                cls.rebuild()
+            shop_ids = [int(shop_id) for shop_id in redis_client.srandmember(ELIGIBLE_SHOPS_KEY, size + 1)]
+        except RedisError as e:
+            logger.error(f"Eligible shop index: falling back on database: {e}")
+            shop_ids = cls.eligible_shop_ids()
+            np.random.shuffle(shop_ids)
+
+        return [shop_id for shop_id in shop_ids if shop_id != excluded_shop_id][:size]
+
+
+class RecommendationCardCache:
+    """
+    Cache of the recommendation cards of each cross sell widget.
+    A card is only valid for the version of the widget it was built with. The version is bumped
+    whenever the widget, its discount or one of its products is modified.
+    """
+
+    @staticmethod
+    def version_key(widget_id: int) -> str:
+        return f"cross_sell:card_version:{widget_id}"
+
+    @staticmethod
+    def card_key(widget_id: int) -> str:
+        return f"cross_sell:card:{widget_id}"
+
+    @classmethod
+    def get_many(cls, widget_ids: List[int]) -> Tuple[Dict[int, str], Dict[int, Dict]]:
+        """
+        Return the current version of each widget and the cards that were built with this version.
+        """
+        if not widget_ids:
+            return {}, {}
+
+        try:
+            values = redis_client.mget(
+                [cls.version_key(widget_id) for widget_id in widget_ids]
+                + [cls.card_key(widget_id) for widget_id in widget_ids]
+            )
+        except RedisError as e:
+            logger.error(f"Recommendation card cache: could not read cards: {e}")
+            return {}, {}
+
+        versions = {widget_id: version or "0" for widget_id, version in zip(widget_ids, values[: len(widget_ids)])}
+        cards = {}
+        for widget_id, cached_card in zip(widget_ids, values[len(widget_ids) :]):
+            if not cached_card:
+                continue
+
+            card = json.loads(cached_card)
+            if card["version"] == versions[widget_id]:
+                cards[widget_id] = card["card"]
+
+        return versions, cards
+
+    @classmethod
+    def get_versions(cls, widget_ids: List[int]) -> Dict[int, str]:
+        """
+        Current version of each widget. Raise `RedisError` when Redis is unavailable.
+        """
+        if not widget_ids:
+            return {}
+        versions = redis_client.mget([cls.version_key(widget_id) for widget_id in widget_ids])
+        return {widget_id: version or "0" for widget_id, version in zip(widget_ids, versions)}
+
+    @classmethod
+    def set_many(cls, cards: Dict[int, Dict], versions: Dict[int, str]) -> None:
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            for widget_id, card in cards.items():
+                pipeline.set(
+                    cls.card_key(widget_id),
+                    json.dumps({"version": versions.get(widget_id, "0"), "card": card}),
+                    ex=RECOMMENDATION_CARD_CACHE_TTL,
+                )
+            pipeline.execute()
+        except RedisError as e:
+            logger.error(f"Recommendation card cache: could not write cards: {e}")
+
+    @classmethod
+    def invalidate_widgets(cls, widget_ids: List[int]) -> None:
+        if not widget_ids:
+            return
+
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            for widget_id in widget_ids:
+                pipeline.incr(cls.version_key(widget_id))
+                pipeline.delete(cls.card_key(widget_id))
+            pipeline.execute()
+        except RedisError as e:
+            logger.error(f"Recommendation card cache: could not invalidate widgets {widget_ids}: {e}")
+
+    @classmethod
+    def invalidate_products(cls, shop_id: int, cms_product_ids: List[str]) -> None:
+        """
+        Invalidate the cards of the widgets of `shop_id` that recommend one of `cms_product_ids`.
+        """
+        cls.invalidate_widgets(
+            list(
+                CrossSellWidget.objects.filter(
+                    shop_id=shop_id,
+                    cms_product_ids__overlap=[str(cms_product_id) for cms_product_id in cms_product_ids],
+                ).values_list("id", flat=True)
+            )
+        )
+
+    @classmethod
+    def invalidate_shop(cls, shop_id: int) -> None:
+        cls.invalidate_widgets(list(CrossSellWidget.objects.filter(shop_id=shop_id).values_list("id", flat=True)))
+
 
 class RecommendationService:
     @classmethod
     def get_recommended_shops(cls, purchase_shop: Shop, size: int) -> List[Shop]:
-        shops = Shop.objects.all()
-        if not apps.get_app_config("home").is_local():
-            shops = Shop.objects.exclude(shop_url=purchase_shop.shop_url).all()
-
-        available_shops = [
-            shop
-            for shop in shops
-            if shop.cross_sell_widgets.filter(
-                status=WidgetStatus.ACTIVE.value,
-            )
-        ]
-        recommended_shops = np.random.choice(
-            available_shops,
-            size=min(size, len(available_shops)),
-            replace=False,
+        excluded_shop_id = None if apps.get_app_config("home").is_local() else purchase_shop.id
+        shop_ids = EligibleShopIndex.sample(size, excluded_shop_id)
+        shops = Shop.objects.in_bulk(shop_ids)
+
+        return [shops[shop_id] for shop_id in shop_ids if shop_id in shops]
+
+    @classmethod
+    def get_recommended_products(cls, cross_sell_widgets: List[CrossSellWidget]) -> Dict[int, List[Product]]:
+        """
+        Fetch the products of every widget in a single shop scoped query.
+        Return a dictionary mapping each widget id to its products, in the widget order.
+        """
+        products_filter = reduce(
+            operator.or_,
+            [
+                Q(shop_id=cross_sell_widget.shop_id, cms_product_id__in=cross_sell_widget.cms_product_ids)
+                for cross_sell_widget in cross_sell_widgets
+            ],
+            Q(pk__in=[]),
         )
+        products = {
+            (product.shop_id, product.cms_product_id): product for product in Product.objects.filter(products_filter)
+        }
+
+        return {
+            cross_sell_widget.id: [
+                products[(cross_sell_widget.shop_id, cms_product_id)]
+                for cms_product_id in cross_sell_widget.cms_product_ids
+                if (cross_sell_widget.shop_id, cms_product_id) in products
+            ]
+            for cross_sell_widget in cross_sell_widgets
+        }
 
-        return list(recommended_shops)
+    @classmethod
+    def build_recommendation_cards(cls, cross_sell_widgets: List[CrossSellWidget]) -> Dict[int, Dict]:
+        """
+        Build the shopper independent part of the recommendations of each widget.
+        """
+        recommended_products = cls.get_recommended_products(cross_sell_widgets)
+        cards = {}
+        for cross_sell_widget in cross_sell_widgets:
+            discount = cross_sell_widget.discount
+            products = []
+            for product in recommended_products[cross_sell_widget.id]:
+                product_price = product.price if product.price is not None else ""
+                product_final_price = (
+                    discount.apply_discount(product_price) if discount and product_price else product_price
+                )
+                products.append(
+                    {
+                        "title": product.shortened_title,
+                        "price": str(product_price),
+                        "final_price": str(product_final_price),
+                        "image_url": product.image_url,
+                        "cms_product_handle": product.cms_product_handle,
+                    }
+                )
+
+            cards[cross_sell_widget.id] = {
+                "cross_sell_widget_id": cross_sell_widget.id,
+                "products": products,
+                "shop_url": str(cross_sell_widget.shop.shop_url),
+                "widget_shop_name": str(cross_sell_widget.shop.name),
+                "shop_logo_url": str(cross_sell_widget.shop.logo_url),
+                "discount": (
+                    {
+                        "code": discount.code,
+                        "value": discount.standard_value(),
+                        "value_type": discount.value_type,
+                        "status": discount.status,
+                    }
+                    if discount
+                    else {}
+                ),
+            }
+
+        return cards
 
     @classmethod
     def build_recommendations(
-        cls, purchase_shop: Shop, cross_sell_impression: CrossSellImpression, request: Request, size: int
+        cls, purchase_shop: Shop, widget_ids: List[int], request: Request, size: int
     ) -> List[Dict]:
-        recommendations = []
-        widget_url_params = build_widget_url_params(purchase_shop.shop_url, request)
-        for cross_sell_widget in cross_sell_impression.cross_sell_widgets.all():
-            recommended_shop_url = cross_sell_widget.shop.shop_url
-            recommended_products = Product.objects.filter(cms_product_id__in=cross_sell_widget.cms_product_ids).all()
-            widget_visit_shop_url = build_visit_shop_url(
-                widget_url_params,
-                recommended_shop_url,
-                request,
-                "cross-sell-widgets-rdir",
+        versions, cards = RecommendationCardCache.get_many(widget_ids)
+
+        missing_widget_ids = [widget_id for widget_id in widget_ids if widget_id not in cards]
+        if missing_widget_ids:
+            missing_cards = cls.build_recommendation_cards(
+                list(CrossSellWidget.objects.filter(id__in=missing_widget_ids).select_related("shop", "discount"))
             )
+            RecommendationCardCache.set_many(missing_cards, versions)
+            cards |= missing_cards
 
-            widget_products = []
-            discount = cross_sell_widget.discount
-            for product in recommended_products:
-                widget_visit_product_url = build_visit_product_url(
-                    widget_url_params, recommended_shop_url, request, "cross-sell-widgets-rdir", product, discount
-                )
-                product_final_price = discount.apply_discount(product.price) if discount else product.price
-
-                # widget_product = RecommendedProduct(
-                #     product.shortened_title,
-                #     str(product.price),
-                #     str(product_final_price),
-                #     widget_visit_product_url,
-                #     product.image_url,
-                # )
-                widget_product = {
-                    "title": product.shortened_title,
-                    "price": str(product.price),
-                    "final_price": str(product_final_price),
-                    "visit_url": widget_visit_product_url,
-                    "image_url": product.image_url,
-                }
-                widget_products.append(widget_product)
+        recommendations = []
+        widget_url_params = build_widget_url_params(purchase_shop.shop_url, request)
+        for widget_id in widget_ids:
+            card = cards.get(widget_id)
+            if not card:
+                continue
 
-            cross_sell_discount = (
-                # RecommendedCrossSellDiscount(
-                #     discount.code, discount.standard_value(), discount.value_type, discount.status
-                # )
+            discount_code = card["discount"].get("code")
+            widget_products = [
                 {
-                    "code": discount.code,
-                    "value": discount.standard_value(),
-                    "value_type": discount.value_type,
-                    "status": discount.status,
+                    "title": product["title"],
+                    "price": product["price"],
+                    "final_price": product["final_price"],
+                    "visit_url": build_visit_product_url(
+                        widget_url_params,
+                        card["shop_url"],
+                        request,
+                        "cross-sell-widgets-rdir",
+                        product["cms_product_handle"],
+                        discount_code,
+                    ),
+                    "image_url": product["image_url"],
                 }
-                if discount
-                else None
-            )
+                for product in card["products"]
+            ]
             recommendations.append(
-                # CrossSellRecommendation(
-                #     cross_sell_widget.id,
-                #     widget_products,
-                #     str(cross_sell_widget.shop.shop_url),
-                #     str(cross_sell_widget.shop.name),
-                #     str(cross_sell_widget.shop.logo_url),
-                #     cross_sell_discount,
-                #     widget_visit_shop_url,
-                # )
                 {
-                    "cross_sell_widget_id": cross_sell_widget.id,
+                    "cross_sell_widget_id": card["cross_sell_widget_id"],
                     "recommended_products": widget_products,
-                    "shop_url": str(cross_sell_widget.shop.shop_url),
-                    "widget_shop_name": str(cross_sell_widget.shop.name),
-                    "shop_logo_url": str(cross_sell_widget.shop.logo_url),
-                    "discount": cross_sell_discount | {},
-                    "widget_visit_shop_url": widget_visit_shop_url,
+                    "shop_url": card["shop_url"],
+                    "widget_shop_name": card["widget_shop_name"],
+                    "shop_logo_url": card["shop_logo_url"],
+                    "discount": card["discount"],
+                    "widget_visit_shop_url": build_visit_shop_url(
+                        widget_url_params,
+                        card["shop_url"],
+                        request,
+                        "cross-sell-widgets-rdir",
+                    ),
                 }
             )
         return recommendations
@@ -1,44 +1,155 @@
-from typing import Dict
+import json
+import logging
+from typing import Dict, List
 
-import numpy as np
-from django.db.models import Q, Sum
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from home.extensions.redis import redis_client
 from home.models import Product, Shop, UpsellImpression, UpsellWidget, WidgetStatus
 from home.serializers import UpsellWidgetSerializer
+from home.services.activity import ShopActivityRollup
 from home.utils import get_object_or_none
+from redis import RedisError
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__file__)
+
+UPSELL_OFFER_CACHE_TTL = 24 * 60 * 60
+
+
+class UpsellOfferCache:
+    """
+    Cache of the offer document of each upsell widget: the widget, its products and the variants
+    of the upsell product with their discounted prices.
+    Documents are rebuilt when the widget or one of its products is saved. A document built on a
+    cache miss never overwrites one written meanwhile by a rebuild.
+    """
+
+    @staticmethod
+    def offer_key(upsell_widget_id: int) -> str:
+        return f"upsell:offer:{upsell_widget_id}"
+
+    @classmethod
+    def build(cls, upsell_widget: UpsellWidget) -> Dict:
+        offer = UpsellWidgetSerializer(upsell_widget).data
+        upsell_product = get_object_or_none(
+            Product, shop_id=upsell_widget.shop_id, cms_product_id=upsell_widget.upsell_product_id
+        )
+        variants = upsell_product.variants.all().values() if upsell_product else []
+        offer["variants"] = [
+            variant | {"discounted_price": upsell_widget.apply_discount(variant["price"])} for variant in variants
+        ]
+        return json.loads(json.dumps(offer, cls=JSONEncoder))
+
+    @classmethod
+    def get(cls, upsell_widget: UpsellWidget) -> Dict:
+        """
+        Return the offer document of the widget, built and cached on a miss.
+        """
+        try:
+            cached_offer = redis_client.get(cls.offer_key(upsell_widget.id))
+            if cached_offer:
+                return json.loads(cached_offer)
+        except RedisError as e:
+            logger.error(f"Upsell offer cache: could not read offer {upsell_widget.id}: {e}")
+
+        offer = cls.build(upsell_widget)
+        cls.set(upsell_widget.id, offer, nx=True)
+        return offer
+
+    @classmethod
+    def set(cls, upsell_widget_id: int, offer: Dict, nx: bool = False) -> None:
+        try:
+            redis_client.set(cls.offer_key(upsell_widget_id), json.dumps(offer), ex=UPSELL_OFFER_CACHE_TTL, nx=nx)
+        except RedisError as e:
+            logger.error(f"Upsell offer cache: could not write offer {upsell_widget_id}: {e}")
+
+    @classmethod
+    def invalidate_widgets(cls, upsell_widget_ids: List[int]) -> None:
+        if not upsell_widget_ids:
+            return
+
+        try:
+            redis_client.delete(*[cls.offer_key(upsell_widget_id) for upsell_widget_id in upsell_widget_ids])
+        except RedisError as e:
+            logger.error(f"Upsell offer cache: could not invalidate offers {upsell_widget_ids}: {e}")
+
+    @classmethod
+    def refresh_widgets(cls, upsell_widgets: List[UpsellWidget]) -> None:
+        for upsell_widget in upsell_widgets:
+            # A widget whose upsell product is gone gets an offer without variants, as on a cache miss.
+            cls.set(upsell_widget.id, cls.build(upsell_widget))
+
+    @classmethod
+    def refresh_products(cls, shop_id: int, cms_product_ids: List[str]) -> None:
+        """
+        Rebuild the offers of the widgets of `shop_id` showing or triggered by one of `cms_product_ids`.
+        """
+        cms_product_ids = [str(cms_product_id) for cms_product_id in cms_product_ids]
+        cls.refresh_widgets(
+            UpsellWidget.objects.filter(
+                Q(upsell_product_id__in=cms_product_ids) | Q(trigger_product_ids__overlap=cms_product_ids),
+                shop_id=shop_id,
+            )
+        )
+
+    @classmethod
+    def refresh_shop(cls, shop_id: int) -> None:
+        cls.refresh_widgets(UpsellWidget.objects.filter(shop_id=shop_id))
 
 
 class UpsellService:
     @classmethod
-    def get_upsell_widget(cls, shop: Shop, purchased_products: list):
+    def get_upsell_widget(cls, shop: Shop, purchased_products: list) -> UpsellWidget | None:
+        """
+        Pick a random active upsell widget of the shop triggered by the purchased products, whose
+        upsell product is in stock, in a single query using the trigger products GIN index.
+        """
         purchased_product_ids = [str(product["product"]["id"]) for product in purchased_products]
+        upsell_product_in_stock = Product.objects.filter(
+            shop=OuterRef("shop"), cms_product_id=OuterRef("upsell_product_id"), in_stock=True
+        )
 
-        upsell_widgets = (
+        return (
             shop.upsell_widgets.filter(
-                Q(trigger_product_ids__overlap=purchased_product_ids) | Q(trigger_product_ids__len=0),
+                Q(trigger_product_ids__overlap=purchased_product_ids) | Q(trigger_product_ids=[]),
                 status=WidgetStatus.ACTIVE.value,
             )
             .exclude(upsell_product_id__in=purchased_product_ids)
-            .select_related("upsell_product")
-            .annotate(inventory_quantity=Sum("upsell_product__variants__inventory_quantity"))
-            .filter(inventory_quantity__gt=0)
+            .filter(Exists(upsell_product_in_stock))
+            .order_by("?")
+            .first()
         )
 
-        if upsell_widgets.exists():
-            return np.random.choice(list(upsell_widgets))
-
-        return None
-
     @classmethod
     def get_upsell_offer_data(cls, upsell_widget: UpsellWidget, checkout_token: str, customer_id: int) -> Dict:
-        # TODO: solve N+1 query risk
-        upsell_data = UpsellWidgetSerializer(upsell_widget).data
-        upsell_product = get_object_or_none(Product, cms_product_id=upsell_widget.upsell_product_id)
-        upsell_data["variants"] = upsell_product.variants.all().values()
-
-        upsell_impression, _ = UpsellImpression.objects.get_or_create(
-            upsell_widget=upsell_widget,
-            checkout_token=checkout_token,
-            defaults={"customer_id": customer_id},
-        )
+        """
+        Return the cached offer document of the widget and record the impression of the checkout.
+        """
+        upsell_data = UpsellOfferCache.get(upsell_widget)
+        with transaction.atomic():
+            if cls.record_upsell_impression(upsell_widget, checkout_token, customer_id):
+                ShopActivityRollup.increment({upsell_widget.shop_id: {"upsell_impressions": 1}})
 
         return upsell_data
+
+    @classmethod
+    def record_upsell_impression(cls, upsell_widget: UpsellWidget, checkout_token: str, customer_id: int) -> bool:
+        """
+        Insert the impression of the checkout unless it already exists, in a single statement.
+        Return whether it was inserted.
+        """
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {UpsellImpression._meta.db_table}
+                (upsell_widget_id, checkout_token, customer_id, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (upsell_widget_id, checkout_token) DO NOTHING
+                RETURNING id
+                """,
+                [upsell_widget.id, checkout_token, customer_id, now, now],
+            )
+            return cursor.fetchone() is not None
@@ -0,0 +1,47 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from home.models import CrossSellWidget, Discount, Shop, UpsellWidget
+from home.services.recommendations import EligibleShopIndex, RecommendationCardCache
+from home.services.upsell import UpsellOfferCache
+
+# Fields of the shop rendered in the recommendation cards of its widgets.
+SHOP_CARD_FIELDS = {"name", "shop_url", "logo_uploaded", "logo_extension"}
+
+
+# The card versions are bumped once the transaction is committed: a card rebuilt in between would
+# otherwise be cached with the new version but the previous data.
+@receiver(post_save, sender=CrossSellWidget)
+def refresh_cross_sell_widget_on_save(sender, instance, **kwargs):
+    EligibleShopIndex.refresh_shop(instance.shop_id)
+    transaction.on_commit(lambda: RecommendationCardCache.invalidate_widgets([instance.id]))
+
+
+@receiver(post_delete, sender=CrossSellWidget)
+def refresh_cross_sell_widget_on_delete(sender, instance, **kwargs):
+    EligibleShopIndex.refresh_shop(instance.shop_id)
+    transaction.on_commit(lambda: RecommendationCardCache.invalidate_widgets([instance.id]))
+
+
+@receiver(post_save, sender=Discount)
+@receiver(pre_delete, sender=Discount)
+def refresh_discount_cross_sell_widgets(sender, instance, **kwargs):
+    widget_ids = list(instance.cross_sell_widgets.values_list("id", flat=True))
+    transaction.on_commit(lambda: RecommendationCardCache.invalidate_widgets(widget_ids))
+
+
+@receiver(post_save, sender=Shop)
+def refresh_shop_cross_sell_widgets(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not SHOP_CARD_FIELDS.intersection(update_fields)):
+        return
+    transaction.on_commit(lambda: RecommendationCardCache.invalidate_shop(instance.id))
+
+
+@receiver(post_save, sender=UpsellWidget)
+def refresh_upsell_offer_on_save(sender, instance, **kwargs):
+    transaction.on_commit(lambda: UpsellOfferCache.refresh_widgets([instance]))
+
+
+@receiver(post_delete, sender=UpsellWidget)
+def invalidate_upsell_offer_on_delete(sender, instance, **kwargs):
+    UpsellOfferCache.invalidate_widgets([instance.id])
@@ -1,5 +1,8 @@
+from home.tasks.activity import *
+from home.tasks.dashboard import *
 from home.tasks.discount import *
 from home.tasks.generated_sales import *
+from home.tasks.partitions import *
 from home.tasks.product import *
 from home.tasks.shop import *
 from home.tasks.upsell import *
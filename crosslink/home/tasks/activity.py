@@ -0,0 +1,16 @@
+import logging
+
+from home.celery import app
+from home.services.activity import ShopActivityRollup
+
+logger = logging.getLogger(__file__)
+
+
+@app.task
+def flush_activity_rollups() -> None:
+    """
+    Write the rollup deltas still buffered when no event came to flush them.
+    """
+    flushed = ShopActivityRollup.flush()
+    if flushed:
+        logger.info(f"Flushed {flushed} activity rollup deltas")
@@ -0,0 +1,39 @@
+import logging
+from datetime import timedelta
+
+from celery import group
+from django.utils import timezone
+from home.celery import app
+from home.models import Shop
+from home.services.dashboard import DashboardCache
+
+logger = logging.getLogger(__file__)
+
+# Ranges, in days up to today, that the client app opens the dashboard with.
+DASHBOARD_DEFAULT_RANGES = [7, 30, 90]
+# Shops are warmed when one of their users logged in within this number of days.
+ACTIVE_SHOP_LOGIN_DAYS = 14
+
+
+@app.task
+def warm_dashboards() -> None:
+    """
+    Fan out the warming of the dashboard cache of the active shops across the workers.
+    """
+    shop_ids = list(
+        Shop.objects.filter(users__last_login__gte=timezone.now() - timedelta(days=ACTIVE_SHOP_LOGIN_DAYS))
+        .distinct()
+        .values_list("id", flat=True)
+    )
+    group(warm_shop_dashboard.s(shop_id) for shop_id in shop_ids).apply_async()
+    logger.info(f"Dashboard warming scheduled for {len(shop_ids)} shops")
+
+
+@app.task
+def warm_shop_dashboard(shop_id: int) -> None:
+    """
+    The cache is per day, so caching the longest default range serves all of them.
+    """
+    shop = Shop.objects.get(pk=shop_id)
+    today = timezone.now().date()
+    DashboardCache.get(shop, today - timedelta(days=max(DASHBOARD_DEFAULT_RANGES) - 1), today)
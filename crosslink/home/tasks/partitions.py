@@ -0,0 +1,7 @@
+from django.core.management import call_command
+from home.celery import app
+
+
+@app.task
+def create_event_partitions() -> None:
+    call_command("partition_event_tables")
@@ -1,5 +1,7 @@
 from home.celery import app
 from home.models import Product, Shop, Variant
+from home.services.recommendations import RecommendationCardCache
+from home.services.upsell import UpsellOfferCache
 from shopify_app.services import ShopifyApiService
 
 
@@ -56,3 +58,6 @@ def save_cms_products(shop_id: int) -> None:
             ).delete()
 
     Product.objects.filter(shop=shop).exclude(cms_product_id__in=saved_product_ids).delete()
+    Product.objects.filter(shop=shop).refresh_variant_summary()
+    RecommendationCardCache.invalidate_shop(shop.id)
+    UpsellOfferCache.refresh_shop(shop.id)
@@ -1,6 +1,7 @@
 import factory
 from factory.django import DjangoModelFactory
 from factory.fuzzy import FuzzyChoice
+from home.helpers.customer_helpers import customer_email_key, customer_name_key
 from home.models import Widget, WidgetImpression, WidgetStatus
 
 
@@ -17,10 +18,14 @@ class WidgetImpressionFactory(DjangoModelFactory):
     order_id = factory.Faker("pyint")
     checkout_token = factory.Faker("text", max_nb_chars=256)
     customer_id = factory.Faker("pyint")
-    customer_email = factory.Faker("email")
-    customer_first_name = factory.Faker("first_name")
-    customer_last_name = factory.Faker("last_name")
+    customer_email_key = factory.LazyAttribute(lambda o: customer_email_key(o.customer_email))
+    customer_name_key = factory.LazyAttribute(lambda o: customer_name_key(o.customer_first_name, o.customer_last_name))
     page_url = factory.Faker("url")
 
     class Meta:
         model = WidgetImpression
+
+    class Params:
+        # Only stored as the customer keys, the first name is set by the impression factories.
+        customer_email = factory.Faker("email")
+        customer_last_name = factory.Faker("last_name")
@@ -1,6 +1,7 @@
 import factory
 from factory.django import DjangoModelFactory
 from factory.fuzzy import FuzzyChoice
+from home.helpers.customer_helpers import customer_email_key, customer_name_key
 from home.models import CrossSellClick, CrossSellConversion, CrossSellImpression, CrossSellWidget, Discount, Shop
 from home.tests.factories import WidgetFactory, WidgetImpressionFactory
 
@@ -15,6 +16,7 @@ class CrossSellWidgetFactory(WidgetFactory):
 
 
 class CrossSellImpressionFactory(WidgetImpressionFactory):
+    customer_first_name = factory.Faker("first_name")
     purchase_shop_url = factory.Faker("url")
     recommended_shop_urls = factory.Faker("pylist", value_types="str")
 
@@ -29,12 +31,18 @@ class CrossSellImpressionFactory(WidgetImpressionFactory):
 
         self.cross_sell_widgets.add(*extracted)
 
+    @factory.post_generation
+    def link_recommended_shops(self, create, extracted, **kwargs):
+        if create:
+            CrossSellImpression.objects.filter(pk=self.pk).link_recommended_shops()
+
 
 class CrossSellClickFactory(DjangoModelFactory):
     purchase_shop_url = factory.Faker("url")
     rdir = factory.Faker("url")
     checkout_page_url = factory.Faker("text")
     impression = FuzzyChoice(CrossSellImpression.objects.all())
+    click_id = factory.LazyFunction(CrossSellClick.new_click_id)
 
     class Meta:
         model = CrossSellClick
@@ -45,9 +53,8 @@ class CrossSellConversionFactory(DjangoModelFactory):
     purchase_shop_url = factory.Faker("url")
     checkout_token = factory.Faker("text", max_nb_chars=256)
     customer_id = factory.Faker("pyint")
-    customer_email = factory.Faker("email")
-    customer_first_name = factory.Faker("first_name")
-    customer_last_name = factory.Faker("last_name")
+    customer_email_key = factory.LazyAttribute(lambda o: customer_email_key(o.customer_email))
+    customer_name_key = factory.LazyAttribute(lambda o: customer_name_key(o.customer_first_name, o.customer_last_name))
 
     cms_variant_ids = factory.Faker("pylist", value_types="str")
     quantities = factory.Faker("pylist", value_types="int")
@@ -57,6 +64,11 @@ class CrossSellConversionFactory(DjangoModelFactory):
         model = CrossSellConversion
         django_get_or_create = ("purchase_shop_url", "checkout_token")
 
+    class Params:
+        customer_email = factory.Faker("email")
+        customer_first_name = factory.Faker("first_name")
+        customer_last_name = factory.Faker("last_name")
+
     @factory.post_generation
     def clicks(self, create, extracted, **kwargs):
         if not create or not extracted:
@@ -32,3 +32,8 @@ class VariantFactory(DjangoModelFactory):
     class Meta:
         model = Variant
         django_get_or_create = ("cms_variant_id",)
+
+    @factory.post_generation
+    def refresh_product(self, create, extracted, **kwargs):
+        if create:
+            Product.objects.filter(pk=self.product_id).refresh_variant_summary()
@@ -24,11 +24,19 @@ class UpsellImpressionFactory(WidgetImpressionFactory):
     class Meta:
         model = UpsellImpression
 
+    class Params:
+        customer_first_name = factory.Faker("first_name")
+
 
 class UpsellConversionFactory(DjangoModelFactory):
     upsell_impression = factory.SubFactory(UpsellImpressionFactory)
     variant = factory.SubFactory(VariantFactory)
     quantity = factory.Faker("pyint")
+    sales = factory.LazyAttribute(
+        lambda conversion: UpsellConversion.line_sales(
+            conversion.upsell_impression.upsell_widget, conversion.variant.price, conversion.quantity
+        )
+    )
 
     class Meta:
         model = UpsellConversion
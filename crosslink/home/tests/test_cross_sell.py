@@ -2,7 +2,7 @@ import json
 from unittest.mock import patch
 
 from django.urls import reverse
-from home.models import CrossSellWidget, WidgetStatus
+from home.models import CrossSellClick, CrossSellWidget, WidgetStatus
 from home.tests.factories import CrossSellWidgetFactory, DiscountFactory, ProductFactory, ShopFactory
 from rest_framework import status
 from rest_framework.response import Response
@@ -124,6 +124,19 @@ class CrossSellWidgetTestCase(APITestCase):
             "User should be able to update cross_sell widget",
         )
 
+    def test_rdir_without_checkout_token(self):
+        rdir = f"https://{self.shop.shop_url}/products/{self.products[0].cms_product_handle}"
+        for _ in range(2):
+            response = self.client.get(
+                reverse("cross-sell-widgets-rdir"),
+                data={"purchase_shop_url": "purchase.myshopify.com", "checkout_token": "", "rdir": rdir},
+            )
+            self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+
+        clicks = CrossSellClick.objects.filter(rdir=rdir)
+        self.assertEqual(clicks.count(), 2, "Clicks without impression should not be folded into one row")
+        self.assertEqual(len({click.click_id for click in clicks}), 2)
+
 
 class FailedCrossSellWidgetTestCase(APITestCase):
     @classmethod
@@ -1,8 +1,13 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
 import numpy as np
+from django.test import SimpleTestCase
 from django.urls import reverse
+from home.helpers.metric_helpers import DailyMetricArrays
+from home.services.activity import ShopActivityRollup
+from home.services.dashboard import DashboardCache
+from home.tasks.dashboard import warm_shop_dashboard
 from home.tests.factories import (
     CrossSellClickFactory,
     CrossSellConversionFactory,
@@ -64,6 +69,7 @@ class DashboardTestCase(APITestCase):
                 purchase_shop_url=self.shop.shop_url,
                 size=np.random.randint(1, 5),
                 rdir=f"{self.shop.shop_url}/{np.random.choice(products[:5]).cms_product_handle}/...",
+                recommended_shop=self.shop,
                 impression=impression,
             )
             for impression in cross_sell_impressions
@@ -78,6 +84,9 @@ class DashboardTestCase(APITestCase):
             for click in cross_sell_clicks
         ]
 
+        # Factories bypass the services, the rollups are rebuilt from the raw events.
+        ShopActivityRollup.rebuild(self.shop, (datetime.today() - timedelta(days=1)).date(), datetime.today().date())
+
         yesterday = (datetime.today() - timedelta(days=1)).strftime("%Y-%m-%d")
         today = datetime.today().strftime("%Y-%m-%d")
         tomorrow = (datetime.today() + timedelta(days=1)).strftime("%Y-%m-%d")
@@ -208,8 +217,12 @@ class DashboardTestCase(APITestCase):
         self.assertEqual(response.data["daily_clicks"], compared_daily_clicks)
         self.assertEqual(response.data["daily_total_sales"], compared_daily_total_sales)
         self.assertEqual(response.data["daily_sales"], compared_daily_sales)
-        self.assertEqual(response.data["daily_ctrs"], compared_daily_ctrs)
-        self.assertEqual(response.data["daily_crs"], compared_daily_crs)
+        # Daily rates are computed on float arrays.
+        for rates, compared_rates in (("daily_ctrs", compared_daily_ctrs), ("daily_crs", compared_daily_crs)):
+            for section, compared_section_rates in compared_rates.items():
+                self.assertEqual(response.data[rates][section].keys(), compared_section_rates.keys())
+                for day, compared_rate in compared_section_rates.items():
+                    self.assertAlmostEqual(response.data[rates][section][day], float(compared_rate))
 
     def test_list_dashboard_unauthorized_user(self):
         self.client.force_authenticate(self.other_user)
@@ -224,3 +237,42 @@ class DashboardTestCase(APITestCase):
             format="json",
         )
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN, "User should not be able to list dashboard")
+
+    def test_warm_shop_dashboard(self):
+        today = datetime.today().date()
+        DashboardCache.invalidate(self.shop.id, today - timedelta(days=89), today)
+
+        warm_shop_dashboard(self.shop.id)
+
+        # The default ranges are then read from the cache.
+        with self.assertNumQueries(0):
+            DashboardCache.get(self.shop, today - timedelta(days=29), today)
+
+
+class DailyMetricArraysTestCase(SimpleTestCase):
+    def test_daily_metric_arrays(self):
+        start_date = date(2024, 2, 28)
+        daily = DailyMetricArrays(
+            start_date,
+            start_date + timedelta(days=2),
+            {
+                start_date: {"clicks": 1, "impressions": 3, "sales": Decimal("10.05")},
+                start_date + timedelta(days=2): {"clicks": 2, "impressions": 0, "sales": Decimal("0.00")},
+                # Outside of the range.
+                start_date + timedelta(days=3): {"clicks": 5, "impressions": 5, "sales": Decimal("1.00")},
+            },
+            ["clicks", "impressions", "sales"],
+            amount_metrics={"sales"},
+        )
+
+        self.assertEqual(daily.labels, ["2024-02-28", "2024-02-29", "2024-03-01"])
+        self.assertEqual(daily.total("clicks"), 3)
+        self.assertEqual(daily.total("sales"), Decimal("10.05"))
+        self.assertEqual(daily.series("clicks"), {"2024-02-28": 1, "2024-02-29": 0, "2024-03-01": 2})
+        sales = daily.series("sales")
+        self.assertEqual(sales, {"2024-02-28": Decimal("10.05"), "2024-02-29": 0, "2024-03-01": Decimal("0.00")})
+        self.assertIs(type(sales["2024-02-29"]), int)
+        rates = daily.rate_series("clicks", "impressions")
+        self.assertAlmostEqual(rates["2024-02-28"], 100 / 3)
+        self.assertEqual(rates["2024-02-29"], 0)
+        self.assertEqual(rates["2024-03-01"], 0)
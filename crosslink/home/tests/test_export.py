@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+from datetime import date, timedelta
+
+from django.urls import reverse
+from home.tests.factories import ShopFactory, UpsellImpressionFactory, UpsellWidgetFactory
+from rest_framework import status
+from rest_framework.test import APITestCase
+from users.tests.factories import UserFactory
+
+
+class EventExportTestCase(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.shop = ShopFactory.create()
+        cls.user = UserFactory.create(is_active=True, shop=cls.shop)
+        cls.upsell_impressions = UpsellImpressionFactory.create_batch(
+            size=3, upsell_widget=UpsellWidgetFactory.create(shop=cls.shop)
+        )
+        UpsellImpressionFactory.create(upsell_widget=UpsellWidgetFactory.create(shop=ShopFactory.create()))
+        cls.req_data = {
+            "shop_id": cls.shop.id,
+            "event": "upsell_impressions",
+            "start_date": str(date.today() - timedelta(days=1)),
+            "end_date": str(date.today()),
+        }
+
+    def test_export_csv(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse("exports-list"), data=self.req_data)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, "User should be able to export events")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(
+            [int(row["id"]) for row in rows],
+            sorted(upsell_impression.id for upsell_impression in self.upsell_impressions),
+            "Only the events of the shop should be exported",
+        )
+
+    def test_export_ndjson(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse("exports-list"), data=self.req_data | {"file_format": "ndjson"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, "User should be able to export events")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), len(self.upsell_impressions))
+        self.assertEqual(rows[0]["checkout_token"], self.upsell_impressions[0].checkout_token)
+
+    def test_export_unknown_event(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse("exports-list"), data=self.req_data | {"event": "shops"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_unauthorized_user(self):
+        self.client.force_authenticate(UserFactory.create(is_active=True, shop=ShopFactory.create()))
+        response = self.client.get(reverse("exports-list"), data=self.req_data)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN, "User should not export other shops events")
@@ -1,7 +1,13 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from home.helpers.customer_helpers import customer_name_key
+from home.services.conversions import CrossSellConversionService
 from home.tasks.generated_sales import generated_sales
 from home.tests.factories import (
     CrossSellClickFactory,
     CrossSellConversion,
+    CrossSellConversionFactory,
     CrossSellImpressionFactory,
     CrossSellWidgetFactory,
     DiscountFactory,
@@ -23,12 +29,14 @@ class GeneratedSalesTestCase(APITestCase):
         cls.cross_sell_widget = CrossSellWidgetFactory.create(
             shop=cls.shop, discount=cls.discount, cms_product_ids=[p.cms_product_id for p in cls.products[1:]]
         )
-        cls.impression = CrossSellImpressionFactory.create(recommended_shop_urls=[cls.shop.shop_url])
+        cls.customer = {"customer_email": "jon@example.com", "customer_first_name": "Jon", "customer_last_name": "Snow"}
+        cls.impression = CrossSellImpressionFactory.create(recommended_shop_urls=[cls.shop.shop_url], **cls.customer)
         cls.impression.cross_sell_widgets.add(cls.cross_sell_widget)
         cls.click = CrossSellClickFactory.create(
             purchase_shop_url=cls.shop.shop_url,
             impression=cls.impression,
             rdir=f"{cls.shop.shop_url}/{cls.products[1].cms_product_handle}/...",
+            recommended_shop=cls.shop,
         )
 
     def test_generated_sales_create_conversion(self):
@@ -38,9 +46,7 @@ class GeneratedSalesTestCase(APITestCase):
             self.shop.shop_url,
             self.impression.checkout_token,
             self.impression.customer_id,
-            self.impression.customer_email,
-            self.impression.customer_first_name,
-            self.impression.customer_last_name,
+            *self.customer.values(),
             [p.variants.all()[0].cms_variant_id for p in purchased_products],
             [p.cms_product_id for p in purchased_products],
             [1, 2, 3],
@@ -48,9 +54,8 @@ class GeneratedSalesTestCase(APITestCase):
         )
         conversion = CrossSellConversion.objects.last()
         self.assertEqual(conversion.purchase_shop_url, self.shop.shop_url)
-        self.assertEqual(conversion.customer_email, self.impression.customer_email)
-        self.assertEqual(conversion.customer_first_name, self.impression.customer_first_name)
-        self.assertEqual(conversion.customer_last_name, self.impression.customer_last_name)
+        self.assertEqual(conversion.customer_email_key, self.impression.customer_email_key)
+        self.assertEqual(conversion.customer_name_key, self.impression.customer_name_key)
         self.assertEqual(conversion.cms_variant_ids, purchased_variant_ids[1:3])
         self.assertEqual(conversion.quantities, [2, 3])
         self.assertEqual(conversion.sales, 555)
@@ -64,9 +69,7 @@ class GeneratedSalesTestCase(APITestCase):
             self.shop.shop_url,
             self.impression.checkout_token,
             self.impression.customer_id,
-            self.impression.customer_email,
-            self.impression.customer_first_name,
-            self.impression.customer_last_name,
+            *self.customer.values(),
             [p.variants.all()[0].cms_variant_id for p in purchased_products],
             [p.cms_product_id for p in purchased_products],
             [1],
@@ -74,3 +77,191 @@ class GeneratedSalesTestCase(APITestCase):
         )
         conversion = CrossSellConversion.objects.last()
         self.assertEqual(conversion, None)
+
+    def test_generated_sales_click_id(self):
+        impression = CrossSellImpressionFactory.create(recommended_shop_urls=[self.shop.shop_url])
+        impression.cross_sell_widgets.add(self.cross_sell_widget)
+        click = CrossSellClickFactory.create(
+            purchase_shop_url=self.shop.shop_url,
+            impression=impression,
+            rdir=f"{self.shop.shop_url}/...",
+            recommended_shop=self.shop,
+        )
+        purchased_products = self.products[1:2]
+        generated_sales(
+            self.shop.shop_url,
+            "another-checkout-token",
+            None,
+            "another@customer.com",
+            "Another",
+            "Customer",
+            [p.variants.all()[0].cms_variant_id for p in purchased_products],
+            [p.cms_product_id for p in purchased_products],
+            [1],
+            [120],
+            [click.click_id],
+        )
+        conversion = CrossSellConversion.objects.get(checkout_token="another-checkout-token")
+        self.assertEqual(list(conversion.clicks.all()), [click])
+        self.assertEqual(list(conversion.impressions.all()), [impression])
+        self.assertEqual(conversion.sales, 120)
+
+    def test_generated_sales_click_id_without_impression(self):
+        click = CrossSellClickFactory.create(
+            purchase_shop_url="shell.myshopify.com",
+            impression=None,
+            rdir=f"{self.shop.shop_url}/...",
+            recommended_shop=self.shop,
+        )
+        other_shop_click = CrossSellClickFactory.create(
+            purchase_shop_url="other-shell.myshopify.com",
+            impression=None,
+            rdir="other.myshopify.com/...",
+            recommended_shop=ShopFactory.create(),
+        )
+        purchased_products = self.products[1:2]
+        generated_sales(
+            self.shop.shop_url,
+            "shell-checkout-token",
+            None,
+            "shell@customer.com",
+            "Shell",
+            "Customer",
+            [p.variants.all()[0].cms_variant_id for p in purchased_products],
+            [p.cms_product_id for p in purchased_products],
+            [1],
+            [90],
+            [click.click_id, other_shop_click.click_id],
+        )
+        conversion = CrossSellConversion.objects.get(checkout_token="shell-checkout-token")
+        self.assertEqual(list(conversion.clicks.all()), [click])
+        self.assertEqual(list(conversion.impressions.all()), [])
+        self.assertEqual(conversion.sales, 90)
+
+    def test_generated_sales_customer_name_fallback(self):
+        impression = CrossSellImpressionFactory.create(
+            recommended_shop_urls=[self.shop.shop_url],
+            customer_email=None,
+            customer_first_name="Jane",
+            customer_last_name="Doe",
+        )
+        impression.cross_sell_widgets.add(self.cross_sell_widget)
+        purchased_products = self.products[1:2]
+        generated_sales(
+            self.shop.shop_url,
+            "name-checkout-token",
+            None,
+            "jane@doe.com",
+            " jane ",
+            "DOE",
+            [p.variants.all()[0].cms_variant_id for p in purchased_products],
+            [p.cms_product_id for p in purchased_products],
+            [1],
+            [80],
+        )
+        conversion = CrossSellConversion.objects.get(checkout_token="name-checkout-token")
+        self.assertEqual(list(conversion.impressions.all()), [impression])
+        self.assertEqual(conversion.customer_name_key, customer_name_key("Jane", "Doe"))
+
+    def test_generated_sales_customer_name_with_other_email(self):
+        impression = CrossSellImpressionFactory.create(
+            recommended_shop_urls=[self.shop.shop_url],
+            customer_email="john@work.com",
+            customer_first_name="John",
+            customer_last_name="Smith",
+        )
+        impression.cross_sell_widgets.add(self.cross_sell_widget)
+        purchased_products = self.products[1:2]
+        generated_sales(
+            self.shop.shop_url,
+            "other-email-checkout-token",
+            None,
+            "john@home.com",
+            "John",
+            "Smith",
+            [p.variants.all()[0].cms_variant_id for p in purchased_products],
+            [p.cms_product_id for p in purchased_products],
+            [1],
+            [60],
+        )
+        conversion = CrossSellConversion.objects.get(checkout_token="other-email-checkout-token")
+        self.assertEqual(list(conversion.impressions.all()), [impression])
+
+    def test_attribute_orders_batch(self):
+        clicks = CrossSellClickFactory.create_batch(
+            size=2, purchase_shop_url=self.shop.shop_url, impression=self.impression, rdir=f"{self.shop.shop_url}/..."
+        )
+        orders = [
+            {
+                "shop_url": self.shop.shop_url,
+                "checkout_token": f"batch-checkout-token-{index}",
+                "customer_id": None,
+                "customer_email": None,
+                "customer_first_name": None,
+                "customer_last_name": None,
+                "cms_variant_ids": [self.products[1].variants.all()[0].cms_variant_id],
+                "cms_product_ids": [self.products[1].cms_product_id],
+                "quantities": [1],
+                "total_prices": ["10.5"],
+                "click_ids": [click.click_id],
+            }
+            for index, click in enumerate(clicks)
+        ]
+        self.assertEqual(CrossSellConversionService.attribute_orders(orders + orders), 2)
+        self.assertEqual(CrossSellConversionService.attribute_orders(orders), 0)
+        for order, click in zip(orders, clicks):
+            conversion = CrossSellConversion.objects.get(checkout_token=order["checkout_token"])
+            self.assertEqual(list(conversion.clicks.all()), [click])
+            self.assertEqual(list(conversion.impressions.all()), [self.impression])
+            self.assertEqual(conversion.sales, 10.5)
+
+    def test_match_customers_batch(self):
+        emails = [f"batch-{index}@customer.com" for index in range(3)]
+        impressions = [
+            CrossSellImpressionFactory.create(recommended_shop_urls=[self.shop.shop_url], customer_email=email)
+            for email in emails
+        ]
+        clicks = [
+            CrossSellClickFactory.create(
+                purchase_shop_url=self.shop.shop_url,
+                impression=impression,
+                rdir=f"{self.shop.shop_url}/{self.products[1].cms_product_handle}/...",
+                recommended_shop=self.shop,
+            )
+            for impression in impressions
+        ]
+        orders = [
+            {
+                "shop_url": self.shop.shop_url,
+                "checkout_token": f"match-checkout-token-{index}",
+                "customer_email": email,
+                "customer_first_name": None,
+                "customer_last_name": None,
+                "cms_product_ids": [self.products[1].cms_product_id],
+            }
+            for index, email in enumerate(emails)
+        ]
+        # Placed before the impression of its customer.
+        orders[2]["ordered_at"] = (timezone.now() - timedelta(days=1)).isoformat()
+
+        # Impressions, products and clicks of the whole batch.
+        with self.assertNumQueries(3):
+            matches = CrossSellConversionService.match_customers(orders)
+
+        for order, impression, click in zip(orders[:2], impressions, clicks):
+            self.assertEqual(matches[(self.shop.shop_url, order["checkout_token"])], ([click.id], [impression.id]))
+        self.assertEqual(matches[(self.shop.shop_url, orders[2]["checkout_token"])], ([], []))
+
+    def test_reattribute_conversions(self):
+        conversion = CrossSellConversionFactory.create(
+            purchase_shop_url=self.shop.shop_url,
+            cms_variant_ids=[self.products[1].variants.all()[0].cms_variant_id],
+            click_ids=[self.click.click_id],
+        )
+        conversion.impressions.add(CrossSellImpressionFactory.create())
+        self.assertEqual(
+            CrossSellConversionService.reattribute(self.shop.shop_url, timezone.localdate(conversion.created_at)),
+            (1, 2),
+        )
+        self.assertEqual(list(conversion.clicks.all()), [self.click])
+        self.assertEqual(list(conversion.impressions.all()), [self.impression])
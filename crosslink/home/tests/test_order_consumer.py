@@ -0,0 +1,64 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase
+from home.kafka import order_consumer
+
+
+def order_message(offset, value):
+    msg = MagicMock()
+    msg.error.return_value = None
+    msg.topic.return_value = "shopify-orders"
+    msg.partition.return_value = 0
+    msg.offset.return_value = offset
+    msg.key.return_value = b"shop.myshopify.com"
+    msg.value.return_value = value if isinstance(value, bytes) else json.dumps(value).encode("utf-8")
+    return msg
+
+
+class OrderConsumerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.orders = [{"shop_url": "shop.myshopify.com", "checkout_token": str(token)} for token in range(3)]
+        self.messages = [order_message(offset, order) for offset, order in enumerate(self.orders, start=10)]
+
+    def attribute_orders(self, orders):
+        if any(order["checkout_token"] == "1" for order in orders):
+            raise ValueError("Invalid order")
+        return len(orders)
+
+    @patch("home.kafka.order_consumer.time.sleep")
+    @patch("home.kafka.order_consumer.send_dead_order_event")
+    @patch("home.kafka.order_consumer.CrossSellConversionService.attribute_orders")
+    def test_process_isolates_failing_orders(self, mock_attribute_orders, mock_send_dead_order_event, mock_sleep):
+        mock_attribute_orders.side_effect = self.attribute_orders
+
+        created = order_consumer.process(self.messages + [order_message(13, b"not json")])
+
+        self.assertEqual(created, 2)
+        self.assertEqual(mock_sleep.call_count, order_consumer.MAX_ATTEMPTS - 1)
+        self.assertEqual(
+            [call.args[1] for call in mock_send_dead_order_event.call_args_list],
+            [b"not json", self.messages[1].value()],
+        )
+
+    @patch("home.kafka.order_consumer.time.sleep")
+    @patch("home.kafka.order_consumer.send_dead_order_event")
+    @patch("home.kafka.order_consumer.CrossSellConversionService.attribute_orders")
+    def test_process_retries_batch(self, mock_attribute_orders, mock_send_dead_order_event, mock_sleep):
+        # The batch and each of its orders fail on the first attempt, the retried batch is attributed.
+        mock_attribute_orders.side_effect = [ValueError("Database unavailable")] * 4 + [3]
+
+        created = order_consumer.process(self.messages)
+
+        self.assertEqual(created, 3)
+        mock_sleep.assert_called_once_with(order_consumer.RETRY_BACKOFF)
+        mock_send_dead_order_event.assert_not_called()
+
+    def test_rewind(self):
+        consumer = MagicMock()
+
+        order_consumer.rewind(consumer, list(reversed(self.messages)))
+
+        consumer.seek.assert_called_once()
+        partition = consumer.seek.call_args.args[0]
+        self.assertEqual((partition.topic, partition.partition, partition.offset), ("shopify-orders", 0, 10))
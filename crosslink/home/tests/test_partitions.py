@@ -0,0 +1,105 @@
+import csv
+import gzip
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone as django_timezone
+from home.services.partitions import EventPartitionService, add_months
+from rest_framework.test import APITestCase
+from shopify_app.models import ShopifyWebhookEvent
+
+TABLE = "shopify_app_shopifywebhookevent"
+
+
+class EventPartitionServiceTestCase(APITestCase):
+    def setUp(self):
+        self.current_month = django_timezone.now().date().replace(day=1)
+        self.old_month = add_months(self.current_month, -14)
+        self.old_event = ShopifyWebhookEvent.objects.create(webhook_id="old-webhook")
+        ShopifyWebhookEvent.objects.filter(id=self.old_event.id).update(
+            received_at=datetime.combine(self.old_month.replace(day=10), datetime.min.time(), tzinfo=timezone.utc)
+        )
+        self.event = ShopifyWebhookEvent.objects.create(webhook_id="webhook")
+
+    def index_definitions(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexdef FROM pg_indexes WHERE tablename = %s", [TABLE])
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_convert(self):
+        EventPartitionService.convert(TABLE, months_ahead=2)
+
+        self.assertTrue(EventPartitionService.is_partitioned(TABLE))
+        self.assertEqual(
+            set(ShopifyWebhookEvent.objects.values_list("id", "webhook_id")),
+            {(self.old_event.id, "old-webhook"), (self.event.id, "webhook")},
+        )
+        partitions = EventPartitionService.monthly_partitions(TABLE)
+        self.assertEqual(min(partitions.values()), self.old_month)
+        self.assertEqual(max(partitions.values()), add_months(self.current_month, 2))
+        self.assertTrue(any("(webhook_id)" in definition for definition in self.index_definitions()))
+
+        # Ids keep being generated after the copied ones.
+        new_event = ShopifyWebhookEvent.objects.create(webhook_id="new-webhook")
+        self.assertGreater(new_event.id, self.event.id)
+
+    def test_convert_unique_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE UNIQUE INDEX webhook_id_uniq ON {TABLE} (webhook_id)")
+
+        with self.assertRaisesMessage(ValueError, "webhook_id_uniq"):
+            EventPartitionService.convert(TABLE, months_ahead=2)
+        self.assertFalse(EventPartitionService.is_partitioned(TABLE))
+
+    def test_partition_event_tables_command(self):
+        call_command("partition_event_tables")
+        self.assertFalse(EventPartitionService.is_partitioned(TABLE))
+
+        call_command("partition_event_tables", "--convert", "--months-ahead", "1")
+        self.assertTrue(EventPartitionService.is_partitioned(TABLE))
+        self.assertEqual(
+            max(EventPartitionService.monthly_partitions(TABLE).values()), add_months(self.current_month, 1)
+        )
+
+        # Once converted, the partitions are created ahead.
+        call_command("partition_event_tables", "--months-ahead", "3")
+        self.assertEqual(
+            max(EventPartitionService.monthly_partitions(TABLE).values()), add_months(self.current_month, 3)
+        )
+
+    def test_create_partitions(self):
+        EventPartitionService.convert(TABLE, months_ahead=0)
+
+        partitions = EventPartitionService.create_partitions(
+            TABLE, self.current_month, add_months(self.current_month, 3)
+        )
+
+        self.assertEqual(
+            partitions,
+            [
+                EventPartitionService.partition_name(TABLE, add_months(self.current_month, months))
+                for months in range(4)
+            ],
+        )
+        self.assertTrue(set(partitions) <= set(EventPartitionService.monthly_partitions(TABLE)))
+        # Creating them again is a no-op.
+        self.assertEqual(
+            EventPartitionService.create_partitions(TABLE, self.current_month, add_months(self.current_month, 3)),
+            partitions,
+        )
+
+    def test_archive_partition(self):
+        EventPartitionService.convert(TABLE, months_ahead=0)
+        partition = EventPartitionService.partition_name(TABLE, self.old_month)
+
+        with tempfile.TemporaryDirectory() as directory:
+            location = EventPartitionService.archive_partition(TABLE, partition, directory=Path(directory), drop=True)
+            with gzip.open(location, "rt") as archive:
+                rows = list(csv.DictReader(archive))
+
+        self.assertEqual([row["webhook_id"] for row in rows], ["old-webhook"])
+        self.assertNotIn(partition, EventPartitionService.monthly_partitions(TABLE))
+        self.assertEqual(list(ShopifyWebhookEvent.objects.values_list("webhook_id", flat=True)), ["webhook"])
@@ -1,11 +1,39 @@
 import json
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
 from unittest.mock import patch
 
+from django.apps import apps
 from django.urls import reverse
 from home.dataclasses import CrossSellRecommendation, RecommendedProduct
+from home.extensions.redis import redis_client
+from home.models import CrossSellImpression, CrossSellWidget, ShopDailyActivity, UpsellConversion
+from home.serializers import ProductSerializer
+from home.services.activity import (
+    ACTIVITY_DELTAS_KEY,
+    ACTIVITY_FLUSH_DUE_KEY,
+    ACTIVITY_FLUSHING_KEY,
+    ShopActivityRollup,
+)
+from home.services.conversions import UpsellConversionBuffer
 from home.services.cross_sell import CrossSellHtmlService
+from home.services.dashboard import DashboardCache
 from home.services.discount import DiscountService
-from home.tests.factories import CrossSellWidgetFactory, DiscountFactory, ProductFactory, ShopFactory
+from home.services.impressions import CrossSellImpressionBuffer
+from home.services.recommendations import EligibleShopIndex, RecommendationCardCache, RecommendationService
+from home.services.upsell import UpsellOfferCache, UpsellService
+from home.tests.factories import (
+    CrossSellWidgetFactory,
+    DiscountFactory,
+    ProductFactory,
+    ShopFactory,
+    UpsellConversionFactory,
+    UpsellImpressionFactory,
+    UpsellWidgetFactory,
+    VariantFactory,
+)
+from redis import RedisError
 from rest_framework import status
 from rest_framework.request import Request
 from rest_framework.test import APIRequestFactory, APITestCase
@@ -46,6 +74,118 @@ class CrossSellServicesTestCase(APITestCase):
             impression = CrossSellHtmlService.create_cross_sell_impression(self.shop, self.request_factory, size=2)
             self.assertEqual(impression.purchase_shop_url, self.shop.shop_url)
 
+    def test_create_cross_sell_impression_reload(self):
+        with patch("home.services.cross_sell.RecommendationService.get_recommended_shops") as mock_recommended_shop:
+            mock_recommended_shop.return_value = [self.other_shop]
+            impression = CrossSellHtmlService.create_cross_sell_impression(self.shop, self.request_factory, size=2)
+
+        with self.assertNumQueries(1):
+            reloaded_impression = CrossSellHtmlService.create_cross_sell_impression(
+                self.shop, self.request_factory, size=2
+            )
+
+        self.assertTrue(impression.created)
+        self.assertFalse(reloaded_impression.created)
+        self.assertEqual(reloaded_impression.id, impression.id)
+        self.assertEqual(reloaded_impression.cross_sell_widget_ids, [self.cross_sell_widget.id])
+
+    def test_beacon_context(self):
+        inactive_cross_sell_widget = CrossSellWidgetFactory.create(
+            shop=self.other_shop, discount=None, status="inactive"
+        )
+        unknown_cross_sell_widget = CrossSellWidgetFactory.create(shop=self.other_shop, discount=None, status="active")
+        redis_client.delete(CrossSellHtmlService.shell_key(self.shop))
+        with patch("home.services.cross_sell.CrossSellHtmlService.select_cross_sell_widgets") as mock_select:
+            mock_select.return_value = (
+                [self.other_shop.shop_url],
+                [self.cross_sell_widget.id, inactive_cross_sell_widget.id],
+            )
+            CrossSellHtmlService.shell_widget_ids(self.shop, size=2)
+
+        request = Request(
+            APIRequestFactory().get(
+                reverse("shopify:shopify_app_cross_sell_widget_beacon"),
+                data={
+                    "shop": self.shop.shop_url,
+                    "checkout_token": "beacon-checkout",
+                    "checkout_shipping_address_first_name": "John",
+                    "widget_ids": ",".join(
+                        str(widget.id)
+                        for widget in (unknown_cross_sell_widget, self.cross_sell_widget, inactive_cross_sell_widget)
+                    ),
+                },
+            )
+        )
+        context = CrossSellHtmlService.beacon_context(request)
+
+        self.assertEqual(context["widget_title"], "John, before leaving us ...")
+        self.assertEqual(context["visit_params"]["checkout_token"], "beacon-checkout")
+        impression = CrossSellImpression.objects.get(checkout_token="beacon-checkout")
+        self.assertEqual(impression.recommended_shop_urls, [self.other_shop.shop_url])
+        self.assertEqual(list(impression.cross_sell_widgets.all()), [self.cross_sell_widget])
+
+    def test_save_buffered_impressions(self):
+        values = CrossSellHtmlService.impression_values(self.shop, self.request_factory) | {
+            "recommended_shop_urls": [self.other_shop.shop_url]
+        }
+        payloads = [
+            values | {"uuid": str(uuid.uuid4()), "cross_sell_widget_ids": [self.cross_sell_widget.id]},
+            values | {"uuid": str(uuid.uuid4()), "cross_sell_widget_ids": [self.cross_sell_widget.id]},
+            values
+            | {
+                "uuid": str(uuid.uuid4()),
+                "checkout_token": "buffered-checkout",
+                "created_at": "2024-03-01T10:00:00+00:00",
+                "cross_sell_widget_ids": [self.cross_sell_widget.id],
+            },
+        ]
+        CrossSellImpressionBuffer.save_batch(payloads)
+        CrossSellImpressionBuffer.save_batch(payloads)
+
+        impressions = CrossSellImpression.objects.filter(purchase_shop_url=self.shop.shop_url)
+        self.assertEqual(impressions.count(), 2)
+        for impression in impressions:
+            self.assertEqual(list(impression.cross_sell_widgets.all()), [self.cross_sell_widget])
+        self.assertEqual(
+            impressions.get(checkout_token="buffered-checkout").created_at,
+            datetime(2024, 3, 1, 10, tzinfo=timezone.utc),
+        )
+
+    def test_drain_pending_claims_dead_consumer(self):
+        values = CrossSellHtmlService.impression_values(self.shop, self.request_factory) | {
+            "recommended_shop_urls": [self.other_shop.shop_url],
+            "cross_sell_widget_ids": [self.cross_sell_widget.id],
+        }
+        CrossSellImpressionBuffer.create_group()
+        for checkout_token in ("dead-checkout-1", "dead-checkout-2"):
+            CrossSellImpressionBuffer.add(values | {"uuid": str(uuid.uuid4()), "checkout_token": checkout_token})
+        # The first consumer reads the messages and stops before saving them.
+        self.assertEqual(len(CrossSellImpressionBuffer.read("dead", 10, ">")), 2)
+
+        self.assertEqual(CrossSellImpressionBuffer.drain_pending("alive", 10), 0)
+        self.assertEqual(CrossSellImpressionBuffer.drain_pending("alive", 10, min_idle_time=0), 2)
+
+        self.assertEqual(
+            CrossSellImpression.objects.filter(checkout_token__startswith="dead-checkout").count(),
+            2,
+        )
+        self.assertEqual(
+            redis_client.xpending(CrossSellImpressionBuffer.STREAM_KEY, CrossSellImpressionBuffer.STREAM_GROUP)[
+                "pending"
+            ],
+            0,
+        )
+
+    def test_record_impression_without_checkout_token(self):
+        request = Request(
+            APIRequestFactory().get(reverse("shopify:shopify_app_cross_sell_widget"), data={"shop": self.shop.shop_url})
+        )
+        with patch.object(apps.get_app_config("home"), "CROSS_SELL_IMPRESSION_WRITE_BEHIND", True):
+            with patch("home.services.cross_sell.CrossSellHtmlService.buffer_cross_sell_impression") as mock_buffer:
+                impression = CrossSellHtmlService.record_cross_sell_impression(self.shop, request, size=2)
+                mock_buffer.assert_not_called()
+        self.assertTrue(impression.created)
+
     def test_widget_context(self):
         with patch("home.services.cross_sell.RecommendationService.build_recommendations") as mock_build_recommendation:
             widget_products = [
@@ -74,6 +214,298 @@ class CrossSellServicesTestCase(APITestCase):
             self.assertNotEqual(context.widget_impression, None)
 
 
+class RecommendationServiceTestCase(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.shop = ShopFactory.create()
+        cls.active_shop = ShopFactory.create()
+        cls.inactive_shop = ShopFactory.create()
+        CrossSellWidgetFactory.create(shop=cls.shop, discount=None, status="active")
+        CrossSellWidgetFactory.create(shop=cls.active_shop, discount=None, status="active")
+        CrossSellWidgetFactory.create(shop=cls.inactive_shop, discount=None, status="inactive")
+
+    def setUp(self):
+        try:
+            EligibleShopIndex.rebuild()
+        except RedisError:
+            pass
+
+    def test_get_recommended_shops(self):
+        recommended_shops = RecommendationService.get_recommended_shops(self.shop, size=2)
+        self.assertEqual(recommended_shops, [self.active_shop])
+
+    def test_get_recommended_shops_after_widget_deactivation(self):
+        widget = CrossSellWidgetFactory.create(shop=self.inactive_shop, discount=None, status="active")
+        self.assertIn(self.inactive_shop, RecommendationService.get_recommended_shops(self.shop, size=2))
+
+        widget.status = "inactive"
+        widget.save()
+        self.assertNotIn(self.inactive_shop, RecommendationService.get_recommended_shops(self.shop, size=2))
+
+    def test_sample_without_eligible_shop(self):
+        CrossSellWidget.objects.update(status="inactive")
+        EligibleShopIndex.invalidate()
+        self.assertEqual(EligibleShopIndex.sample(2), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(EligibleShopIndex.sample(2), [])
+
+    def test_build_recommendations(self):
+        request = Request(
+            APIRequestFactory().get(
+                reverse("shopify:shopify_app_cross_sell_widget"),
+                data={"shop": self.shop.shop_url, "checkout_token": "2e21u2093u21"},
+            )
+        )
+        cross_sell_widgets = []
+        for shop in [self.active_shop, self.inactive_shop]:
+            products = ProductFactory.create_batch(size=5, shop=shop)
+            for product in products:
+                VariantFactory.create_batch(size=2, product=product)
+            cross_sell_widgets.append(
+                CrossSellWidgetFactory.create(
+                    shop=shop,
+                    cms_product_ids=[product.cms_product_id for product in products],
+                    discount=DiscountFactory.create(shop=shop, value_type="percentage", value=10),
+                )
+            )
+
+        RecommendationCardCache.invalidate_widgets([widget.id for widget in cross_sell_widgets])
+
+        with self.assertNumQueries(2):
+            recommendations = RecommendationService.build_recommendations(
+                self.shop, [widget.id for widget in cross_sell_widgets], request, size=2
+            )
+
+        self.assertEqual(len(recommendations), 2)
+        for recommendation in recommendations:
+            self.assertEqual(len(recommendation["recommended_products"]), 5)
+
+        cached_recommendations = RecommendationService.build_recommendations(
+            self.shop, [widget.id for widget in cross_sell_widgets], request, size=2
+        )
+        self.assertEqual(cached_recommendations, recommendations)
+
+    def test_card_invalidated_on_commit(self):
+        widget = CrossSellWidget.objects.get(shop=self.active_shop)
+        version = RecommendationCardCache.get_versions([widget.id])[widget.id]
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.active_shop.name = "Renamed shop"
+            self.active_shop.save()
+        self.assertEqual(RecommendationCardCache.get_versions([widget.id])[widget.id], version)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(RecommendationCardCache.get_versions([widget.id])[widget.id], version)
+
+        version = RecommendationCardCache.get_versions([widget.id])[widget.id]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.active_shop.save(update_fields=["access_token"])
+        self.assertEqual(RecommendationCardCache.get_versions([widget.id])[widget.id], version)
+
+
+class UpsellServiceTestCase(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.shop = ShopFactory.create()
+        cls.in_stock_product, cls.out_of_stock_product, cls.trigger_product = ProductFactory.create_batch(
+            size=3, shop=cls.shop
+        )
+        VariantFactory.create(product=cls.in_stock_product, inventory_quantity=5)
+        VariantFactory.create(product=cls.out_of_stock_product, inventory_quantity=0)
+        cls.upsell_widget = UpsellWidgetFactory.create(
+            shop=cls.shop,
+            status="active",
+            upsell_product_id=cls.in_stock_product.cms_product_id,
+            trigger_product_ids=[cls.trigger_product.cms_product_id],
+            discount_type="percentage",
+            discount_value=10,
+        )
+        UpsellWidgetFactory.create(
+            shop=cls.shop,
+            status="active",
+            upsell_product_id=cls.out_of_stock_product.cms_product_id,
+            trigger_product_ids=[cls.trigger_product.cms_product_id],
+        )
+
+    def test_get_upsell_widget(self):
+        purchased_products = [{"product": {"id": self.trigger_product.cms_product_id}}]
+        with self.assertNumQueries(1):
+            upsell_widget = UpsellService.get_upsell_widget(self.shop, purchased_products)
+        self.assertEqual(upsell_widget, self.upsell_widget)
+
+    def test_get_upsell_widget_not_triggered(self):
+        purchased_products = [{"product": {"id": self.in_stock_product.cms_product_id}}]
+        self.assertIsNone(UpsellService.get_upsell_widget(self.shop, purchased_products))
+
+    def test_upsell_product_variant_summary(self):
+        self.in_stock_product.refresh_from_db()
+        self.out_of_stock_product.refresh_from_db()
+        variant = self.in_stock_product.variants.get()
+
+        self.assertEqual(self.in_stock_product.price, variant.price)
+        self.assertEqual(self.in_stock_product.min_price, variant.price)
+        self.assertEqual(self.in_stock_product.inventory_quantity, 5)
+        self.assertTrue(self.in_stock_product.in_stock)
+        self.assertFalse(self.out_of_stock_product.in_stock)
+
+        serialized_product = ProductSerializer(self.in_stock_product).data
+        self.assertEqual(serialized_product["price"], variant.price)
+        self.assertEqual(serialized_product["inventory_quantity"], 5)
+        serialized_product = ProductSerializer(ProductFactory.create(shop=self.shop)).data
+        self.assertEqual(serialized_product["price"], "")
+        self.assertIsNone(serialized_product["inventory_quantity"])
+
+    def test_get_upsell_offer_data(self):
+        UpsellOfferCache.invalidate_widgets([self.upsell_widget.id])
+        self.upsell_widget.discount_type = "percentage"
+        self.upsell_widget.discount_value = 10
+
+        upsell_data = UpsellService.get_upsell_offer_data(self.upsell_widget, "2e21u2093u21", 2132193823)
+        variant = self.in_stock_product.variants.get()
+        self.assertEqual(upsell_data["variants"][0]["cms_variant_id"], variant.cms_variant_id)
+        self.assertEqual(
+            upsell_data["variants"][0]["discounted_price"], float(round(variant.price * Decimal("0.9"), 2))
+        )
+
+        reloaded_upsell_data = UpsellService.get_upsell_offer_data(self.upsell_widget, "2e21u2093u21", 2132193823)
+        self.assertEqual(reloaded_upsell_data, upsell_data)
+        self.assertEqual(self.upsell_widget.upsell_impressions.filter(checkout_token="2e21u2093u21").count(), 1)
+
+    def test_save_buffered_conversions(self):
+        UpsellImpressionFactory.create(upsell_widget=self.upsell_widget, checkout_token="converted-checkout")
+        variant = self.in_stock_product.variants.get()
+        payloads = [
+            {
+                "upsell_widget_id": self.upsell_widget.id,
+                "checkout_token": "converted-checkout",
+                "variant_id": variant.cms_variant_id,
+                "quantity": 2,
+            },
+            {
+                "upsell_widget_id": self.upsell_widget.id,
+                "checkout_token": "unknown-checkout",
+                "variant_id": variant.cms_variant_id,
+                "quantity": 1,
+            },
+        ]
+        # widgets, impressions, variants, converted impressions, savepoint, insert, rollup, release
+        with self.assertNumQueries(8):
+            UpsellConversionBuffer.save_batch(payloads)
+        UpsellConversionBuffer.save_batch(payloads)
+
+        conversions = UpsellConversion.objects.filter(upsell_impression__upsell_widget=self.upsell_widget)
+        self.assertEqual(conversions.count(), 1)
+        self.assertEqual(conversions.get().variant, variant)
+        self.assertEqual(conversions.get().quantity, 2)
+        self.assertEqual(conversions.get().sales, UpsellConversion.line_sales(self.upsell_widget, variant.price, 2))
+
+        daily_activity = self.shop.daily_activities.get()
+        self.assertEqual(daily_activity.upsell_clicks, 1)
+        self.assertEqual(daily_activity.upsell_total_sales, 1)
+        self.assertEqual(daily_activity.upsell_sales, conversions.get().sales)
+
+
+class ShopActivityRollupTestCase(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.shop = ShopFactory.create()
+        upsell_widget = UpsellWidgetFactory.create(shop=cls.shop, discount_type="percentage", discount_value=10)
+        variant = VariantFactory.create(product=ProductFactory.create(shop=cls.shop), price=Decimal("12.50"))
+        cls.upsell_impressions = UpsellImpressionFactory.create_batch(size=3, upsell_widget=upsell_widget)
+        cls.upsell_conversions = [
+            UpsellConversionFactory.create(upsell_impression=upsell_impression, variant=variant, quantity=2)
+            for upsell_impression in cls.upsell_impressions[:2]
+        ]
+
+    def test_rebuild(self):
+        today = date.today()
+        # One grouped query per event table and the upsert, whatever the length of the range.
+        with self.assertNumQueries(6):
+            ShopActivityRollup.rebuild(self.shop, today - timedelta(days=365), today)
+
+        self.assertEqual(self.shop.daily_activities.count(), 366)
+        daily_activity = self.shop.daily_activities.get(date=today)
+        self.assertEqual(daily_activity.upsell_impressions, len(self.upsell_impressions))
+        self.assertEqual(daily_activity.upsell_clicks, len(self.upsell_conversions))
+        self.assertEqual(
+            daily_activity.upsell_sales, sum(upsell_conversion.sales for upsell_conversion in self.upsell_conversions)
+        )
+        self.assertEqual(daily_activity.cross_sell_impressions, 0)
+
+    def test_increment_write_behind(self):
+        other_shop = ShopFactory.create()
+        redis_client.delete(ACTIVITY_DELTAS_KEY, ACTIVITY_FLUSHING_KEY, ACTIVITY_FLUSH_DUE_KEY)
+        redis_client.set(ACTIVITY_FLUSH_DUE_KEY, 1)
+        with patch.object(apps.get_app_config("home"), "ACTIVITY_ROLLUP_WRITE_BEHIND", True):
+            with self.captureOnCommitCallbacks(execute=True):
+                ShopActivityRollup.increment({self.shop.id: {"upsell_clicks": 1, "upsell_sales": Decimal("10.25")}})
+                ShopActivityRollup.increment({self.shop.id: {"upsell_clicks": 1, "upsell_sales": Decimal("4.50")}})
+                ShopActivityRollup.increment({other_shop.shop_url: {"cross_sell_clicks": 1}}, shop_field="shop_url")
+
+        self.assertFalse(ShopDailyActivity.objects.filter(shop__in=[self.shop, other_shop]).exists())
+        # One upsert per day and shop field.
+        with self.assertNumQueries(4):
+            self.assertEqual(ShopActivityRollup.flush(), 3)
+
+        daily_activity = self.shop.daily_activities.get(date=date.today())
+        self.assertEqual(daily_activity.upsell_clicks, 2)
+        self.assertEqual(daily_activity.upsell_sales, Decimal("14.75"))
+        self.assertEqual(other_shop.daily_activities.get(date=date.today()).cross_sell_clicks, 1)
+        self.assertEqual(ShopActivityRollup.flush(), 0)
+
+
+class DashboardCacheTestCase(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.shop = ShopFactory.create()
+        cls.yesterday = date.today() - timedelta(days=1)
+        ShopDailyActivity.objects.create(shop=cls.shop, date=cls.yesterday, upsell_impressions=3, upsell_sales=12.5)
+
+    def setUp(self):
+        DashboardCache.invalidate(self.shop.id, self.yesterday - timedelta(days=6), date.today())
+
+    def test_get(self):
+        with self.assertNumQueries(1):
+            daily_metrics = DashboardCache.get(self.shop, self.yesterday - timedelta(days=6), date.today())
+        with self.assertNumQueries(0):
+            cached_daily_metrics = DashboardCache.get(self.shop, self.yesterday - timedelta(days=6), date.today())
+
+        self.assertEqual(cached_daily_metrics, daily_metrics)
+        self.assertEqual(len(cached_daily_metrics), 8)
+        self.assertEqual(cached_daily_metrics[self.yesterday]["upsell_impressions"], 3)
+        self.assertEqual(cached_daily_metrics[self.yesterday]["upsell_sales"], Decimal("12.50"))
+        self.assertEqual(cached_daily_metrics[date.today()]["upsell_impressions"], 0)
+
+    def test_get_missing_days(self):
+        DashboardCache.get(self.shop, self.yesterday, self.yesterday)
+        ShopDailyActivity.objects.filter(shop=self.shop).update(upsell_impressions=5)
+
+        # The cached day is not read again, only the days missing from the cache are.
+        daily_metrics = DashboardCache.get(self.shop, self.yesterday - timedelta(days=1), self.yesterday)
+        self.assertEqual(daily_metrics[self.yesterday]["upsell_impressions"], 3)
+
+        DashboardCache.invalidate(self.shop.id, self.yesterday, self.yesterday)
+        daily_metrics = DashboardCache.get(self.shop, self.yesterday, self.yesterday)
+        self.assertEqual(daily_metrics[self.yesterday]["upsell_impressions"], 5)
+
+    def test_late_rollup_write(self):
+        DashboardCache.get(self.shop, self.yesterday, date.today())
+        self.assertGreater(redis_client.ttl(DashboardCache.past_days_key(self.shop.id)), 0)
+
+        with patch.object(apps.get_app_config("home"), "ACTIVITY_ROLLUP_WRITE_BEHIND", False):
+            with self.captureOnCommitCallbacks(execute=True):
+                ShopActivityRollup.increment({self.shop.shop_url: {"upsell_clicks": 2}}, "shop_url", self.yesterday)
+
+        daily_metrics = DashboardCache.get(self.shop, self.yesterday, date.today())
+        self.assertEqual(daily_metrics[self.yesterday]["upsell_clicks"], 2)
+        self.assertEqual(daily_metrics[self.yesterday]["upsell_impressions"], 3)
+
+
 class DiscountServiceTestCase(APITestCase):
     @classmethod
     def setUpClass(cls):
@@ -3,6 +3,7 @@ from django.urls.conf import include
 from home.views import (
     CrossSellWidgetViewSet,
     DashboardViewSet,
+    EventExportViewSet,
     ProductViewSet,
     ShopViewSet,
     UpsellWidgetViewSet,
@@ -16,6 +17,7 @@ router.register(r"upsell-widgets", UpsellWidgetViewSet, basename="upsell-widgets
 router.register(r"products", ProductViewSet, basename="products")
 router.register(r"cross-sell-widgets", CrossSellWidgetViewSet, basename="cross-sell-widgets")
 router.register(r"shops", ShopViewSet, basename="shops")
+router.register(r"exports", EventExportViewSet, basename="exports")
 
 urlpatterns = [
     path("", include(router.urls)),
@@ -1,11 +1,14 @@
-import itertools
 import logging
-from datetime import datetime, timedelta
-from decimal import Decimal
-from typing import Dict, List
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from django.db.models import Aggregate, QuerySet
+from django.db.models.functions import TruncDate
 
 logger = logging.getLogger(__file__)
 
+DailySeries = List[Tuple[date, Any]]
+
 
 def get_object_or_none(classmodel, **kwargs):
     try:
@@ -24,26 +27,20 @@ def asdict_with_properties(obj):
     }
 
 
-def group_by_day(l: List, f=lambda x: x.created_at.date()) -> Dict[str, int]:
-    """
-    Accept a list of objects that have a `created_at` field and a function that specifies how the date can be retrieved.
-    By default we use a `created_at` field.
-    Return a dictionary (str, int) that groups those object by the same date.
-    Each key is the date as string and the value is the number of elements.
-    """
-    return {str(k): len(list(g)) for k, g in itertools.groupby(l, key=f)}
-
-
-def sum_by_day(l: List, f=lambda x: x.quantity) -> Dict[str, Decimal]:
+def aggregate_by_day(queryset: QuerySet, **aggregations: Aggregate) -> Dict[str, DailySeries]:
     """
-    Accept a list of objects that have `created_at` and `quantity` fields.
-    Return a dictionary (str, int) that groups those object by the same `created_at` day.
-    Each key is the date as string and the value is the sum of quantity fields of grouped objects.
+    Group the rows of `queryset` by the day of their `created_at` field and compute the aggregations
+    in a single query.
+    Return for each aggregation the `(day, value)` tuples of the days having rows, ordered by day.
     """
-    return {
-        str(k): Decimal(sum(list(map(f, list(g))))).quantize(Decimal("0.01"))
-        for k, g in itertools.groupby(l, key=lambda x: x.created_at.date())
-    }
+    rows = list(
+        queryset.annotate(day=TruncDate("created_at"))
+        .order_by("day")
+        .values("day")
+        .annotate(**aggregations)
+        .values_list("day", *aggregations)
+    )
+    return {name: [(row[0], row[index]) for row in rows] for index, name in enumerate(aggregations, start=1)}
 
 
 def daterange(start_date: datetime, end_date: datetime):
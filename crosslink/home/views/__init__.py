@@ -1,6 +1,7 @@
 from home.views.base import *
 from home.views.cross_sell import *
 from home.views.dashboard import *
+from home.views.export import *
 from home.views.health import *
 from home.views.product import *
 from home.views.shop import *
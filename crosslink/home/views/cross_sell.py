@@ -2,9 +2,11 @@ import logging
 from typing import Any
 
 from django.http import HttpResponseRedirect
+from home.helpers.widget_helpers import add_click_id
 from home.models import CrossSellClick, CrossSellImpression, CrossSellWidget, Discount, DiscountType
 from home.permissions import CheckShopPermission
 from home.serializers import CrossSellWidgetSerializer, DiscountSerializer
+from home.services.activity import ShopActivityRollup
 from home.services.discount import DiscountService
 from home.tasks.discount import create_cms_discount, delete_cms_discount
 from home.utils import get_object_or_none
@@ -140,13 +142,32 @@ class CrossSellWidgetViewSet(BaseModelViewset):
         checkout_token = request.GET.get("checkout_token")
         impression = get_object_or_none(CrossSellImpression, checkout_token=checkout_token)
 
-        CrossSellClick.objects.get_or_create(
-            purchase_shop_url=request.GET.get("purchase_shop_url"),
-            impression=impression,
-            rdir=request.GET.get("rdir"),
-            defaults={
-                "checkout_page_url": request.GET.get("page_url"),
-            },
-        )
-
-        return HttpResponseRedirect(request.GET.get("rdir"))
+        rdir = request.GET.get("rdir")
+        recommended_shop_id, recommended_product_id = CrossSellClick.resolve_targets([rdir]).get(rdir, (None, None))
+        click_values = {
+            "checkout_page_url": request.GET.get("page_url"),
+            "recommended_shop_id": recommended_shop_id,
+            "recommended_product_id": recommended_product_id,
+            "click_id": CrossSellClick.new_click_id(),
+        }
+        if impression:
+            click, created = CrossSellClick.objects.get_or_create(
+                purchase_shop_url=request.GET.get("purchase_shop_url"),
+                impression=impression,
+                rdir=rdir,
+                defaults=click_values,
+            )
+        else:
+            # Clicks without a known impression (no checkout token, or an impression still buffered)
+            # cannot be told apart, each of them gets its own row and click id.
+            click = CrossSellClick.objects.create(
+                purchase_shop_url=request.GET.get("purchase_shop_url"), rdir=rdir, **click_values
+            )
+            created = True
+        if created and recommended_shop_id:
+            ShopActivityRollup.increment({recommended_shop_id: {"cross_sell_clicks": 1}})
+        if not click.click_id:
+            click.click_id = CrossSellClick.new_click_id()
+            click.save(update_fields=["click_id"])
+
+        return HttpResponseRedirect(add_click_id(rdir, click.click_id) if rdir else rdir)
@@ -0,0 +1,47 @@
+from django.http import StreamingHttpResponse
+from home.models import Shop
+from home.permissions import CheckShopPermission
+from home.serializers import EventExportRequestSerializer
+from home.services.export import EventExportService
+from home.utils import get_object_or_none
+from home.views import BaseModelViewset
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+EXPORT_CONTENT_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+class EventExportViewSet(BaseModelViewset):
+    permission_classes = [IsAuthenticated, CheckShopPermission(["shop_id"])]
+    authentication_classes = [JWTAuthentication]
+
+    def list(self, request: Request, *args, **kwargs) -> StreamingHttpResponse | Response:
+        shop_id = request.GET.get("shop_id", None)
+        response = self.check_shop_id(request, shop_id)
+        if response:
+            return response
+
+        serializer = EventExportRequestSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        shop = get_object_or_none(Shop, pk=shop_id)
+        if not shop:
+            return Response({"detail": "Shop not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        event = serializer.validated_data["event"]
+        file_format = serializer.validated_data["file_format"]
+        response = StreamingHttpResponse(
+            EventExportService.stream(
+                shop,
+                event,
+                serializer.validated_data["start_date"],
+                serializer.validated_data["end_date"],
+                file_format,
+            ),
+            content_type=EXPORT_CONTENT_TYPES[file_format],
+        )
+        response["Content-Disposition"] = f'attachment; filename="{event}.{file_format}"'
+        return response
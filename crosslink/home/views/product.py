@@ -44,7 +44,7 @@ class ProductViewSet(ViewSet):
 
         # Fetch DB products
         product_ids = [int(hit.meta.id) for hit in results]
-        db_products = Product.objects.filter(id__in=product_ids).select_related("shop").prefetch_related("variants")
+        db_products = Product.objects.filter(id__in=product_ids).select_related("shop")
         product_map = {p.id: p for p in db_products}
 
         # Build products list with all fields the serializer expects
@@ -63,7 +63,7 @@ class ProductViewSet(ViewSet):
                 "shop_id": product.shop.id if product else None,
                 "shop_url": product.shop.shop_url if product else "",
                 "created_at": product.created_at if product else None,
-                "price": str(product.variants.first().price) if product and product.variants.exists() else "0.00",
+                "price": str(product.price) if product and product.price is not None else "0.00",
                 "inventory_quantity": product.inventory_quantity if product else 0,
                 "image_url": product.image_url if product else "",
             }
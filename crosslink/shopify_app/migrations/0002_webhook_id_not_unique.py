@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopify_app", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="shopifywebhookevent",
+            name="webhook_id",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
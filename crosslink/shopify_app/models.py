@@ -2,7 +2,8 @@ from django.db import models
 
 
 class ShopifyWebhookEvent(models.Model):
-    webhook_id = models.CharField(max_length=255, unique=True)
+    # Not unique so that the table can be partitioned by month, deliveries are deduplicated over the retry window.
+    webhook_id = models.CharField(max_length=255, db_index=True)
     received_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -348,6 +348,10 @@ class ShopifyApiService:
                 "topic": "PRODUCTS_UPDATE",
                 "callbackUrl": f"{app_host}/api/shopify/webhook/product/update",
             },
+            {
+                "topic": "ORDERS_CREATE",
+                "callbackUrl": f"{app_host}/api/shopify/webhook/order/create",
+            },
         ]
         self._connect_shopify()
 
@@ -11,11 +11,68 @@ class ShopifyCrossSellWidgetTestCase(APITestCase):
 
     def test_cross_sell_widget_successful(self):
         with patch("shopify_app.views.cross_sell.CrossSellHtmlService.widget_context") as mock_context:
-            with patch("shopify_app.views.cross_sell.generated_sales.delay") as mock_generated_sale:
-                response = self.client.get(reverse("shopify:shopify_app_cross_sell_widget"))
-                mock_context.assert_called_once()
-                mock_generated_sale.assert_called_once()
-                self.assertEqual(
-                    response.status_code,
-                    200,
-                )
+            response = self.client.get(reverse("shopify:shopify_app_cross_sell_widget"))
+            mock_context.assert_called_once()
+            self.assertEqual(
+                response.status_code,
+                200,
+            )
+
+    def test_cross_sell_widget_jsonp_etag(self):
+        context = {
+            "widget_callback": "crosslinkWidget",
+            "environment": "test",
+            "widget_title": "John, before leaving us ...",
+            "widget_description": "We would like you to discover our partners.",
+            "recommendations": [],
+        }
+        with patch("shopify_app.views.cross_sell.CrossSellHtmlService.widget_context") as mock_context:
+            mock_context.return_value = context
+            response = self.client.get(
+                reverse("shopify:shopify_app_cross_sell_widget_jsonp"), HTTP_ACCEPT_ENCODING="gzip"
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertFalse(response["ETag"].startswith("W/"))
+
+            response = self.client.get(
+                reverse("shopify:shopify_app_cross_sell_widget_jsonp"),
+                HTTP_ACCEPT_ENCODING="gzip",
+                HTTP_IF_NONE_MATCH=response["ETag"],
+            )
+            self.assertEqual(response.status_code, 304)
+
+    def test_cross_sell_widget_jsonp_not_modified_before_context(self):
+        context = {
+            "widget_callback": "crosslinkWidget",
+            "environment": "test",
+            "widget_title": "Before leaving us ...",
+            "widget_description": "We would like you to discover our partners.",
+            "recommendations": [],
+        }
+        params = {"shop": "shop.myshopify.com", "checkout_token": "etag-checkout"}
+        with patch("shopify_app.views.cross_sell.CrossSellHtmlService.widget_context") as mock_context:
+            mock_context.return_value = context
+            response = self.client.get(reverse("shopify:shopify_app_cross_sell_widget_jsonp"), params)
+            self.assertEqual(response.status_code, 200)
+
+            response = self.client.get(
+                reverse("shopify:shopify_app_cross_sell_widget_jsonp"), params, HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+            self.assertEqual(response.status_code, 304)
+            mock_context.assert_called_once()
+
+    def test_cross_sell_widget_shell_cache_control(self):
+        with patch("shopify_app.views.cross_sell.CrossSellHtmlService.shell_context") as mock_context:
+            mock_context.return_value = {"cross_sell_widget_ids": [], "recommendations": [], "environment": "test"}
+            response = self.client.get(reverse("shopify:shopify_app_cross_sell_widget_shell"), {"shop": "shop"})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("public", response["Cache-Control"])
+            self.assertIn("s-maxage", response["Cache-Control"])
+
+    def test_cross_sell_widget_beacon_never_cached(self):
+        with patch("shopify_app.views.cross_sell.CrossSellHtmlService.beacon_context") as mock_context:
+            mock_context.return_value = {"widget_title": "Before leaving us ...", "widget_description": ""}
+            response = self.client.get(reverse("shopify:shopify_app_cross_sell_widget_beacon"))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("no-store", response["Cache-Control"])
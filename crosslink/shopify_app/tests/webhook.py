@@ -1,10 +1,14 @@
 import json
+from datetime import timedelta
 from unittest.mock import patch
 
+from confluent_kafka import KafkaException
 from django.urls import reverse
+from django.utils import timezone
 from home.tests.factories import ProductFactory, ShopFactory
 from rest_framework import status
 from rest_framework.test import APITestCase
+from shopify_app.models import ShopifyWebhookEvent
 
 
 class WebhookTestCase(APITestCase):
@@ -72,3 +76,108 @@ class WebhookTestCase(APITestCase):
             mock_verify_webhook.mock_verify_webhook()
             self.assertEqual(response.status_code, status.HTTP_200_OK)
             self.assertEqual(response.json()["message"], "Product deleted.")
+
+    def test_order_create(self):
+        req_data = {
+            "id": 820982911946154508,
+            "checkout_token": "bd5a8aa1ecd019dd3520ff791ee3a24c",
+            "created_at": "2024-03-01T10:00:00-05:00",
+            "email": "jon@example.com",
+            "landing_site": "/products/shirt?utm_campaign=crosslink&utm_content=Ab3dE_fG1hIj",
+            "customer": {"id": 115310627314723954, "first_name": "John", "last_name": "Smith"},
+            "shipping_address": {"first_name": "Jon", "last_name": "Snow"},
+            "line_items": [
+                {
+                    "variant_id": 808950810,
+                    "product_id": 632910392,
+                    "quantity": 2,
+                    "price": "199.00",
+                    "discount_allocations": [{"amount": "3.34"}],
+                },
+                {"variant_id": None, "product_id": None, "quantity": 1, "price": "5.00"},
+            ],
+        }
+        with patch("shopify_app.views.webhook.verify_webhook") as mock_verify_webhook:
+            with patch("shopify_app.views.webhook.get_object_or_none") as mock_shop:
+                with patch("shopify_app.views.webhook.send_order_event") as mock_send_order_event:
+                    mock_verify_webhook.return_value = True
+                    mock_shop.return_value = self.shop
+                    response = self.client.post(
+                        reverse("shopify:order_create"),
+                        data=req_data,
+                        format="json",
+                        HTTP_X_SHOPIFY_HMAC_SHA256="hmac",
+                    )
+                    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                    mock_send_order_event.assert_called_once_with(
+                        {
+                            "shop_url": self.shop.shop_url,
+                            "checkout_token": "bd5a8aa1ecd019dd3520ff791ee3a24c",
+                            "customer_id": 115310627314723954,
+                            "customer_email": "jon@example.com",
+                            "customer_first_name": "Jon",
+                            "customer_last_name": "Snow",
+                            "cms_variant_ids": ["808950810"],
+                            "cms_product_ids": ["632910392"],
+                            "quantities": [2],
+                            "total_prices": ["394.66"],
+                            "click_ids": ["Ab3dE_fG1hIj"],
+                            "ordered_at": "2024-03-01T10:00:00-05:00",
+                        }
+                    )
+
+    def test_order_create_not_published(self):
+        req_data = {"id": 820982911946154509, "email": "jon@example.com", "line_items": []}
+        with patch("shopify_app.views.webhook.verify_webhook") as mock_verify_webhook:
+            with patch("shopify_app.views.webhook.get_object_or_none") as mock_shop:
+                with patch("shopify_app.views.webhook.send_order_event") as mock_send_order_event:
+                    mock_verify_webhook.return_value = True
+                    mock_shop.return_value = self.shop
+                    mock_send_order_event.side_effect = KafkaException("Message not delivered")
+                    response = self.client.post(
+                        reverse("shopify:order_create"),
+                        data=req_data,
+                        format="json",
+                        HTTP_X_SHOPIFY_HMAC_SHA256="hmac",
+                        HTTP_X_SHOPIFY_WEBHOOK_ID="order-webhook",
+                    )
+                    self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+                    self.assertFalse(ShopifyWebhookEvent.objects.filter(webhook_id="order-webhook").exists())
+
+                    # The redelivered webhook is published and recorded.
+                    mock_send_order_event.side_effect = None
+                    response = self.client.post(
+                        reverse("shopify:order_create"),
+                        data=req_data,
+                        format="json",
+                        HTTP_X_SHOPIFY_HMAC_SHA256="hmac",
+                        HTTP_X_SHOPIFY_WEBHOOK_ID="order-webhook",
+                    )
+                    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                    self.assertEqual(mock_send_order_event.call_count, 2)
+                    self.assertTrue(ShopifyWebhookEvent.objects.filter(webhook_id="order-webhook").exists())
+
+    def test_order_create_duplicate(self):
+        ShopifyWebhookEvent.objects.create(webhook_id="recent-webhook")
+        old_event = ShopifyWebhookEvent.objects.create(webhook_id="old-webhook")
+        ShopifyWebhookEvent.objects.filter(id=old_event.id).update(received_at=timezone.now() - timedelta(days=3))
+        req_data = {"id": 820982911946154510, "email": "jon@example.com", "line_items": []}
+        with patch("shopify_app.views.webhook.verify_webhook") as mock_verify_webhook:
+            with patch("shopify_app.views.webhook.get_object_or_none") as mock_shop:
+                with patch("shopify_app.views.webhook.send_order_event") as mock_send_order_event:
+                    mock_verify_webhook.return_value = True
+                    mock_shop.return_value = self.shop
+                    responses = [
+                        self.client.post(
+                            reverse("shopify:order_create"),
+                            data=req_data,
+                            format="json",
+                            HTTP_X_SHOPIFY_HMAC_SHA256="hmac",
+                            HTTP_X_SHOPIFY_WEBHOOK_ID=webhook_id,
+                        )
+                        for webhook_id in ("recent-webhook", "old-webhook")
+                    ]
+                    # Only the deliveries of the retry window are duplicates.
+                    self.assertEqual(responses[0].status_code, status.HTTP_200_OK)
+                    self.assertEqual(responses[1].status_code, status.HTTP_201_CREATED)
+                    mock_send_order_event.assert_called_once()
@@ -8,6 +8,9 @@ urlpatterns = [
     path("authenticate/", views.authenticate, name="shopify_app_authenticate"),
     path("finalize/", views.finalize, name="shopify_app_finalize"),
     path("cross-sell-widget/", views.cross_sell_widget, name="shopify_app_cross_sell_widget"),
+    path("cross-sell-widget/jsonp/", views.cross_sell_widget_jsonp, name="shopify_app_cross_sell_widget_jsonp"),
+    path("cross-sell-widget/shell/", views.cross_sell_widget_shell, name="shopify_app_cross_sell_widget_shell"),
+    path("cross-sell-widget/beacon/", views.cross_sell_widget_beacon, name="shopify_app_cross_sell_widget_beacon"),
     path("upsell/offer/", views.upsell_offer, name="shopify_app_upsell_offer"),
     path(
         "upsell/sign-changeset/",
@@ -17,4 +20,5 @@ urlpatterns = [
     path("webhook/product/create", views.product_create, name="product_create"),
     path("webhook/product/update", views.product_update, name="product_update"),
     path("webhook/product/delete", views.product_delete, name="product_delete"),
+    path("webhook/order/create", views.order_create, name="order_create"),
 ]
@@ -1,8 +1,12 @@
 import logging
 
+from django.apps import apps
+from django.http import HttpResponse
+from django.utils.cache import add_never_cache_headers, patch_cache_control
+from home.helpers.response_helpers import build_compressed_response, build_not_modified_response
 from home.services.cross_sell import CrossSellHtmlService
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.request import Request
 from rest_framework.response import Response
 
@@ -11,66 +15,55 @@ logger = logging.getLogger(__file__)
 
 @api_view(("GET",))
 def cross_sell_widget(request: Request) -> Response:
-    content_type = "application/javascript"
-    shop_url = request.GET.get("shop")
-    checkout_token = request.GET.get("checkout_token")
-    customer_id = request.GET.get("checkout_customer_id")
-    customer_email = request.GET.get("checkout_customer_email")
-    customer_first_name = request.GET.get("checkout_shipping_address_first_name")
-    customer_last_name = request.GET.get("checkout_shipping_address_last_name")
-    cms_variant_ids = list(filter(lambda x: x, request.GET.get("variant_ids", "").split(",")))
-    cms_product_ids = list(filter(lambda x: x, request.GET.get("product_ids", "").split(",")))
-    quantities = list(filter(lambda x: x, request.GET.get("quantities", "").split(",")))
-    total_prices = list(filter(lambda x: x, request.GET.get("total_prices", "").split(",")))
+    context = CrossSellHtmlService.widget_context(request)
+    return Response(context, status=status.HTTP_200_OK)
 
-    # generated_sales.delay(
-    #     shop_url,
-    #     checkout_token,
-    #     customer_id,
-    #     customer_email,
-    #     customer_first_name,
-    #     customer_last_name,
-    #     cms_variant_ids,
-    #     cms_product_ids,
-    #     quantities,
-    #     total_prices,
-    # )
 
+@api_view(("GET",))
+def cross_sell_widget_jsonp(request: Request) -> HttpResponse:
+    """
+    Server rendered version of the cross sell widget, returned as a JSONP script.
+    Reloads of a checkout whose widgets did not change are answered with a 304 before any database work.
+    """
+    not_modified_response = build_not_modified_response(request, CrossSellHtmlService.rendered_widget_etag(request))
+    if not_modified_response:
+        return not_modified_response
+
+    content_type = "application/javascript"
     context = CrossSellHtmlService.widget_context(request)
-    return Response(context, status=status.HTTP_200_OK)
+    if not context:
+        return HttpResponse(b"", content_type=content_type)
 
+    return build_compressed_response(
+        request,
+        CrossSellHtmlService.render_widget(context),
+        content_type,
+        etag=CrossSellHtmlService.remember_rendered_widget(request, context),
+    )
 
-# @api_view(("GET",))
-# def cross_sell_widget(request: Request) -> HttpResponse:
-#     content_type = "application/javascript"
-#     shop_url = request.GET.get("shop")
-#     checkout_token = request.GET.get("checkout_token")
-#     customer_id = request.GET.get("checkout_customer_id")
-#     customer_email = request.GET.get("checkout_customer_email")
-#     customer_first_name = request.GET.get("checkout_shipping_address_first_name")
-#     customer_last_name = request.GET.get("checkout_shipping_address_last_name")
-#     cms_variant_ids = list(filter(lambda x: x, request.GET.get("variant_ids", "").split(",")))
-#     cms_product_ids = list(filter(lambda x: x, request.GET.get("product_ids", "").split(",")))
-#     quantities = list(filter(lambda x: x, request.GET.get("quantities", "").split(",")))
-#     total_prices = list(filter(lambda x: x, request.GET.get("total_prices", "").split(",")))
 
-#     generated_sales.delay(
-#         shop_url,
-#         checkout_token,
-#         customer_id,
-#         customer_email,
-#         customer_first_name,
-#         customer_last_name,
-#         cms_variant_ids,
-#         cms_product_ids,
-#         quantities,
-#         total_prices,
-#     )
+@api_view(("GET",))
+@authentication_classes([])
+@permission_classes([])
+def cross_sell_widget_shell(request: Request) -> Response:
+    """
+    Recommendations of a purchase shop, shared by all its checkouts and cached by the CDN.
+    """
+    context = CrossSellHtmlService.shell_context(request)
+    response = Response(context, status=status.HTTP_200_OK)
+    shell_ttl = apps.get_app_config("home").CROSS_SELL_SHELL_TTL
+    patch_cache_control(response, public=True, max_age=shell_ttl, s_maxage=shell_ttl)
+    return response
 
-#     context = CrossSellHtmlService.widget_context(request)
-#     if not context:
-#         return HttpResponse(b"", content_type=content_type)
 
-#     template = Template(CROSSSELL_WIDGET_HTML_TEMPLATE)
-#     widget_text = template.render(Context(asdict_with_properties(context)))
-#     return HttpResponse(widget_text, content_type=content_type)
+@api_view(("GET",))
+@authentication_classes([])
+@permission_classes([])
+def cross_sell_widget_beacon(request: Request) -> Response:
+    """
+    Record the impression of a widget shell for a checkout and return its greeting.
+    """
+    context = CrossSellHtmlService.beacon_context(request)
+    response = Response(context, status=status.HTTP_200_OK)
+    add_never_cache_headers(response)
+    return response
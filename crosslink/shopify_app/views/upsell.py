@@ -7,9 +7,11 @@ import jwt
 from django.apps import apps
 from django.shortcuts import get_object_or_404
 from home.models import Shop
+from home.services.conversions import UpsellConversionBuffer
 from home.services.upsell import UpsellService
 from home.tasks.upsell import save_upsell_conversion
 from home.utils import get_object_or_none
+from redis import RedisError
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.request import Request
@@ -81,11 +83,20 @@ def sign_changeset(request: Request) -> Response:
         algorithm="HS256",
     )
 
-    save_upsell_conversion.delay(
-        upsell_widget_id=data["upsell_widget_id"],
-        checkout_token=data["referenceId"],
-        variant_id=data["changes"][0]["variantId"],
-        quantity=data["changes"][0]["quantity"],
-    )
+    conversion = {
+        "upsell_widget_id": data["upsell_widget_id"],
+        "checkout_token": data["referenceId"],
+        "variant_id": data["changes"][0]["variantId"],
+        "quantity": data["changes"][0]["quantity"],
+    }
+    if not apps.get_app_config("home").UPSELL_CONVERSION_WRITE_BEHIND:
+        save_upsell_conversion.delay(**conversion)
+        return Response({"token": token})
+
+    try:
+        UpsellConversionBuffer.add(conversion)
+    except RedisError as e:
+        logger.error(f"Upsell conversion buffer unavailable, saving conversion synchronously: {e}")
+        UpsellConversionBuffer.save_batch([conversion])
 
     return Response({"token": token})
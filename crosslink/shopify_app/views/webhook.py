@@ -3,9 +3,14 @@ import hashlib
 import hmac
 import json
 import logging
+from datetime import timedelta
+from decimal import Decimal
 
+from confluent_kafka import KafkaException
 from django.apps import apps
-from home.kafka.producer import send_product_event
+from django.utils import timezone
+from home.helpers.widget_helpers import parse_click_id
+from home.kafka.producer import send_order_event, send_product_event
 from home.models import Shop
 from home.utils import get_object_or_none
 from rest_framework import status
@@ -15,6 +20,9 @@ from shopify_app.models import ShopifyWebhookEvent
 
 logger = logging.getLogger(__name__)
 
+# Shopify stops retrying a webhook delivery after 48 hours.
+WEBHOOK_RETRY_WINDOW = timedelta(days=2)
+
 
 def verify_webhook(data, hmac_header):
     secret_key = apps.get_app_config("shopify_app").SHOPIFY_API_SECRET_KEY
@@ -27,15 +35,57 @@ def verify_webhook(data, hmac_header):
     return hmac.compare_digest(computed_hmac, hmac_header.encode("utf-8"))
 
 
-def is_duplicate_webhook(request):
+def is_duplicate_webhook(request, record=True):
     webhook_id = request.headers.get("X-Shopify-Webhook-Id")
-    if webhook_id and ShopifyWebhookEvent.objects.filter(webhook_id=webhook_id).exists():
+    if (
+        webhook_id
+        and ShopifyWebhookEvent.objects.filter(
+            webhook_id=webhook_id, received_at__gte=timezone.now() - WEBHOOK_RETRY_WINDOW
+        ).exists()
+    ):
         return True
 
+    if record:
+        record_webhook(request)
+
+    return False
+
+
+def record_webhook(request):
+    webhook_id = request.headers.get("X-Shopify-Webhook-Id")
     if webhook_id:
         ShopifyWebhookEvent.objects.create(webhook_id=webhook_id)
 
-    return False
+
+def build_order_payload(shop_url: str, data: dict) -> dict:
+    """
+    Conversion payload of a Shopify order: its customer, its lines with their discounted totals,
+    the cross sell click id of its landing site and the time it was placed at.
+    """
+    customer = data.get("customer") or {}
+    shipping_address = data.get("shipping_address") or {}
+    line_items = [line_item for line_item in data.get("line_items", []) if line_item.get("variant_id")]
+    click_id = parse_click_id(data.get("landing_site"))
+    return {
+        "shop_url": shop_url,
+        "checkout_token": data.get("checkout_token") or str(data["id"]),
+        "customer_id": customer.get("id"),
+        "customer_email": data.get("email") or customer.get("email"),
+        "customer_first_name": shipping_address.get("first_name") or customer.get("first_name"),
+        "customer_last_name": shipping_address.get("last_name") or customer.get("last_name"),
+        "cms_variant_ids": [str(line_item["variant_id"]) for line_item in line_items],
+        "cms_product_ids": [str(line_item.get("product_id")) for line_item in line_items],
+        "quantities": [line_item["quantity"] for line_item in line_items],
+        "total_prices": [
+            str(
+                Decimal(line_item["price"]) * line_item["quantity"]
+                - sum(Decimal(discount["amount"]) for discount in line_item.get("discount_allocations", []))
+            )
+            for line_item in line_items
+        ],
+        "click_ids": [click_id] if click_id else [],
+        "ordered_at": data.get("created_at"),
+    }
 
 
 @api_view(["POST"])
@@ -153,3 +203,33 @@ def product_delete(request):
     )
 
     return Response(status=status.HTTP_200_OK)
+
+
+@api_view(["POST"])
+def order_create(request):
+    hmac_header = request.headers.get("X-Shopify-Hmac-Sha256")
+    if not hmac_header or not verify_webhook(request.body, hmac_header):
+        return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+    # The webhook is recorded once its order is published, an order that is not published is redelivered by Shopify.
+    if is_duplicate_webhook(request, record=False):
+        return Response(status=status.HTTP_200_OK)
+
+    data = json.loads(request.body)
+
+    shop = get_object_or_none(
+        Shop,
+        shop_url=request.headers.get("X-Shopify-Shop-Domain"),
+    )
+    if not shop:
+        return Response(status=status.HTTP_200_OK)
+
+    # Attribution is done by the order consumer, the webhook only publishes the order.
+    try:
+        send_order_event(build_order_payload(shop.shop_url, data))
+    except KafkaException as e:
+        logger.exception(f"Failed to publish order {data.get('id')} of {shop.shop_url}: {e}")
+        return Response(status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    record_webhook(request)
+
+    return Response(status=status.HTTP_201_CREATED)
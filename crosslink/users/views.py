@@ -3,6 +3,7 @@ from typing import Any
 
 from django.conf import settings
 from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import update_last_login
 from home.models import Shop
 from home.utils import get_object_or_none
 from rest_framework import status, viewsets
@@ -100,6 +101,7 @@ def obtain_token_pairs(request: Request) -> Response:
     if not user.is_active:
         return Response({"message": "User is not active."}, status=status.HTTP_404_NOT_FOUND)
 
+    update_last_login(None, user)
     refresh = RefreshToken.for_user(user)
     response = Response()
     response.data = {